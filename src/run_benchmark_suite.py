@@ -0,0 +1,44 @@
+"""
+copyright (c) 2013 Gabriel A. Weaver <gabriel.a.l.weaver@gmail.com>
+
+This file is part of XUTools, Python Distribution.
+
+This code is free software:  you can redistribute                
+it and/or modify it under the terms of the GNU General Public                   
+License as published by the Free Software Foundation, either version            
+3 of the License, or (at your option) any later version.                        
+                                                                                
+XUTools is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+                                                                                
+You should have received a copy of the GNU General Public License               
+along with this program.  If not, see http://www.gnu.org/licenses/
+"""
+import xutools.benchmark.corpus as benchmark_corpus
+import xutools.benchmark.grammar as benchmark_grammar
+import xutools.benchmark.tools as benchmark_tools
+
+corpus_benchmarks = [ benchmark_corpus.benchmark_element_footprint,\
+                          benchmark_corpus.benchmark_set_insertion,\
+                          benchmark_corpus.benchmark_parse_accumulation,\
+                          benchmark_corpus.benchmark_parse_many,\
+                          benchmark_corpus.benchmark_parse_lines,\
+                          benchmark_corpus.benchmark_parse_descendants ]
+
+grammar_benchmarks = [ benchmark_grammar.benchmark_label_lookup,\
+                           benchmark_grammar.benchmark_packrat,\
+                           benchmark_grammar.benchmark_ios_scanner,\
+                           benchmark_grammar.benchmark_line_scanner,\
+                           benchmark_grammar.benchmark_tei_scanner,\
+                           benchmark_grammar.benchmark_anchors,\
+                           benchmark_grammar.benchmark_normalize,\
+                           benchmark_grammar.benchmark_startup ]
+
+tools_benchmarks = [ benchmark_tools.benchmark_prefilter,\
+                         benchmark_tools.benchmark_batch ]
+
+allbenchmarks = corpus_benchmarks + grammar_benchmarks + tools_benchmarks
+for benchmark in allbenchmarks:
+    benchmark()
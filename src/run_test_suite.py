@@ -18,7 +18,9 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see http://www.gnu.org/licenses/
 """
 import unittest
+import xutools.test.cache as test_cache
 import xutools.test.corpus as test_corpus
+import xutools.test.grammar as test_grammar
 import xutools.test.tools as test_tools
 
 xugrepSuite = unittest.TestLoader().loadTestsFromTestCase( test_tools.TestXUGrep )
@@ -29,5 +31,14 @@ corpusSuite = unittest.TestLoader().loadTestsFromTestCase( test_corpus.TestCorpu
 corpusElementSuite = unittest.TestLoader().loadTestsFromTestCase( test_corpus.TestCorpusElement )
 corpus_suite = [ corpusElementSuite, corpusSuite ] 
 
-alltests = unittest.TestSuite( corpus_suite + tools_suite )
+parseCacheSuite = unittest.TestLoader().loadTestsFromTestCase( test_cache.TestParseCache )
+cache_suite = [ parseCacheSuite ]
+
+grammarLibrarySuite = unittest.TestLoader().loadTestsFromTestCase( test_grammar.TestGrammarLibrary )
+ciscoIOSScannerSuite = unittest.TestLoader().loadTestsFromTestCase( test_grammar.TestCiscoIOSScanner )
+builtinScannerSuite = unittest.TestLoader().loadTestsFromTestCase( test_grammar.TestBuiltinScanner )
+teiXMLScannerSuite = unittest.TestLoader().loadTestsFromTestCase( test_grammar.TestTEIXMLScanner )
+grammar_suite = [ grammarLibrarySuite, builtinScannerSuite, ciscoIOSScannerSuite, teiXMLScannerSuite ]
+
+alltests = unittest.TestSuite( corpus_suite + cache_suite + grammar_suite + tools_suite )
 unittest.TextTestRunner(verbosity=2).run(alltests)
@@ -17,7 +17,6 @@ for more details.
 You should have received a copy of the GNU General Public License               
 along with this program.  If not, see http://www.gnu.org/licenses/
 """
-import numpy
 import pprint
 import sys
 from xutools.parsers import PythonDictionaryParseTree
@@ -98,6 +97,9 @@ class EditDistance():
     #  @postcondition The edit distance between X and Y is stored in
     #   the matrix self.c
     def compute_edit_distance( self, X, Y ):
+        # numpy is slow to import, and only edit distances need it, so
+        #  we import it on first use rather than with xutools.tools
+        import numpy
         m = len(X)
         n = len(Y)
 
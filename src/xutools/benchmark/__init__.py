@@ -0,0 +1,153 @@
+"""
+copyright (c) 2013 Gabriel A. Weaver <gabriel.a.l.weaver@gmail.com>
+
+This file is part of XUTools, Python Distribution.
+
+This code is free software:  you can redistribute
+it and/or modify it under the terms of the GNU General Public
+License as published by the Free Software Foundation, either version
+3 of the License, or (at your option) any later version.
+
+XUTools is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see http://www.gnu.org/licenses/
+"""
+import gc
+import sys
+import time
+import types
+
+## @package xutools.benchmark
+#    This package contains benchmarks for our XUTools.  Each subpackage
+#    mirrors a package under xutools.test; this module holds the helpers
+#    that they share (timers, memory accounting, synthetic inputs and
+#    table output).
+
+## Types that belong to the program rather than to the data we measure
+_UNCOUNTED_TYPES = ( type, types.ClassType, types.ModuleType,\
+                         types.FunctionType, types.BuiltinFunctionType )
+
+## Approximate the memory held by a collection of objects.  Every object
+#   reachable from the given objects is counted once, so objects that
+#   the collection shares (interned strings, a common buffer) are only
+#   paid for once.
+#
+#  @param[in] objects The objects to measure
+#  @param[in] exclude Objects whose memory should not be counted
+#  @return the total size in bytes
+def deep_sizeof(objects, exclude=()):
+    seen = set( id(obj) for obj in exclude )
+    pending = list(objects)
+    total = 0
+    while len(pending) > 0:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance( obj, _UNCOUNTED_TYPES ):
+            continue
+        seen.add( id(obj) )
+        total = total + sys.getsizeof( obj )
+        pending.extend( gc.get_referents( obj ) )
+    return total
+
+## Time a function call
+#
+#  @param[in] fn The function to call
+#  @return a pair of the elapsed wall-clock seconds and the result of fn
+def time_call(fn, *args, **kwargs):
+    start = time.time()
+    result = fn( *args, **kwargs )
+    return time.time() - start, result
+
+## Print rows as a table with aligned columns
+#
+#  @param[in] title The name of the benchmark
+#  @param[in] headers The column names
+#  @param[in] rows A list of rows, each a list of values
+#  @param[in] out The stream on which to write
+def print_table(title, headers, rows, out=sys.stdout):
+    rows = [ [ str(value) for value in row ] for row in rows ]
+    widths = [ len(header) for header in headers ]
+    for row in rows:
+        widths = [ max( width, len(value) ) for width, value in zip( widths, row ) ]
+    out.write( "\n" + title + "\n" )
+    out.write( "  ".join( header.rjust(width) for header, width in zip( headers, widths ) ) + "\n" )
+    for row in rows:
+        out.write( "  ".join( value.rjust(width) for value, width in zip( row, widths ) ) + "\n" )
+
+## Generate a synthetic Cisco IOS configuration
+#
+#  @param[in] num_interfaces The number of interface blocks
+#  @param[in] lines_per_interface The number of indented lines per block
+#  @param[in] seed Varies the addresses so that files differ
+#  @return the configuration text
+def generate_ios_config(num_interfaces, lines_per_interface=6, seed=0):
+    lines = [ "hostname router" + str(seed), "!" ]
+    for i in range(0, num_interfaces):
+        lines.append( "interface GigabitEthernet" + str(i / 48) + "/" + str(i % 48) )
+        lines.append( " description uplink " + str(i) )
+        lines.append( " ip address 10." + str(seed % 256) + "." + str(i % 256) + ".1 255.255.255.0" )
+        for j in range(2, lines_per_interface):
+            lines.append( " ip access-group acl" + str(j) + " in" )
+        lines.append( "!" )
+    lines.append( "end" )
+    return "\n".join(lines) + "\n"
+
+## Generate a synthetic TEI document of nested sections
+#
+#  @param[in] num_sections The number of sections
+#  @param[in] num_subsections The number of subsections per section
+#  @param[in] num_subsubsections The number of subsubsections per subsection
+#  @param[in] num_paragraphs The number of paragraphs at each level
+#  @return the document text
+def generate_tei_document(num_sections, num_subsections=4, num_subsubsections=4, num_paragraphs=2):
+    ns = 'xmlns:tei="http://www.tei-c.org/ns/1.0"'
+    def paragraphs(indent, ana):
+        return [ indent + '<tei:p ' + ns + ' n="p' + str(k) + '" ana="' + ana + '">Paragraph ' + str(k) +\
+                     ' of the ' + ana + ', about the Globus toolkit.</tei:p>' for k in range(1, num_paragraphs + 1) ]
+    def head(indent, ana, title):
+        return indent + '<tei:head ' + ns + ' n="title" ana="' + ana + '">' + title + '</tei:head>'
+
+    lines = [ '<?xml version="1.0" encoding="UTF-8"?>', '<TEI xmlns="http://www.tei-c.org/ns/1.0">', '<text>', '<body>' ]
+    for i in range(1, num_sections + 1):
+        lines.append( '  <div n="' + str(i) + '" type="section">' )
+        lines.append( head( '    ', 'section', str(i) + ' SECTION' ) )
+        lines.extend( paragraphs( '    ', 'section' ) )
+        for j in range(1, num_subsections + 1):
+            lines.append( '    <div n="' + str(j) + '" type="subsection">' )
+            lines.append( head( '      ', 'subsection', str(i) + '.' + str(j) + ' Subsection' ) )
+            lines.extend( paragraphs( '      ', 'subsection' ) )
+            for k in range(1, num_subsubsections + 1):
+                lines.append( '      <div n="' + str(k) + '" type="subsubsection">' )
+                lines.append( head( '        ', 'subsubsection', str(i) + '.' + str(j) + '.' + str(k) + ' Subsubsection' ) )
+                lines.extend( paragraphs( '        ', 'subsubsection' ) )
+                lines.append( '      </div>' )
+            lines.append( '    </div>' )
+        lines.append( '  </div>' )
+    lines.extend( [ '</body>', '</text>', '</TEI>' ] )
+    return "\n".join(lines) + "\n"
+
+## Write texts to files in a fresh temporary directory
+#
+#  @param[in] texts The file contents, one per file
+#  @param[in] suffix The file name suffix
+#  @return the temporary directory and the list of file paths
+def write_temp_files(texts, suffix=".example"):
+    import os
+    import tempfile
+    directory = tempfile.mkdtemp( prefix="xutools-benchmark-" )
+    file_paths = []
+    for idx, text in enumerate(texts):
+        file_path = os.path.join( directory, "file" + str(idx) + suffix )
+        fp = open( file_path, 'w' )
+        fp.write( text )
+        fp.close()
+        file_paths.append( file_path )
+    return directory, file_paths
+
+## Remove a directory created by write_temp_files
+def remove_temp_files(directory):
+    import shutil
+    shutil.rmtree( directory, ignore_errors=True )
@@ -0,0 +1,263 @@
+"""
+copyright (c) 2013 Gabriel A. Weaver <gabriel.a.l.weaver@gmail.com>
+
+This file is part of XUTools, Python Distribution.
+
+This code is free software:  you can redistribute
+it and/or modify it under the terms of the GNU General Public
+License as published by the Free Software Foundation, either version
+3 of the License, or (at your option) any later version.
+
+XUTools is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see http://www.gnu.org/licenses/
+"""
+from xutools.benchmark import deep_sizeof, generate_ios_config, generate_tei_document, print_table,\
+    remove_temp_files, time_call, write_temp_files
+from xutools.corpus import Corpus, CorpusElement
+from xutools.grammar import GrammarLibrary
+from xutools.grammar.pyparsing.BuiltinGrammar import BuiltinGrammar
+from xutools.grammar.pyparsing.CiscoIOSGrammar import CiscoIOSGrammar
+from xutools.grammar.pyparsing.TEIXMLGrammar import TEIXMLGrammar
+
+## @package xutools.benchmark.corpus
+#    This module contains benchmarks for our XUTools Corpus
+
+ELEMENT_EQUALITY_FIELDS = [ CorpusElement.LABEL_PATH, CorpusElement.LANGUAGE_NAME_PATH, CorpusElement.TEXT ]
+
+## The layout of a corpus element before elements had __slots__: every
+#   instance had its own __dict__, its own GrammarLibrary, list-valued
+#   paths and its own copy of its text.
+class DictCorpusElement():
+
+    def __init__(self, element):
+        self.idx_path = list(element.idx_path)
+        self.label_path = [ (" " + label)[1:] for label in element.label_path ]
+        self.language_name_path = [ (" " + name)[1:] for name in element.language_name_path ]
+        self.file_path = element.file_path
+        self.text = element.get_text()
+        self.text_ranges = [ list(text_range) for text_range in element.text_ranges ]
+        self.grammar_library = GrammarLibrary()
+        self.element_equality_fields = element.element_equality_fields
+        self.path_field_equality_components = None
+        self.path_field_equality_components_is_whitelist = None
+
+## Measure the per-element memory footprint of the lines of every
+#   interface in a synthetic configuration, for the old and new
+#   element layouts.
+#
+#  @param[in] num_interfaces The number of interfaces in the configuration
+#  @return the table rows
+def benchmark_element_footprint(num_interfaces=2000):
+    directory, file_paths = write_temp_files( [ generate_ios_config( num_interfaces ) ] )
+    try:
+        corpus = Corpus.create_from_files( file_paths, ELEMENT_EQUALITY_FIELDS )
+        lines = corpus.parse( CiscoIOSGrammar.INTERFACE ).parse( BuiltinGrammar.LINE ).list()
+        # The file buffer is shared by every element, so it is not charged to them
+        shared = [ ELEMENT_EQUALITY_FIELDS, lines[0].text_buffer ]
+
+        old_lines = [ DictCorpusElement( line ) for line in lines ]
+        old_size = deep_sizeof( old_lines, shared )
+        new_size = deep_sizeof( lines, shared )
+    finally:
+        remove_temp_files( directory )
+
+    rows = [ [ "dict + GrammarLibrary", len(old_lines), old_size, old_size / len(old_lines) ],
+             [ "__slots__, shared buffer", len(lines), new_size, new_size / len(lines) ] ]
+    print_table( "CorpusElement footprint (builtin:line under ios:interface)",\
+                     [ "layout", "elements", "bytes", "bytes/element" ], rows )
+    return rows
+
+## The hash and equality of a corpus element before equality keys were
+#   cached: every call rebuilt the field values, and the hash was the
+#   (order-insensitive) sum of the hashes of their string forms.
+class SummedHashCorpusElement(CorpusElement):
+    __slots__ = ()
+
+    def __hash__(self):
+        values = [ str( self.get_field(field) ) for field in self.element_equality_fields ]
+        return sum( map( lambda x: x.__hash__(), values ) )
+
+    def __eq__(self, other):
+        for field in self.element_equality_fields:
+            if self.get_field(field) != other.get_field(field):
+                return False
+        return True
+
+## Create synthetic line elements whose paths share most components,
+#   as the lines of many interfaces across many files do.
+def create_line_elements(num_elements, element_class=CorpusElement):
+    language_name_path = ( BuiltinGrammar.FILE, CiscoIOSGrammar.INTERFACE, BuiltinGrammar.LINE )
+    idx_path = ( "", None, None )
+    elements = []
+    for i in range(0, num_elements):
+        element = element_class()
+        element.idx_path = idx_path
+        element.label_path = ( "router" + str(i / 4000) + ".example",\
+                                   "GigabitEthernet" + str((i / 8) % 500), str(i % 8) )
+        element.language_name_path = language_name_path
+        element.text = " ip address 10.0." + str(i % 8) + ".1 255.255.255.0"
+        element.element_equality_fields = ELEMENT_EQUALITY_FIELDS
+        elements.append( element )
+    return elements
+
+## Time the insertion of synthetic elements into a set.  With cached,
+#   well-distributed equality keys the time per element stays flat as
+#   the set grows.
+#
+#  @param[in] sizes The numbers of elements to insert
+#  @return the table rows
+def benchmark_set_insertion(sizes=(10000, 100000, 1000000)):
+    rows = []
+    for element_class, name in [ ( SummedHashCorpusElement, "summed str hashes" ),\
+                                     ( CorpusElement, "cached equality key" ) ]:
+        for num_elements in sizes:
+            elements = create_line_elements( num_elements, element_class )
+            elapsed, element_set = time_call( set, elements )
+            # Corpus operations hash the same elements again and again
+            reinsert_elapsed, element_set = time_call( set, elements )
+            distinct_hashes = len( set( hash(element) for element in elements ) )
+            rows.append( [ name, num_elements, len(element_set), distinct_hashes,\
+                               "%.3f" % elapsed, "%.2f" % ( 1e6 * elapsed / num_elements ),\
+                               "%.2f" % ( 1e6 * reinsert_elapsed / num_elements ) ] )
+            del elements, element_set
+    print_table( "Set insertion of CorpusElements",\
+                     [ "hash", "elements", "distinct", "distinct hashes", "seconds",\
+                           "usec/element", "usec/element (again)" ], rows )
+    return rows
+
+## Corpus.parse as it was before results were accumulated in place:
+#   every source element rebuilt the result set with a union.
+def parse_by_union(corpus, language_name):
+    new_corpus = Corpus()
+    for element in list(corpus.corpus_elements):
+        new_elements = element.parse( language_name )
+        new_corpus.corpus_elements = new_corpus.corpus_elements.union(new_elements)
+    return new_corpus
+
+## Time Corpus.parse over many small synthetic files.  The in-place
+#   accumulation should scale linearly with the number of files, the
+#   union-based one quadratically.
+#
+#  @param[in] sizes The numbers of files to parse
+#  @param[in] max_union_size The largest number of files on which to
+#    run the (slow) union-based parse
+#  @return the table rows
+def benchmark_parse_accumulation(sizes=(10000, 50000, 100000), max_union_size=10000):
+    rows = []
+    for num_files in sizes:
+        texts = [ "hostname router" + str(i) + "\n" for i in range(0, num_files) ]
+        directory, file_paths = write_temp_files( texts )
+        try:
+            corpus = Corpus.create_from_files( file_paths, ELEMENT_EQUALITY_FIELDS, lazy_load=True )
+            methods = [ ( "in place", Corpus.parse ) ]
+            if num_files <= max_union_size:
+                methods.insert( 0, ( "union", parse_by_union ) )
+            for name, method in methods:
+                elapsed, lines = time_call( method, corpus, BuiltinGrammar.LINE )
+                rows.append( [ name, num_files, len(lines), "%.3f" % elapsed,\
+                                   "%.2f" % ( 1e6 * elapsed / num_files ) ] )
+        finally:
+            remove_temp_files( directory )
+    print_table( "Corpus.parse accumulation over synthetic files",\
+                     [ "accumulation", "files", "results", "seconds", "usec/file" ], rows )
+    return rows
+
+## Time the extraction of several IOS productions from the same files,
+#   one Corpus.parse per language name against a single Corpus.parse_many
+#
+#  @param[in] num_files The number of synthetic configurations
+#  @param[in] num_interfaces The number of interfaces in each configuration
+#  @return the table rows
+def benchmark_parse_many(num_files=100, num_interfaces=500):
+    language_names = [ CiscoIOSGrammar.INTERFACE, CiscoIOSGrammar.CRYPTO,\
+                           CiscoIOSGrammar.VLAN, CiscoIOSGrammar.ROUTER ]
+    blocks = "crypto map azalea 1\n match address acl1\n!\nvlan 10\n name users\n!\nrouter bgp 1\n neighbor 10.0.0.2\n!\n"
+    texts = [ generate_ios_config( num_interfaces, seed=i ).replace( "end\n", blocks + "end\n" )\
+                  for i in range(0, num_files) ]
+    directory, file_paths = write_temp_files( texts )
+    rows = []
+    try:
+        def parse_each(corpus):
+            return dict( [ ( language_name, corpus.parse( language_name ) ) for language_name in language_names ] )
+        for name, method in [ ( "parse per language", parse_each ),\
+                                  ( "parse_many", lambda corpus: corpus.parse_many( language_names ) ) ]:
+            corpus = Corpus.create_from_files( file_paths, ELEMENT_EQUALITY_FIELDS, lazy_load=True )
+            elapsed, new_corpora = time_call( method, corpus )
+            rows.append( [ name, num_files, sum( [ len(new_corpus) for new_corpus in new_corpora.values() ] ),\
+                               "%.3f" % elapsed ] )
+    finally:
+        remove_temp_files( directory )
+    print_table( "Extracting " + ", ".join( language_names ) + " from synthetic configurations",\
+                     [ "method", "files", "results", "seconds" ], rows )
+    return rows
+
+## Time the builtin:line step of /ios:interface/builtin:line, scanning
+#   the text of each interface against looking its lines up in the line
+#   index of its file.  The step also creates (and hashes) an element
+#   per line, so we time the scans on their own as well.
+#
+#  @param[in] num_files The number of synthetic configurations
+#  @param[in] num_interfaces The number of interfaces in each configuration
+#  @return the table rows
+def benchmark_parse_lines(num_files=3, num_interfaces=20000):
+    texts = [ generate_ios_config( num_interfaces, seed=i ) for i in range(0, num_files) ]
+    directory, file_paths = write_temp_files( texts )
+    rows = []
+    try:
+        for lazy_load in [ False, True ]:
+            corpus = Corpus.create_from_files( file_paths, ELEMENT_EQUALITY_FIELDS, lazy_load=lazy_load )
+            interfaces = corpus.parse( CiscoIOSGrammar.INTERFACE )
+            elements = interfaces.list()
+            scan_elapsed, matches = time_call( lambda: [ element.scan( BuiltinGrammar.LINE ) for element in elements ] )
+            del matches
+            parse_elapsed, lines = time_call( interfaces.parse, BuiltinGrammar.LINE )
+            rows.append( [ "parse", lazy_load, len(interfaces), len(lines), "%.3f" % scan_elapsed, "%.3f" % parse_elapsed ] )
+            del lines
+
+            line_indexes = {}
+            scan_elapsed, matches = time_call( lambda: [ element.scan_lines( line_indexes ) for element in elements ] )
+            del matches
+            parse_elapsed, lines = time_call( interfaces.parse_lines )
+            rows.append( [ "parse_lines", lazy_load, len(interfaces), len(lines), "%.3f" % scan_elapsed, "%.3f" % parse_elapsed ] )
+            del lines
+    finally:
+        remove_temp_files( directory )
+    print_table( "builtin:line after ios:interface",\
+                     [ "method", "lazy", "interfaces", "lines", "scan seconds", "step seconds" ], rows )
+    return rows
+
+## Time tei:paragraph within sections, within subsections, and within
+#   the sections, subsections, and subsubsections at once (the contexts
+#   of //tei:paragraph after steps at every depth), parsed after /,
+#   which scans the text of every context again, and after //, which
+#   scans the document once.
+#
+#  @param[in] num_sections The number of sections in the TEI document
+#  @return the table rows
+def benchmark_parse_descendants(num_sections=200):
+    directory, file_paths = write_temp_files( [ generate_tei_document( num_sections ) ] )
+    rows = []
+    try:
+        corpus = Corpus.create_from_files( file_paths, ELEMENT_EQUALITY_FIELDS )
+        sections = corpus.parse( TEIXMLGrammar.SECTION )
+        subsections = sections.parse( TEIXMLGrammar.SUBSECTION )
+        nested = Corpus()
+        nested.corpus_elements = sections.corpus_elements | subsections.corpus_elements |\
+            subsections.parse( TEIXMLGrammar.SUBSUBSECTION ).corpus_elements
+        for context_name, context_corpus in [ ( "sections", sections ), ( "subsections", subsections ),\
+                                                  ( "all divisions", nested ) ]:
+            for name, method in [ ( "parse", context_corpus.parse ),\
+                                      ( "parse_descendants", context_corpus.parse_descendants ) ]:
+                elapsed, results = time_call( method, TEIXMLGrammar.PARAGRAPH )
+                rows.append( [ name, context_name, len(context_corpus), len(results), "%.3f" % elapsed ] )
+                del results
+    finally:
+        remove_temp_files( directory )
+    print_table( "tei:paragraph within the divisions of a TEI document",\
+                     [ "method", "contexts", "elements", "results", "seconds" ], rows )
+    return rows
@@ -0,0 +1,310 @@
+"""
+copyright (c) 2013 Gabriel A. Weaver <gabriel.a.l.weaver@gmail.com>
+
+This file is part of XUTools, Python Distribution.
+
+This code is free software:  you can redistribute
+it and/or modify it under the terms of the GNU General Public
+License as published by the Free Software Foundation, either version
+3 of the License, or (at your option) any later version.
+
+XUTools is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see http://www.gnu.org/licenses/
+"""
+import os
+from pyparsing import ParserElement
+import resource
+import subprocess
+import sys
+import xutools
+from xutools.benchmark import deep_sizeof, generate_ios_config, generate_tei_document,\
+    print_table, time_call
+from xutools.corpus import scan_text
+from xutools.grammar import GrammarLibrary, LanguageRecord
+from xutools.grammar.native.BuiltinScanner import BuiltinScanner, get_numpy
+from xutools.grammar.native.CiscoIOSScanner import CiscoIOSScanner
+from xutools.grammar.native.TEIXMLScanner import TEIXMLScanner
+from xutools.grammar.pyparsing.BuiltinGrammar import BuiltinGrammar
+from xutools.grammar.pyparsing.CiscoIOSGrammar import CiscoIOSGrammar
+from xutools.grammar.pyparsing.TEIXMLGrammar import TEIXMLGrammar
+
+## @package xutools.benchmark.grammar
+#    This module contains benchmarks for our XUTools GrammarLibrary
+
+## The grammar library before it was a registry: every call resolved
+#   the language name and created a new grammar instance.
+class UnmemoizedGrammarLibrary(GrammarLibrary):
+
+    def get_grammar_instance(self, language_name):
+        grammar_name = self.get_grammar_name( language_name )
+        if ( self.BUILTIN_GRAMMAR_NAME == grammar_name ):
+            return BuiltinGrammar()
+        elif ( self.CISCOIOS_GRAMMAR_NAME == grammar_name ):
+            return CiscoIOSGrammar()
+        elif ( self.TEIXML_GRAMMAR_NAME == grammar_name ):
+            return TEIXMLGrammar()
+        raise NotImplementedError("Coming soon...")
+
+## Label every match as scan_text did before the registry
+def label_unmemoized(grammar_library, language_name, matches):
+    labels = []
+    for match_idx, match in enumerate( matches ):
+        grammar_instance = grammar_library.get_grammar_instance( language_name )
+        labels.append( grammar_instance.get_label_for_match( language_name, match, match_idx ) )
+    return labels
+
+## Label every match with a language record resolved once
+def label_memoized(grammar_library, language_name, matches):
+    language_record = grammar_library.get_language_record( language_name )
+    labels = []
+    for match_idx, match in enumerate( matches ):
+        labels.append( language_record.get_label( match, match_idx ) )
+    return labels
+
+## Time the per-match cost of resolving the grammar and labelling a
+#   match, apart from the cost of the grammar itself, for the lines and
+#   interfaces of a synthetic configuration.
+#
+#  @param[in] num_interfaces The number of interfaces in the configuration
+#  @return the table rows
+def benchmark_label_lookup(num_interfaces=5000):
+    text = generate_ios_config( num_interfaces )
+    rows = []
+    for language_name in [ BuiltinGrammar.LINE, CiscoIOSGrammar.INTERFACE ]:
+        production = GrammarLibrary().get_grammar( language_name )
+        matches = [ match for match, s, e in production.scanString( text ) ]
+        scan_elapsed, results = time_call( scan_text, text, language_name )
+        for name, grammar_library, label in [ ( "new instance per match", UnmemoizedGrammarLibrary(), label_unmemoized ),\
+                                                  ( "language record", GrammarLibrary(), label_memoized ) ]:
+            elapsed, labels = time_call( label, grammar_library, language_name, matches )
+            rows.append( [ language_name, name, len(matches), "%.3f" % elapsed,\
+                               "%.2f" % ( 1e6 * elapsed / len(matches) ),\
+                               "%.2f" % ( 1e6 * scan_elapsed / len(matches) ) ] )
+    print_table( "Grammar resolution and labelling per match",\
+                     [ "language", "lookup", "matches", "seconds", "usec/match", "usec/match (scan_text)" ], rows )
+    return rows
+
+## Scan a text for a language, returning the number of matches, the 
+#   time that the scan took, and the size of the packrat cache just
+#   before scan_text would clear it.
+def scan_packrat(text, language_name):
+    production = GrammarLibrary().get_grammar( language_name )
+    elapsed, matches = time_call( list, production.scanString( text ) )
+    packrat_cache = ParserElement._exprArgCache
+    # The text and the productions are not charged to the cache
+    exclude = [ text ] + list( set( key[0] for key in packrat_cache ) )
+    entries = len( packrat_cache )
+    cache_size = deep_sizeof( [ packrat_cache ], exclude )
+    GrammarLibrary.clear_packrat_cache()
+    return len(matches), elapsed, entries, cache_size
+
+## Time the TEI productions over a deeply nested synthetic document
+#   with and without packrat memoization, and measure the memory that
+#   the packrat cache holds at its peak (the end of the scan).
+#
+#  @param[in] num_sections The number of sections in the document
+#  @param[in] cache_sizes The packrat cache bounds to compare
+#  @return the table rows
+def benchmark_packrat(num_sections=20, cache_sizes=(GrammarLibrary.PACKRAT_CACHE_SIZE, 10000)):
+    text = generate_tei_document( num_sections )
+    rows = []
+    try:
+        for language_name in [ TEIXMLGrammar.SECTION, TEIXMLGrammar.SUBSECTION, TEIXMLGrammar.SUBSUBSECTION ]:
+            GrammarLibrary.disable_packrat()
+            num_matches, elapsed, entries, cache_size = scan_packrat( text, language_name )
+            rows.append( [ language_name, "off", num_matches, "%.3f" % elapsed, 0, 0 ] )
+            for packrat_cache_size in cache_sizes:
+                GrammarLibrary.enable_packrat( packrat_cache_size )
+                num_matches, elapsed, entries, cache_size = scan_packrat( text, language_name )
+                rows.append( [ language_name, packrat_cache_size, num_matches, "%.3f" % elapsed, entries, cache_size ] )
+    finally:
+        GrammarLibrary.disable_packrat()
+    print_table( "Packrat memoization over a nested TEI document (" + str(len(text)) + " bytes)",\
+                     [ "language", "packrat cache", "matches", "seconds", "cache entries", "cache bytes" ], rows )
+    return rows
+
+## Time the native IOS scanner against scanString on a synthetic
+#   configuration.  The two must find the same matches.
+#
+#  @param[in] num_lines The approximate number of lines in the configuration
+#  @return the table rows
+def benchmark_ios_scanner(num_lines=100000):
+    lines_per_interface = 6
+    text = generate_ios_config( num_lines / ( lines_per_interface + 1 ), lines_per_interface )
+    grammar = CiscoIOSGrammar()
+    scanner = CiscoIOSScanner()
+    rows = []
+    for language_name in [ CiscoIOSGrammar.INTERFACE, CiscoIOSGrammar.CONFIG, CiscoIOSGrammar.CRYPTO ]:
+        record = LanguageRecord.create( language_name, grammar )
+        pyparsing_elapsed, expected = time_call( list, record.scan_production( text ) )
+        native_elapsed, matches = time_call( list, scanner.get_scanner( language_name )( text ) )
+        assert expected == matches
+        rows.append( [ language_name, text.count("\n"), len(matches), "%.3f" % pyparsing_elapsed,\
+                           "%.3f" % native_elapsed, "%.1f" % ( pyparsing_elapsed / native_elapsed ) ] )
+    print_table( "Cisco IOS scanning, scanString vs native",\
+                     [ "language", "lines", "matches", "scanString seconds", "native seconds", "speedup" ], rows )
+    return rows
+
+## Time scan_text for builtin:line over a synthetic configuration with
+#   scanString and with the native line scanner, with and without numpy.
+#
+#  @param[in] num_lines The approximate number of lines in the configuration
+#  @return the table rows
+def benchmark_line_scanner(num_lines=100000):
+    lines_per_interface = 6
+    text = generate_ios_config( num_lines / ( lines_per_interface + 2 ), lines_per_interface )
+    rows = []
+    try:
+        GrammarLibrary.set_native_scanners_enabled( False )
+        pyparsing_elapsed, expected = time_call( scan_text, text, BuiltinGrammar.LINE )
+        rows.append( [ "scanString", len(expected), "%.3f" % pyparsing_elapsed, "%.1f" % 1.0 ] )
+        GrammarLibrary.set_native_scanners_enabled( True )
+        # Do not charge the (one-time) import of numpy to the scan
+        get_numpy()
+        for use_numpy in [ True, False ]:
+            BuiltinScanner.use_numpy = use_numpy
+            elapsed, matches = time_call( scan_text, text, BuiltinGrammar.LINE )
+            assert expected == matches
+            rows.append( [ "native" + ( use_numpy and ", numpy" or "" ), len(matches), "%.3f" % elapsed,\
+                               "%.1f" % ( pyparsing_elapsed / elapsed ) ] )
+    finally:
+        BuiltinScanner.use_numpy = True
+        GrammarLibrary.set_native_scanners_enabled( True )
+    print_table( "scan_text for builtin:line",\
+                     [ "scanner", "lines", "seconds", "speedup" ], rows )
+    return rows
+
+## Time the TEI sections and paragraphs of synthetic documents with
+#   scanString and with the native expat scanner, and report the peak
+#   resident size of the process after each.
+#
+#  @param[in] sizes The sizes of the documents, in megabytes
+#  @param[in] max_scan_string_size The largest document, in megabytes,
+#    on which to run the (slow) scanString
+#  @return the table rows
+def benchmark_tei_scanner(sizes=(1, 10, 100), max_scan_string_size=1):
+    grammar = TEIXMLGrammar()
+    scanner = TEIXMLScanner()
+    section_size = len( generate_tei_document(1) )
+    rows = []
+    for size in sizes:
+        text = generate_tei_document( max( 1, size * 1024 * 1024 / section_size ) )
+        for language_name in [ TEIXMLGrammar.SECTION, TEIXMLGrammar.PARAGRAPH ]:
+            native_elapsed, matches = time_call( scanner.get_scanner( language_name ), text )
+            pyparsing_elapsed = None
+            if size <= max_scan_string_size:
+                record = LanguageRecord.create( language_name, grammar )
+                pyparsing_elapsed, expected = time_call( list, record.scan_production( text ) )
+                assert expected == matches
+            rows.append( [ language_name, "%.1f" % ( len(text) / 1048576.0 ), len(matches),\
+                               None != pyparsing_elapsed and "%.3f" % pyparsing_elapsed or "-",\
+                               "%.3f" % native_elapsed,\
+                               "%.1f" % ( len(text) / 1048576.0 / native_elapsed ),\
+                               resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss / 1024 ] )
+        del text
+    print_table( "TEI scanning, scanString vs native",\
+                     [ "language", "MB", "matches", "scanString seconds", "native seconds",\
+                           "native MB/s", "peak RSS MB" ], rows )
+    return rows
+
+## Time scanString against a scan at the anchors of each production,
+#   on a synthetic configuration in which crypto blocks are rare and
+#   there are no vlans, and on a synthetic TEI document.
+#
+#  @param[in] num_lines The approximate number of lines in the configuration
+#  @param[in] num_sections The number of sections in the TEI document
+#  @return the table rows
+def benchmark_anchors(num_lines=20000, num_sections=20):
+    lines_per_interface = 6
+    config = generate_ios_config( num_lines / ( lines_per_interface + 1 ), lines_per_interface )
+    config = config.replace( "end\n", "crypto map azalea 1\n match address acl1\n!\nend\n" )
+    document = generate_tei_document( num_sections )
+    rows = []
+    for grammar, text, language_names in [ ( CiscoIOSGrammar(), config, [ CiscoIOSGrammar.CRYPTO,\
+                                                                               CiscoIOSGrammar.VLAN,\
+                                                                               CiscoIOSGrammar.INTERFACE ] ),\
+                                               ( TEIXMLGrammar(), document, [ TEIXMLGrammar.SUBSECTION,\
+                                                                                  TEIXMLGrammar.PARAGRAPH ] ) ]:
+        for language_name in language_names:
+            record = LanguageRecord.create( language_name, grammar )
+            scan_string_elapsed, expected = time_call( list, record.production.scanString( text ) )
+            anchors_elapsed, matches = time_call( list, record.scan_anchors( text, record.production ) )
+            assert [ ( s, e ) for match, s, e in expected ] == [ ( s, e ) for match, s, e in matches ]
+            rows.append( [ language_name, len(text), len(matches), "%.3f" % scan_string_elapsed,\
+                               "%.3f" % anchors_elapsed, "%.1f" % ( scan_string_elapsed / anchors_elapsed ) ] )
+    print_table( "scanString vs anchored scan",\
+                     [ "language", "characters", "matches", "scanString seconds", "anchored seconds", "speedup" ], rows )
+    return rows
+
+## Time how the normalized parse tree that xudiff compares is built,
+#   on a run of synthetic IOS interfaces and on a synthetic TEI section:
+#   by parseString and then a walk of a copy of the parse results made
+#   by asList, as xudiff did; by parseString and then a walk of the
+#   parse results themselves; and by the tree production, which builds
+#   the tree as it parses, see GrammarLibrary.get_tree_production.
+#
+#  @param[in] num_interfaces The number of interfaces in the configuration
+#  @param[in] num_subsections The number of subsections in the section
+#  @return the table rows
+def benchmark_normalize(num_interfaces=5000, num_subsections=20):
+    config = generate_ios_config( num_interfaces )
+    config = config[config.find("interface"):config.rfind("end")]
+    document = generate_tei_document( 1, num_subsections, num_subsections, 4 )
+    document = document[document.find("<div"):document.rfind("</body>")]
+    grammar_library = GrammarLibrary()
+    rows = []
+    for language_name, text in [ ( CiscoIOSGrammar.CONFIG, config ), ( TEIXMLGrammar.SECTION, document ) ]:
+        grammar_instance = grammar_library.get_grammar_instance( language_name )
+        production = grammar_library.get_grammar( language_name )
+        tree_production = grammar_library.get_tree_production( language_name )
+        as_list_elapsed, expected = time_call( lambda: grammar_instance.normalize_parse_tree( production.parseString( text ).asList() ) )
+        walk_elapsed, walked = time_call( lambda: grammar_library.normalize_parse_tree( language_name, production.parseString( text ) ) )
+        tree_elapsed, tree = time_call( lambda: tree_production.parseString( text )[0] )
+        assert expected == walked
+        assert expected == tree
+        rows.append( [ language_name, len(text), "%.3f" % as_list_elapsed, "%.3f" % walk_elapsed,\
+                           "%.3f" % tree_elapsed, "%.1f" % ( as_list_elapsed / tree_elapsed ) ] )
+    print_table( "Normalized parse trees: parse then walk an asList copy, parse then walk, tree production",\
+                     [ "language", "characters", "asList seconds", "walk seconds",\
+                           "tree production seconds", "speedup" ], rows )
+    return rows
+
+## The modules that xutools.grammar and xutools.tools imported before
+#   the grammars were imported on first use
+EAGER_IMPORTS = [ "numpy", "xutools.grammar.native.CiscoIOSScanner", "xutools.grammar.native.TEIXMLScanner",\
+                      "xutools.grammar.pyparsing.CiscoIOSGrammar", "xutools.grammar.pyparsing.TEIXMLGrammar" ]
+
+## Time the start of a fresh interpreter that imports xutools.tools, as
+#   every command does, with the grammars and numpy imported on first
+#   use and with them imported up front; and time xugrep on a small
+#   configuration, which needs only the IOS grammar.
+#
+#  @param[in] num_runs The number of interpreters to start for each row
+#  @return the table rows
+def benchmark_startup(num_runs=10):
+    ios_data_path = os.path.join( os.path.dirname( xutools.__file__ ), "..", "..", "data", "test",\
+                                      "cisco_ios", "router.v1.example" )
+    xugrep_path = os.path.join( os.path.dirname( xutools.__file__ ), "cmd", "xugrep" )
+    commands = [ ( "import xutools.tools", [ sys.executable, "-c", "import xutools.tools" ] ),\
+                     ( "import xutools.tools, eager", [ sys.executable, "-c",\
+                                                            "import xutools.tools, " + ", ".join( EAGER_IMPORTS ) ] ),\
+                     ( "xugrep //ios:interface", [ sys.executable, xugrep_path, "--no-cache", "//ios:interface",\
+                                                       ios_data_path ] ) ]
+    devnull = open( os.devnull, 'w' )
+    rows = []
+    for name, command in commands:
+        elapsed = []
+        for run in range(0, num_runs):
+            run_elapsed, status = time_call( subprocess.call, command, stdout=devnull )
+            assert 0 == status
+            elapsed.append( run_elapsed )
+        elapsed.sort()
+        rows.append( [ name, num_runs, "%.3f" % elapsed[0], "%.3f" % elapsed[ len(elapsed) / 2 ] ] )
+    devnull.close()
+    print_table( "Interpreter startup", [ "command", "runs", "fastest seconds", "median seconds" ], rows )
+    return rows
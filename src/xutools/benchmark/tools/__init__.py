@@ -0,0 +1,94 @@
+"""
+copyright (c) 2013 Gabriel A. Weaver <gabriel.a.l.weaver@gmail.com>
+
+This file is part of XUTools, Python Distribution.
+
+This code is free software:  you can redistribute
+it and/or modify it under the terms of the GNU General Public
+License as published by the Free Software Foundation, either version
+3 of the License, or (at your option) any later version.
+
+XUTools is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see http://www.gnu.org/licenses/
+"""
+from xutools.benchmark import generate_ios_config, print_table,\
+    remove_temp_files, time_call, write_temp_files
+from xutools.corpus import Corpus, CorpusElement
+from xutools.tools import XUGrep, XUPathBatch, XUPathPlan
+
+## @package xutools.benchmark.tools
+#    This module contains benchmarks for our XUTools tools
+
+ELEMENT_EQUALITY_FIELDS = [ CorpusElement.LABEL_PATH, CorpusElement.LANGUAGE_NAME_PATH, CorpusElement.TEXT ]
+
+## Time a selective predicate over synthetic configurations, a few of
+#   which have the interface it looks for, with and without the
+#   PREFILTER that skips the files that lack its literal.
+#
+#  @param[in] num_files The number of synthetic configurations
+#  @param[in] num_matching_files The number that have the interface
+#  @param[in] num_interfaces The number of interfaces in each configuration
+#  @return the table rows
+def benchmark_prefilter(num_files=100, num_matching_files=5, num_interfaces=500):
+    xupath = "/builtin:file/ios:interface[ re:testsubtree('Vlan100','e') ]"
+    vlan = "interface Vlan100\n ip address 10.100.0.1 255.255.255.0\n!\nend\n"
+    texts = [ generate_ios_config( num_interfaces, seed=i ) for i in range(0, num_files) ]
+    for i in range(0, num_matching_files):
+        texts[i] = texts[i].replace( "end\n", vlan )
+    directory, file_paths = write_temp_files( texts )
+
+    plan = XUPathPlan.compile( xupath )
+    unfiltered_plan = XUPathPlan()
+    unfiltered_plan.xupath = xupath
+    unfiltered_plan.operations = tuple( [ operation for operation in plan.operations\
+                                              if XUPathPlan.PREFILTER != operation[0] ] )
+    rows = []
+    try:
+        for name, method in [ ( "parse, then filter", unfiltered_plan ), ( "prefilter", plan ) ]:
+            for lazy_load in [ False, True ]:
+                corpus = Corpus.create_from_files( file_paths, ELEMENT_EQUALITY_FIELDS, lazy_load=lazy_load )
+                elapsed, results = time_call( method.run, corpus )
+                rows.append( [ name, lazy_load, num_files, len(results), "%.3f" % elapsed ] )
+    finally:
+        remove_temp_files( directory )
+    print_table( xupath + " over synthetic configurations",\
+                     [ "plan", "lazy", "files", "results", "seconds" ], rows )
+    return rows
+
+## Time a batch of xupaths that share the prefix
+#   /builtin:file/ios:interface, run one at a time with XUGrep.create
+#   and together with XUGrep.create_batch
+#
+#  @param[in] num_files The number of synthetic configurations
+#  @param[in] num_interfaces The number of interfaces in each configuration
+#  @param[in] num_predicates The number of xupaths with a predicate
+#  @return the table rows
+def benchmark_batch(num_files=20, num_interfaces=500, num_predicates=20):
+    xupaths = [ "/builtin:file/ios:interface", "/builtin:file/ios:interface/builtin:line" ]
+    for i in range(0, num_predicates):
+        xupaths.append( "/builtin:file/ios:interface[ re:testsubtree('acl" + str(i) + "','e') ]" )
+    texts = [ generate_ios_config( num_interfaces, seed=i ) for i in range(0, num_files) ]
+    directory, file_paths = write_temp_files( texts )
+    rows = []
+    try:
+        def create_each():
+            return [ XUGrep.create( xupath, file_paths, ELEMENT_EQUALITY_FIELDS ) for xupath in xupaths ]
+        for name, method, num_operations in\
+                [ ( "one at a time", create_each,\
+                        sum([ len( XUPathPlan.compile( xupath ).operations ) for xupath in xupaths ]) ),\
+                      ( "batch", lambda: XUGrep.create_batch( xupaths, file_paths, ELEMENT_EQUALITY_FIELDS ),\
+                            XUPathBatch.create( xupaths ).get_num_operations() ) ]:
+            elapsed, xugreps = time_call( method )
+            rows.append( [ name, len(xupaths), num_files, num_operations,\
+                               sum([ len( xugrep.corpus ) for xugrep in xugreps ]), "%.3f" % elapsed ] )
+            del xugreps
+    finally:
+        remove_temp_files( directory )
+    print_table( "A batch of xupaths over synthetic configurations",\
+                     [ "method", "xupaths", "files", "operations", "results", "seconds" ], rows )
+    return rows
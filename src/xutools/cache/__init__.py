@@ -0,0 +1,228 @@
+"""
+copyright (c) 2013 Gabriel A. Weaver <gabriel.a.l.weaver@gmail.com>
+
+This file is part of XUTools, Python Distribution.
+
+This code is free software:  you can redistribute
+it and/or modify it under the terms of the GNU General Public
+License as published by the Free Software Foundation, either version
+3 of the License, or (at your option) any later version.
+
+XUTools is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see http://www.gnu.org/licenses/
+"""
+import cPickle
+import errno
+import hashlib
+import os
+import pyparsing
+import tempfile
+from xutools.grammar import GrammarLibrary
+
+## @package xutools.cache
+#    This package contains a persistent cache of parse results.  When
+#    the same text is parsed for the same language with the same
+#    grammar, the matches are read from disk instead of running the
+#    grammar again.
+
+## A directory of parse results, one file per (text, language name,
+#   grammar revision).  The least recently used entries are removed
+#   once the directory grows past its size cap.
+class ParseCache():
+
+    ## Bump this whenever the format of the matches changes
+    FORMAT_VERSION = "1"
+
+    DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+    DEFAULT_MIN_TEXT_LENGTH = 1024
+
+    cache_dir = None
+    max_size = None
+    min_text_length = None
+    grammar_library = None
+
+    # The number of bytes in the cache, computed on the first put
+    size = None
+
+    # The number of lookups that found matches
+    hits = None
+
+    ## Create a parse cache
+    #
+    #  @param[in] cache_dir The directory in which to keep the cache; by
+    #    default, xutools under $XDG_CACHE_HOME or ~/.cache
+    #  @param[in] max_size The size of the cache, in bytes, beyond which
+    #    the least recently used entries are removed
+    #  @param[in] min_text_length Texts shorter than this are parsed
+    #    rather than cached, as they are cheaper to parse than to look up
+    #  @return the parse cache
+    @staticmethod
+    def create(cache_dir=None, max_size=DEFAULT_MAX_SIZE, min_text_length=DEFAULT_MIN_TEXT_LENGTH):
+        if None == cache_dir:
+            cache_home = os.environ.get("XDG_CACHE_HOME")
+            if not cache_home:
+                cache_home = os.path.join( os.path.expanduser("~"), ".cache" )
+            cache_dir = os.path.join( cache_home, "xutools" )
+
+        cache = ParseCache()
+        cache.cache_dir = cache_dir
+        cache.max_size = max_size
+        cache.min_text_length = min_text_length
+        cache.grammar_library = GrammarLibrary()
+        cache.hits = 0
+        return cache
+
+    ## Compute the key under which to cache the matches of a language
+    #   within a text.
+    #
+    #  @param[in] text The text to parse
+    #  @param[in] language_name The language to extract from the text
+    #  @param[in] capture_lines True if the matches keep the offsets of
+    #    their lines, see xutools.corpus.scan_text
+    #  @return the key, or None if the text should not be cached: it is
+    #    short, or the revision of the grammar is unknown
+    def get_key(self, text, language_name, capture_lines=False):
+        if len(text) < self.min_text_length:
+            return None
+        grammar_revision = self.grammar_library.get_grammar_revision( language_name )
+        if None == grammar_revision:
+            return None
+        if isinstance( text, unicode ):
+            text = text.encode("utf-8")
+        components = [ self.FORMAT_VERSION, pyparsing.__version__, language_name, grammar_revision ]
+        if capture_lines:
+            components.append( "lines" )
+        digest = hashlib.sha1()
+        for component in components:
+            digest.update( component )
+            digest.update( "\0" )
+        digest.update( text )
+        return digest.hexdigest()
+
+    ## Look up the matches stored under a key
+    #
+    #  @param[in] key The key, see get_key
+    #  @return the matches, or None on a miss
+    def get(self, key):
+        if None == key:
+            return None
+        entry_path = self.get_entry_path( key )
+        try:
+            fp = open( entry_path, 'rb' )
+            try:
+                matches = cPickle.load( fp )
+            finally:
+                fp.close()
+        except ( IOError, EOFError, cPickle.UnpicklingError ):
+            return None
+        self.hits = self.hits + 1
+
+        # Mark the entry as recently used
+        try:
+            os.utime( entry_path, None )
+        except OSError:
+            pass
+        return matches
+
+    ## Store matches under a key.  The cache is only an optimization,
+    #   so if the entry cannot be written (the cache directory is not
+    #   writable, or the disk is full) the matches are not cached.
+    #
+    #  @param[in] key The key, see get_key
+    #  @param[in] matches The matches of the language within the text
+    def put(self, key, matches):
+        if None == key:
+            return
+        entry_path = self.get_entry_path( key )
+        entry_dir = os.path.dirname( entry_path )
+        tmp_path = None
+        try:
+            try:
+                os.makedirs( entry_dir )
+            except OSError, e:
+                if errno.EEXIST != e.errno:
+                    raise
+
+            # Write to a temporary file first so that a concurrent reader
+            #  never sees a partial entry.
+            fd, tmp_path = tempfile.mkstemp( prefix=".", dir=entry_dir )
+            fp = os.fdopen( fd, 'wb' )
+            try:
+                cPickle.dump( matches, fp, cPickle.HIGHEST_PROTOCOL )
+            finally:
+                fp.close()
+            os.rename( tmp_path, entry_path )
+            tmp_path = None
+
+            if None == self.size:
+                self.size = self.get_size()
+            else:
+                self.size = self.size + os.path.getsize( entry_path )
+        except ( OSError, IOError ):
+            if None != tmp_path:
+                try:
+                    os.remove( tmp_path )
+                except OSError:
+                    pass
+            return
+        if self.size > self.max_size:
+            self.trim()
+
+    ## Remove the least recently used entries until the cache is
+    #   three quarters of its maximum size, so that we do not trim on
+    #   every put once the cache is full.
+    def trim(self):
+        try:
+            entries = self.list_entries()
+        except OSError:
+            return
+        entries.sort()
+        self.size = sum( [ entry_size for mtime, entry_size, entry_path in entries ] )
+        target_size = self.max_size * 3 / 4
+        for mtime, entry_size, entry_path in entries:
+            if self.size <= target_size:
+                break
+            try:
+                os.remove( entry_path )
+            except OSError:
+                pass
+            self.size = self.size - entry_size
+
+    ## Remove every entry in the cache
+    def clear(self):
+        for mtime, entry_size, entry_path in self.list_entries():
+            os.remove( entry_path )
+        self.size = 0
+
+    ## @return the number of bytes in the cache
+    def get_size(self):
+        return sum( [ entry_size for mtime, entry_size, entry_path in self.list_entries() ] )
+
+    ## @return a list of (mtime, size, path) for each entry in the cache
+    def list_entries(self):
+        entries = []
+        if not os.path.isdir( self.cache_dir ):
+            return entries
+        for entry_dir in os.listdir( self.cache_dir ):
+            entry_dir = os.path.join( self.cache_dir, entry_dir )
+            if not os.path.isdir( entry_dir ):
+                continue
+            for entry_name in os.listdir( entry_dir ):
+                if entry_name.startswith("."):
+                    continue
+                entry_path = os.path.join( entry_dir, entry_name )
+                try:
+                    stat = os.stat( entry_path )
+                except OSError:
+                    continue
+                entries.append( ( stat.st_mtime, stat.st_size, entry_path ) )
+        return entries
+
+    ## @return the path of the file that holds the entry for a key
+    def get_entry_path(self, key):
+        return os.path.join( self.cache_dir, key[:2], key[2:] )
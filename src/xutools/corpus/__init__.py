@@ -16,13 +16,36 @@ for more details.
 You should have received a copy of the GNU General Public License               
 along with this program.  If not, see http://www.gnu.org/licenses/
 """
+import bisect
+import collections
+import hashlib
+import itertools
+import mmap
 import os
 from pyparsing import *
 import types
+from xutools.exceptions import ParseBudgetExceeded
 from xutools.grammar import GrammarLibrary
+from xutools.grammar.native.BuiltinScanner import BuiltinScanner, get_numpy
 from xutools.grammar.pyparsing.BuiltinGrammar import BuiltinGrammar
 
 ## @package xutools.corpus
+
+## Intern a path component so that equal labels and language names
+#   across a corpus share one string object.  Only byte strings may be
+#   interned.
+#
+#  @param[in] value The path component
+#  @return the interned component, or the component itself
+def intern_string(value):
+    if type(value) is str:
+        return intern(value)
+    return value
+
+## Convert a path into a tuple of interned components
+def intern_path(path):
+    return tuple( intern_string(component) for component in path )
+
 class Corpus():
     
     corpus_elements = None
@@ -34,23 +57,24 @@ class Corpus():
     #    a file and the text of that element are the file contents.
     #
     #  @param[in] file_paths The file paths to create
+    #  @param[in] lazy_load If true, back each element by a FileBuffer
+    #    rather than reading the file contents up front
     #  @return the instantiated corpus
     @staticmethod
     def create_from_files(file_paths, element_equality_fields,\
                               path_field_equality_components=None,\
-                              path_field_equality_components_is_whitelist=None):
+                              path_field_equality_components_is_whitelist=None,\
+                              lazy_load=False):
         result_corpus = Corpus()
         
         for file_path in file_paths:
-            fp = open(file_path, 'r')
-            
             idx_path = [ "" ]
-            file_path = file_path
             basename = os.path.basename(file_path)
             label_path = [ basename ]
             language_name_path = [ BuiltinGrammar.FILE ]
             
-            corpus_element = CorpusElement.create( idx_path, label_path, language_name_path, file_path, element_equality_fields )
+            corpus_element = CorpusElement.create( idx_path, label_path, language_name_path, file_path,\
+                                                       element_equality_fields, lazy_load )
             result_corpus.add( corpus_element )
             
         if None != path_field_equality_components and None != path_field_equality_components_is_whitelist:
@@ -81,16 +105,153 @@ class Corpus():
     # For each element in a corpus, extract all strings that belong to 
     #  the given language name.  
     #
+    # The results of every element are added in place to the elements
+    #  of the new corpus, so the cost is linear in the number of results.
+    #
     # @param[in] language_name The language that we want to extract
-    # @param[in] attribute_value_path If true, retain path information
+    # @param[in] pool An optional multiprocessing.Pool over which to scan
+    #    the elements of the corpus
+    # @param[in] cache An optional xutools.cache.ParseCache from which to
+    #    read, and to which to write, the matches of each element
+    # @param[in] capture_lines True to keep, with each new element, the
+    #    offsets at which its lines begin, from the parse that found it,
+    #    so that parse_lines need not find them again.  The language
+    #    must capture lines, see LanguageRecord.captures_lines.
     # @return a new corpus whose elements contain strings that belong to the
     #    given language name
-    def parse(self, language_name):
+    def parse(self, language_name, pool=None, cache=None, capture_lines=False):
+        new_corpus = Corpus()
+        if None == pool:
+            for element in self.corpus_elements:
+                element.parse( language_name, new_corpus.corpus_elements, cache, capture_lines )
+                element.release_text()
+            return new_corpus
+
+        # Only elements whose matches are not cached go to the pool
+        elements = list(self.corpus_elements)
+        element_matches = [ None ] * len(elements)
+        cache_keys = [ None ] * len(elements)
+        if None != cache:
+            for idx, element in enumerate( elements ):
+                cache_keys[idx] = cache.get_key( element.get_text(), language_name, capture_lines )
+                element_matches[idx] = cache.get( cache_keys[idx] )
+        unscanned = [ idx for idx in range(0, len(elements)) if None == element_matches[idx] ]
+
+        # Scan the largest elements first, but create the children in
+        #  the order that a serial parse would, so that both produce the 
+        #  same corpus.
+        schedule = sorted( unscanned, key=lambda idx: -elements[idx].get_text_length() )
+        tasks = ( ( elements[idx].get_text_source(), language_name, capture_lines ) for idx in schedule )
+        for idx, task_result in itertools.izip( schedule, pool.imap( scan_task, tasks ) ):
+            matches = get_task_result( task_result )
+            if isinstance( matches, ParseBudgetExceeded ):
+                elements[idx].skip_scan( [ language_name ], matches )
+                matches = []
+            elif None != cache:
+                cache.put( cache_keys[idx], matches )
+            element_matches[idx] = matches
+        for element, matches in zip( elements, element_matches ):
+            element.create_children( language_name, matches, new_corpus.corpus_elements, capture_lines )
+            element.release_text()
+        return new_corpus
+
+    # Extract the lines of each element in a corpus, as parse would for
+    #  builtin:line, but without scanning the text of each element.  An
+    #  element whose parse kept its lines (see parse) gets them from the
+    #  offsets that the parse found.  For the others, the elements of a
+    #  file share its buffer, so we find the newlines of each buffer
+    #  once and look up the lines of each element by bisection.
+    #
+    # @return a new corpus whose elements are the lines of the elements 
+    #    of this corpus
+    def parse_lines(self):
+        new_corpus = Corpus()
+        line_indexes = {}
+        for element in self.corpus_elements:
+            matches = element.scan_lines( line_indexes )
+            element.create_children( BuiltinGrammar.LINE, matches, new_corpus.corpus_elements )
+            element.release_text()
+        return new_corpus
+
+    # For each element in a corpus, extract the strings of a file that
+    #  belong to the given language name and lie within the element, as
+    #  the descendant axis (//) of an xupath does.  Each buffer is
+    #  scanned once, however many of its elements we extract from; see
+    #  DescendantIndex.
+    #
+    # @param[in] language_name The language that we want to extract
+    # @param[in] cache An optional xutools.cache.ParseCache, see parse
+    # @return a new corpus whose elements are the descendants of the 
+    #    elements of this corpus in the given language
+    def parse_descendants(self, language_name, cache=None):
         new_corpus = Corpus()
+        descendant_indexes = {}
+        for element in self.corpus_elements:
+            matches = element.scan_descendants( language_name, descendant_indexes, cache )
+            element.create_children( language_name, matches, new_corpus.corpus_elements )
+            element.release_text()
+        return new_corpus
+
+    # For each element in a corpus, extract all strings that belong to
+    #  each of several language names, reading and scanning the text of 
+    #  each element once.  See GrammarLibrary.scan_many.
+    #
+    # @param[in] language_names The languages that we want to extract
+    # @param[in] pool An optional multiprocessing.Pool, see parse
+    # @param[in] cache An optional xutools.cache.ParseCache, see parse
+    # @return a dictionary of new corpora, by language name, as parse 
+    #    would return for each language name
+    def parse_many(self, language_names, pool=None, cache=None):
+        new_corpora = dict( [ ( language_name, Corpus() ) for language_name in language_names ] )
+        if None == pool:
+            for element in self.corpus_elements:
+                element_matches = element.scan_many( language_names, cache )
+                for language_name in language_names:
+                    element.create_children( language_name, element_matches[language_name],\
+                                                 new_corpora[language_name].corpus_elements )
+                element.release_text()
+            return new_corpora
+
+        # Only the languages whose matches are not cached go to the pool
         elements = list(self.corpus_elements)
-        for element in elements:
-            new_elements = element.parse( language_name )
-            new_corpus.corpus_elements = new_corpus.corpus_elements.union(new_elements)
+        element_matches = [ {} for element in elements ]
+        cache_keys = [ {} for element in elements ]
+        if None != cache:
+            for idx, element in enumerate( elements ):
+                text = element.get_text()
+                for language_name in language_names:
+                    cache_keys[idx][language_name] = cache.get_key( text, language_name )
+                    matches = cache.get( cache_keys[idx][language_name] )
+                    if None != matches:
+                        element_matches[idx][language_name] = matches
+        unscanned = [ ( idx, [ language_name for language_name in language_names\
+                                   if not language_name in element_matches[idx] ] )\
+                          for idx in range(0, len(elements)) ]
+        unscanned = [ ( idx, unscanned_names ) for idx, unscanned_names in unscanned if unscanned_names ]
+
+        schedule = sorted( unscanned, key=lambda task: -elements[task[0]].get_text_length() )
+        tasks = ( ( elements[idx].get_text_source(), unscanned_names ) for idx, unscanned_names in schedule )
+        for ( idx, unscanned_names ), task_result in itertools.izip( schedule, pool.imap( scan_many_task, tasks ) ):
+            matches = get_task_result( task_result )
+            if isinstance( matches, ParseBudgetExceeded ):
+                elements[idx].skip_scan( unscanned_names, matches )
+                matches = dict( [ ( language_name, [] ) for language_name in unscanned_names ] )
+            elif None != cache:
+                for language_name in unscanned_names:
+                    cache.put( cache_keys[idx][language_name], matches[language_name] )
+            element_matches[idx].update( matches )
+        for element, matches in zip( elements, element_matches ):
+            for language_name in language_names:
+                element.create_children( language_name, matches[language_name],\
+                                             new_corpora[language_name].corpus_elements )
+            element.release_text()
+        return new_corpora
+
+    ## @return a corpus of the same elements, which may be filtered
+    #    without changing this corpus
+    def copy(self):
+        new_corpus = Corpus()
+        new_corpus.corpus_elements = list( self.corpus_elements )
         return new_corpus
 
     # Restrict the elements in the corpus by a predicate
@@ -124,29 +285,295 @@ class Corpus():
     def output(self, attribute_names, tabulate):
         rows = []
         for element in self.corpus_elements:
-            row = []
-            for attribute_name in attribute_names:
-                field = element.get_field(attribute_name)
-                if isinstance( field, list ):
-                    field = " ".join(field)
-                row.append( field )
-            row_str = "\t".join(row)
-            if ( True == tabulate ):
-                row_str = row_str.replace("\n", "\\n")
-            rows.append( row_str )
+            rows.append( Corpus.output_element( element, attribute_names, tabulate ) )
         return rows
 
-class CorpusElement():
-    idx_path = None
-    label_path = None
-    language_name_path = None
+    # Output one corpus element, using field names as keys
+    #
+    # @param[in] element The corpus element to output
+    # @param[in] attribute_names The names of the corpus element
+    #   attribute values to output 
+    # @param[in] tabulate If true, escape so that we get one line per 
+    #   result
+    # @return the output row
+    @staticmethod
+    def output_element(element, attribute_names, tabulate):
+        row = []
+        for attribute_name in attribute_names:
+            field = element.get_field(attribute_name)
+            if isinstance( field, list ):
+                field = " ".join(field)
+            row.append( field )
+        row_str = "\t".join(row)
+        if ( True == tabulate ):
+            row_str = row_str.replace("\n", "\\n")
+        return row_str
+
+## A read-only, lazily mapped view of a file on disk.  The file is
+#   only mapped into memory when its contents are first requested, and
+#   the mapping may be released (and later re-established) at any time
+#   so that a corpus of many files does not hold every byte at once.
+#
+#   Each mapping holds a file descriptor, so at most MAX_OPEN_BUFFERS
+#   files are mapped at once; opening another releases the buffer that
+#   was least recently opened.
+class FileBuffer():
     file_path = None
-    text = None         # Optional place to cache text
-    text_ranges = None   # The start and end bytes of a string
-    grammar_library = None 
-    element_equality_fields = None
-    path_field_equality_components = None
-    path_field_equality_components_is_whitelist = None
+    size = None
+    mapping = None
+
+    MAX_OPEN_BUFFERS = 64
+    open_buffers = collections.OrderedDict()
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.size = os.path.getsize( file_path )
+        self.mapping = None
+
+    ## Map the file into memory if it is not mapped already
+    #
+    #  @return the mmap of the file, or None for an empty file
+    def open(self):
+        if None == self.mapping and self.size > 0:
+            open_buffers = FileBuffer.open_buffers
+            while len(open_buffers) >= self.MAX_OPEN_BUFFERS:
+                oldest_key = next( iter(open_buffers) )
+                open_buffers[oldest_key].release()
+            fp = open( self.file_path, 'rb' )
+            try:
+                self.mapping = mmap.mmap( fp.fileno(), 0, access=mmap.ACCESS_READ )
+            finally:
+                fp.close()
+            open_buffers[ id(self) ] = self
+        return self.mapping
+
+    ## Read the contents of the file.  The result is not retained by
+    #   the buffer, so callers decide how long the text stays in memory.
+    #
+    #  @param[in] start The offset of the first byte to read
+    #  @param[in] end The offset just past the last byte to read
+    #  @return the file contents between start and end as a string
+    def read(self, start=0, end=None):
+        if 0 == self.size:
+            return ""
+        return self.open()[start:end]
+
+    ## Find a string in the file without reading the file into memory
+    #
+    #  @param[in] substring The string to find
+    #  @param[in] start The offset at which to start looking
+    #  @param[in] end The offset just past the last byte to look at
+    #  @return the offset of the first occurrence, or -1
+    def find(self, substring, start=0, end=None):
+        if 0 == self.size:
+            return -1
+        if None == end:
+            end = self.size
+        return self.open().find( substring, start, end )
+
+    ## Unmap the file.  A later read maps it again.
+    def release(self):
+        if None != self.mapping:
+            self.mapping.close()
+            self.mapping = None
+            del FileBuffer.open_buffers[ id(self) ]
+
+    def __len__(self):
+        return self.size
+
+## The lines of a buffer, and the bounds of each line stripped of
+#   whitespace, so that the lines of any range of the buffer are found
+#   by bisection rather than by scanning.
+class LineIndex():
+    line_starts = None
+    line_ends = None
+    stripped_starts = None
+    stripped_ends = None
+
+    # Labels are line numbers, shared by every index
+    labels = []
+
+    ## @param[in] text The text of the buffer
+    #  @return the index, or None if the text has tabs (the line scanner
+    #    expands them, so offsets into the buffer would not match)
+    @staticmethod
+    def create(text):
+        if "\t" in text:
+            return None
+        line_index = LineIndex()
+        numpy = get_numpy()
+        if BuiltinScanner.use_numpy and None != numpy and isinstance( text, str ) and text:
+            line_index.set_bounds_with_numpy( numpy, text )
+            return line_index
+        matches = get_line_matches( text, BuiltinScanner().find_line_ends( text ) )
+        line_index.line_starts = [ match[0] for match in matches ]
+        line_index.line_ends = [ match[1] for match in matches ]
+        line_index.stripped_starts = [ match[2] for match in matches ]
+        line_index.stripped_ends = [ match[3] for match in matches ]
+        return line_index
+
+    ## Compute the bounds of every line at once: the stripped start of a
+    #   line is the first non-space at or after its start, and its 
+    #   stripped end is just past the last non-space before its end.
+    def set_bounds_with_numpy(self, numpy, text):
+        characters = numpy.frombuffer( text, numpy.uint8 )
+        line_ends = numpy.flatnonzero( characters == ord("\n") ) + 1
+        if 0 == len(line_ends) or line_ends[-1] < len(text):
+            line_ends = numpy.append( line_ends, len(text) )
+        line_starts = numpy.concatenate( ( [ 0 ], line_ends[:-1] ) )
+
+        is_space = numpy.zeros( 256, bool )
+        is_space[ [ ord(character) for character in " \t\n\r\x0b\x0c" ] ] = True
+        non_spaces = numpy.flatnonzero( ~is_space[characters] )
+        # Sentinels so that every line has a non-space before and after it
+        non_spaces = numpy.concatenate( ( [ -1 ], non_spaces, [ len(text) ] ) )
+        first_non_spaces = non_spaces[ numpy.searchsorted( non_spaces, line_starts ) ]
+        last_non_spaces = non_spaces[ numpy.searchsorted( non_spaces, line_ends ) - 1 ]
+        blank = first_non_spaces >= line_ends
+        stripped_starts = numpy.where( blank, line_ends, first_non_spaces )
+        stripped_ends = numpy.where( blank, line_ends, last_non_spaces + 1 )
+
+        self.line_starts = line_starts.tolist()
+        self.line_ends = line_ends.tolist()
+        self.stripped_starts = stripped_starts.tolist()
+        self.stripped_ends = stripped_ends.tolist()
+
+    ## Compute the matches of builtin:line in a range of the buffer
+    #
+    #  @param[in] text_buffer The buffer
+    #  @param[in] text_start The offset of the range in the buffer
+    #  @param[in] text_end The offset just past the range in the buffer
+    #  @return a list of (s, e, start, end, label), see scan_text
+    def get_line_matches(self, text_buffer, text_start, text_end):
+        if text_end <= text_start:
+            return []
+        first = bisect.bisect_right( self.line_ends, text_start )
+        last = bisect.bisect_right( self.line_ends, text_end - 1 ) + 1
+        num_lines = last - first
+        labels = LineIndex.labels
+        if len(labels) < num_lines:
+            labels.extend( [ str(idx) for idx in range( len(labels), num_lines ) ] )
+
+        matches = zip( [ offset - text_start for offset in self.line_starts[first:last] ],\
+                           [ offset - text_start for offset in self.line_ends[first:last] ],\
+                           [ offset - text_start for offset in self.stripped_starts[first:last] ],\
+                           [ offset - text_start for offset in self.stripped_ends[first:last] ],\
+                           labels[:num_lines] )
+
+        # The range may start or end within a line, in which case we
+        #  strip what is left of that line
+        for idx in sorted( set([ 0, num_lines - 1 ]) ):
+            line_start = self.line_starts[first + idx]
+            line_end = self.line_ends[first + idx]
+            if line_start < text_start or line_end > text_end:
+                line_start = max( line_start, text_start )
+                line_end = min( line_end, text_end )
+                line = text_buffer.read( line_start, line_end )
+                s, e, start, end, label = get_match_bounds( line, [ ( 0, len(line), labels[idx] ) ] )[0]
+                offset = line_start - text_start
+                matches[idx] = ( s + offset, e + offset, start + offset, end + offset, label )
+        return matches
+
+## The strings of one language in a whole buffer, sorted by offset, so
+#   that the strings within any range of the buffer are found by
+#   bisection rather than by scanning the range again.
+#
+#  A scan does not return matches within an earlier match, so the
+#   matches are disjoint and their ends are sorted as well.  Labels
+#   that are the index of a match are renumbered within each range, as
+#   a scan of the range alone would number them.
+class DescendantIndex():
+    starts = None
+    ends = None
+    matches = None
+    label_kind = None
+
+    ## @param[in] matches The matches of the language in the text of 
+    #    the buffer, see scan_text
+    #  @param[in] label_kind What labels the matches, see 
+    #    LanguageRecord.label_kind
+    #  @return the index
+    @staticmethod
+    def create(matches, label_kind):
+        descendant_index = DescendantIndex()
+        descendant_index.matches = matches
+        descendant_index.starts = [ match[2] for match in matches ]
+        descendant_index.ends = [ match[3] for match in matches ]
+        descendant_index.label_kind = label_kind
+        return descendant_index
+
+    ## Get the matches that lie within a range of the buffer
+    #
+    #  @param[in] text_start The offset of the range in the buffer
+    #  @param[in] text_end The offset just past the range in the buffer
+    #  @return a list of (s, e, start, end, label) relative to the
+    #    range, see scan_text
+    def get_matches(self, text_start, text_end):
+        first = bisect.bisect_left( self.starts, text_start )
+        last = bisect.bisect_right( self.ends, text_end )
+        matches = []
+        for s, e, start, end, label in self.matches[first:last]:
+            # An empty match where the range starts or ends lies outside it
+            if e <= text_start or s >= text_end:
+                continue
+            if "index" == self.label_kind:
+                label = str( len(matches) )
+            # The whitespace around a match may run past the range
+            s = max( s, text_start )
+            e = min( e, text_end )
+            matches.append( ( s - text_start, e - text_start, start - text_start, end - text_start, label ) )
+        return matches
+
+## An in-memory text with the same interface as a FileBuffer
+class StringBuffer():
+    text = None
+
+    def __init__(self, text):
+        self.text = text
+
+    def read(self, start=0, end=None):
+        if 0 == start and None == end:
+            return self.text
+        return self.text[start:end]
+
+    def find(self, substring, start=0, end=None):
+        if None == end:
+            end = len( self.text )
+        return self.text.find( substring, start, end )
+
+    def release(self):
+        pass
+
+    def __len__(self):
+        return len( self.text )
+
+## A corpus element is a string in the language of some production.
+#   Rather than holding its own copy of that string, an element refers
+#   to the buffer of the file from which it was extracted together with
+#   the (start, end) offsets of its (stripped) text within that buffer.
+#   The text is only sliced out of the buffer when it is requested.
+#
+#   Large corpora hold one element per extracted string, so elements
+#   have a fixed layout (no per-instance __dict__), share a single
+#   GrammarLibrary, and store their paths as tuples of interned strings.
+class CorpusElement(object):
+    __slots__ = ( "idx_path",
+                  "label_path",
+                  "language_name_path",
+                  "file_path",
+                  "text",          # Optional text that overrides the buffer
+                  "text_buffer",   # The buffer of the file that contains the text
+                  "text_start",    # The offset of the text within text_buffer
+                  "text_end",      # The offset just past the text within text_buffer
+                  "text_ranges",   # The start and end bytes of a string
+                  "line_starts",   # The offsets within text_buffer at which its lines begin, if its parse kept them
+                  "element_equality_fields",
+                  "path_field_equality_components",
+                  "path_field_equality_components_is_whitelist",
+                  "equality_key",  # Cached by get_equality_key
+                  "hash_key" )     # Cached by get_hash_key
+
+    grammar_library = GrammarLibrary()
 
     IDX_PATH = "idx_path"
     LABEL_PATH = "label_path"
@@ -159,16 +586,21 @@ class CorpusElement():
     PATH_FIELD_EQUALITY_COMPONENTS_IS_WHITELIST = "path_field_equality_components_is_whitelist"
 
     def __init__(self):
-        self.idx_path = []
-        self.label_path = []
-        self.language_name_path = []
-        self.file_path = []
+        self.idx_path = ()
+        self.label_path = ()
+        self.language_name_path = ()
+        self.file_path = None
         self.text = None
-        self.text_ranges = []
-        self.grammar_library = GrammarLibrary()
+        self.text_buffer = None
+        self.text_start = 0
+        self.text_end = None
+        self.text_ranges = ()
+        self.line_starts = None
         self.element_equality_fields = None
         self.path_field_equality_components = None
         self.path_field_equality_components_is_whitelist = None
+        self.equality_key = None
+        self.hash_key = None
 
     # Factory method to Create a CorpusElement
     #
@@ -177,25 +609,31 @@ class CorpusElement():
     # @param[in] language_name
     # @param[in] file_path
     # @param[in] element_equality_fields
+    # @param[in] lazy_load If true, read the file through a FileBuffer 
+    #   only when the text is needed
     # @return an instantiated CorpusElement
     @staticmethod
-    def create(idx_path, label_path, language_name_path, file_path, element_equality_fields):
+    def create(idx_path, label_path, language_name_path, file_path, element_equality_fields,\
+                   lazy_load=False):
         
         corpus_element = CorpusElement()
 
-        corpus_element.idx_path = idx_path
-        corpus_element.label_path = label_path
-        corpus_element.language_name_path = language_name_path
+        corpus_element.idx_path = tuple(idx_path)
+        corpus_element.label_path = intern_path(label_path)
+        corpus_element.language_name_path = intern_path(language_name_path)
         corpus_element.file_path = file_path
         corpus_element.element_equality_fields = element_equality_fields
 
-        fp = open( file_path )
-        text = fp.read()
-        fp.close()
-        text_range = [0, len( text )]        
-        
-        corpus_element.text = text
-        corpus_element.text_ranges = [ text_range ]
+        if lazy_load:
+            text_buffer = FileBuffer( file_path )
+        else:
+            fp = open( file_path )
+            text_buffer = StringBuffer( fp.read() )
+            fp.close()
+        text_range = (0, len( text_buffer ))
+        corpus_element.text_buffer = text_buffer
+        corpus_element.text_end = len( text_buffer )
+        corpus_element.text_ranges = ( text_range, )
         
         return corpus_element
 
@@ -223,6 +661,8 @@ class CorpusElement():
         return result
 
     def set_field(self, field_name, field_value):
+        self.equality_key = None
+        self.hash_key = None
         if self.IDX_PATH == field_name:
             self.idx_path = field_value
         elif self.LABEL_PATH == field_name:
@@ -243,178 +683,353 @@ class CorpusElement():
             raise ValueError("Unrecognized field name: " + repr(field_name))
 
     def get_idx_path(self):
-        return self.idx_path
+        return list(self.idx_path)
     
     def get_label_path(self):
-        return self.label_path
+        return list(self.label_path)
 
     def get_language_name_path(self):
-        return self.language_name_path
+        return list(self.language_name_path)
 
     def get_file_path(self):
         return self.file_path
 
     def get_text_ranges(self):
-        return self.text_ranges
+        return [ list(text_range) for text_range in self.text_ranges ]
 
     def get_text(self):
+        if None == self.text and None != self.text_buffer:
+            return self.text_buffer.read( self.text_start, self.text_end )
         return self.text
+
+    ## @return true if the text of this element contains a string.  The
+    #    text of a lazily-loaded element is searched in its buffer
+    #    rather than read.
+    def contains_text(self, substring):
+        if None == self.text and None != self.text_buffer:
+            return -1 != self.text_buffer.find( substring, self.text_start, self.text_end )
+        return substring in self.text
+
+    ## Release any memory held for the text of a lazily-loaded element.
+    #   The text is read again from its buffer if it is needed later.
+    def release_text(self):
+        if None != self.text_buffer:
+            self.text_buffer.release()
         
+    def get_text_length(self):
+        if None == self.text and None != self.text_buffer:
+            if None == self.text_end:
+                return len( self.text_buffer ) - self.text_start
+            return self.text_end - self.text_start
+        return len( self.text )
+
+    ## @return the length of the text of this element in bytes, as the
+    #    equality key counts it, without reading a lazily-loaded text
+    def get_text_size(self):
+        if None == self.text:
+            if None == self.text_buffer:
+                return None
+            return self.get_text_length()
+        if isinstance( self.text, unicode ):
+            return len( self.text.encode("utf-8") )
+        return len( self.text )
+
+    ## Describe the text of this element in a form that may be sent to 
+    #   another process: lazily-loaded files are sent by path rather
+    #   than by content.
+    #
+    #  @return a (text, file_path, start, end) tuple where either the 
+    #    text or the file path is None
+    def get_text_source(self):
+        if None == self.text and isinstance( self.text_buffer, FileBuffer ):
+            return ( None, self.text_buffer.file_path, self.text_start, self.text_end )
+        return ( self.get_text(), None, None, None )
+
     ## Create a corpus element for all strings from this corpus
     #    element that belong to the given language name
     #
     #  @param[in] language_name The language that we want to extract
+    #  @param[in] new_corpus_elements An optional set to which the new
+    #    elements are added
+    #  @param[in] cache An optional parse cache, see scan
+    #  @param[in] capture_lines See Corpus.parse
     #  @return a new corpus whose elements contain strings that belong to 
     #    the given language name.
-    def parse(self, language_name ):
-        new_corpus_elements = set()
+    def parse(self, language_name, new_corpus_elements=None, cache=None, capture_lines=False ):
+        matches = self.scan( language_name, cache, capture_lines )
+        return self.create_children( language_name, matches, new_corpus_elements, capture_lines )
+
+    ## Find the strings in the text of this element that belong to the
+    #    given language name.  This is the only step of parsing that
+    #    runs the grammar.
+    #
+    #  @param[in] language_name The language that we want to extract
+    #  @param[in] cache An optional xutools.cache.ParseCache; on a hit
+    #    the grammar is not run at all
+    #  @param[in] capture_lines See scan_text
+    #  @return a list of matches, see scan_text, which is empty if the
+    #    scan exceeded the parse budget
+    def scan(self, language_name, cache=None, capture_lines=False):
+        text = self.get_text()
+        cache_key = None
+        if None != cache:
+            cache_key = cache.get_key( text, language_name, capture_lines )
+            matches = cache.get( cache_key )
+            if None != matches:
+                return matches
+        try:
+            matches = scan_text( text, language_name, capture_lines )
+        except ParseBudgetExceeded, e:
+            self.skip_scan( [ language_name ], e )
+            return []
+        if None != cache:
+            cache.put( cache_key, matches )
+        return matches
+
+    ## Find the strings in the text of this element that belong to each
+    #    of several language names, in one pass over the text where the
+    #    grammar allows.
+    #
+    #  @param[in] language_names The languages that we want to extract
+    #  @param[in] cache An optional parse cache, see scan; only the 
+    #    languages that miss are scanned
+    #  @return a dictionary of lists of matches, by language name
+    def scan_many(self, language_names, cache=None):
+        text = self.get_text()
+        element_matches = {}
+        cache_keys = {}
+        if None != cache:
+            for language_name in language_names:
+                cache_keys[language_name] = cache.get_key( text, language_name )
+                matches = cache.get( cache_keys[language_name] )
+                if None != matches:
+                    element_matches[language_name] = matches
+        unscanned = [ language_name for language_name in language_names\
+                          if not language_name in element_matches ]
+        if unscanned:
+            try:
+                scanned = scan_text_many( text, unscanned )
+            except ParseBudgetExceeded, e:
+                self.skip_scan( unscanned, e )
+                scanned = dict( [ ( language_name, [] ) for language_name in unscanned ] )
+            else:
+                if None != cache:
+                    for language_name in unscanned:
+                        cache.put( cache_keys[language_name], scanned[language_name] )
+            element_matches.update( scanned )
+        return element_matches
+
+    ## Record that the text of this element was skipped because its scan
+    #    exceeded the parse budget; it has no matches, and they are not
+    #    cached.
+    #
+    #  @param[in] language_names The languages that it was scanned for
+    #  @param[in] reason The ParseBudgetExceeded
+    def skip_scan(self, language_names, reason):
+        parse_budget = GrammarLibrary.get_parse_budget()
+        if None != parse_budget:
+            parse_budget.add_event( self.file_path, self.label_path, language_names, reason )
+
+    ## Find the lines of the text of this element, as scan would for
+    #    builtin:line, from the offsets that the parse that found it
+    #    kept, if it kept them, and otherwise from the line index of the
+    #    buffer it shares with the rest of its file.  An element whose
+    #    text was set does not share the buffer, so its own text is
+    #    scanned.
+    #
+    #  @param[in] line_indexes A dictionary of LineIndex by the id of
+    #    each buffer, to which new indexes are added.  The buffers must
+    #    outlive the dictionary.
+    #  @return a list of matches, see scan_text
+    def scan_lines(self, line_indexes):
+        if None != self.text or None == self.text_buffer:
+            return scan_text( self.get_text(), BuiltinGrammar.LINE )
+        if None != self.line_starts:
+            return get_captured_line_matches( self.get_text(), self.line_starts, self.text_start )
+        buffer_id = id( self.text_buffer )
+        if not buffer_id in line_indexes:
+            line_indexes[buffer_id] = LineIndex.create( self.text_buffer.read() )
+        line_index = line_indexes[buffer_id]
+        # The line scanner expands tabs, which moves the offsets
+        if None == line_index:
+            return scan_text( self.get_text(), BuiltinGrammar.LINE )
+        return line_index.get_line_matches( self.text_buffer, self.text_start, self.text_end )
+
+    ## Find the strings of the file of this element that belong to the
+    #    given language name and lie within this element, from an index
+    #    of the buffer it shares with the rest of its file.  The matches
+    #    are those that scan would find, other than this element itself.
+    #
+    #  @param[in] language_name The language that we want to extract
+    #  @param[in] descendant_indexes A dictionary of indexes by the id
+    #    of each buffer and the language name, to which new indexes are
+    #    added, see create_descendant_index.  The buffers must outlive
+    #    the dictionary.
+    #  @param[in] cache An optional parse cache, see scan
+    #  @return a list of matches, see scan_text
+    def scan_descendants(self, language_name, descendant_indexes, cache=None):
+        matches = None
+        if None == self.text and None != self.text_buffer:
+            index_key = ( id( self.text_buffer ), language_name )
+            if not index_key in descendant_indexes:
+                descendant_indexes[index_key] = self.create_descendant_index( language_name, cache )
+            descendant_index = descendant_indexes[index_key]
+            if isinstance( descendant_index, LineIndex ):
+                matches = descendant_index.get_line_matches( self.text_buffer, self.text_start, self.text_end )
+            elif None != descendant_index:
+                matches = descendant_index.get_matches( self.text_start, self.text_end )
+        if None == matches:
+            matches = self.scan( language_name, cache )
+
+        # An element is not its own descendant
+        if language_name == self.language_name_path[-1]:
+            text_length = self.get_text_length()
+            matches = [ match for match in matches if not ( 0 == match[2] and text_length == match[3] ) ]
+        return matches
+
+    ## Index the whole buffer of this element: the lines of the buffer
+    #    for builtin:line, as scan_lines does, and otherwise the matches
+    #    of a scan of the buffer, as its file element would find them.
+    #
+    #  @return a LineIndex or DescendantIndex, or None if the elements of
+    #    the buffer must each be scanned on their own: the buffer has
+    #    tabs (the scanners expand them, so offsets into the buffer
+    #    would not match), or the labels of the language depend upon
+    #    the match
+    def create_descendant_index(self, language_name, cache=None):
+        text = self.text_buffer.read()
+        if BuiltinGrammar.LINE == language_name:
+            return LineIndex.create( text )
+        label_kind = self.grammar_library.get_language_record( language_name ).label_kind
+        if "\t" in text or None == label_kind:
+            return None
+        root = CorpusElement()
+        root.label_path = self.label_path[:1]
+        root.file_path = self.file_path
+        root.text = text
+        return DescendantIndex.create( root.scan( language_name, cache ), label_kind )
+
+    ## Create a corpus element for each match found by scan
+    #
+    #  @param[in] language_name The language of the matches
+    #  @param[in] matches The matches returned by scan
+    #  @param[in] new_corpus_elements An optional set to which the new
+    #    elements are added
+    #  @param[in] capture_lines True if the matches end with the offsets
+    #    at which their lines begin, see scan_text
+    #  @return the set of new corpus elements
+    def create_children(self, language_name, matches, new_corpus_elements=None, capture_lines=False):
+        if None == new_corpus_elements:
+            new_corpus_elements = set()
         
-        grammar_production = self.grammar_library.get_grammar( language_name )
-        matches = grammar_production.scanString( self.text )
-
-        match_idx = 0
-        for match, s, e in matches:
-            new_idx_path = list(self.idx_path)
-            new_idx_path.append(None)
-            new_label_path = list(self.label_path)
-            grammar_instance = self.grammar_library.get_grammar_instance(language_name)
-            new_label = grammar_instance.get_label_for_match(language_name, match, match_idx)
-
-            new_label_path.append(new_label)
-            new_language_name_path = list(self.language_name_path)
-            new_language_name_path.append( language_name )
-            new_file_path = self.file_path
-            new_text_ranges = list(self.text_ranges)
-            new_text_ranges.append( [ s, e ] )
-            new_text = self.text[s:e].strip()
-            new_element_equality_fields = self.element_equality_fields
-            new_path_field_equality_components = self.path_field_equality_components
-            new_path_field_equality_components_is_whitelist = self.path_field_equality_components_is_whitelist
+        if None != self.text:
+            text_buffer = StringBuffer( self.text )
+            text_start = 0
+        else:
+            text_buffer = self.text_buffer
+            text_start = self.text_start
 
+        # Every match shares these with its siblings
+        new_idx_path = tuple(self.idx_path) + ( None, )
+        new_language_name_path = tuple(self.language_name_path) + ( intern_string(language_name), )
+        label_path = tuple(self.label_path)
+        text_ranges = tuple(self.text_ranges)
+
+        line_starts = None
+        for match in matches:
+            if capture_lines:
+                s, e, start, end, label, line_starts = match
+            else:
+                s, e, start, end, label = match
             new_corpus_element = CorpusElement()
             new_corpus_element.idx_path = new_idx_path
-            new_corpus_element.label_path = new_label_path
+            new_corpus_element.label_path = label_path + ( intern_string(label), )
             new_corpus_element.language_name_path = new_language_name_path
-            new_corpus_element.file_path = new_file_path 
-            new_corpus_element.text_ranges = new_text_ranges
-            new_corpus_element.text = new_text 
-            new_corpus_element.element_equality_fields = new_element_equality_fields
-            new_corpus_element.path_field_equality_components = new_path_field_equality_components
-            new_corpus_element.path_field_equality_components_is_whitelist = new_path_field_equality_components_is_whitelist
+            new_corpus_element.file_path = self.file_path 
+            new_corpus_element.text_ranges = text_ranges + ( (s, e), )
+            new_corpus_element.text_buffer = text_buffer
+            new_corpus_element.text_start = text_start + start
+            new_corpus_element.text_end = text_start + end
+            if None != line_starts:
+                new_corpus_element.line_starts = tuple( [ text_start + line_start for line_start in line_starts ] )
+            new_corpus_element.element_equality_fields = self.element_equality_fields
+            new_corpus_element.path_field_equality_components = self.path_field_equality_components
+            new_corpus_element.path_field_equality_components_is_whitelist = self.path_field_equality_components_is_whitelist
 
             new_corpus_elements.add( new_corpus_element )
-            match_idx = match_idx + 1
 
         return new_corpus_elements
 
+    ## Compute the canonical value of each equality field, projected
+    #   through path_field_equality_components, as one tuple.  The key
+    #   is computed once and cached until a field is set.  Text is
+    #   represented by a digest so that the key does not hold a copy of
+    #   the text of every element.
+    #
+    #  @return the equality key of this element
+    def get_equality_key(self):
+        if None == self.equality_key:
+            self.equality_key = self.compute_equality_key( True )
+        return self.equality_key
 
-    # In Python set elements must be hashable (implement __hash__())
-    def __hash__(self):
+    ## Compute the equality key as get_equality_key does, but represent
+    #   text by its length alone, so that hashing an element (as adding
+    #   it to a corpus does) never reads its text.  Elements with equal
+    #   equality keys have equal hash keys; the digest is only computed
+    #   when __eq__ compares elements whose hashes collide.
+    #
+    #  @return the hash key of this element
+    def get_hash_key(self):
+        if None == self.hash_key:
+            self.hash_key = self.compute_equality_key( False )
+        return self.hash_key
+
+    ## @param[in] digest_text If false, represent text by its length in
+    #    bytes rather than by its length and digest
+    #  @return the equality key or hash key, see get_equality_key
+    def compute_equality_key(self, digest_text):
         if self.element_equality_fields == None:
             raise Exception("Must invoke set_field on element_equality_fields to evaluate equality!")
-        values = []
+
+        components = []
         for equality_field in self.element_equality_fields:
+            if self.TEXT == equality_field and not digest_text:
+                components.append( ( self.get_text_size(), ) )
+                continue
             value = self.get_field(equality_field)
             if None != self.path_field_equality_components and\
-                    self.path_field_equality_components_is_whitelist:
-                if equality_field in self.path_field_equality_components:
-                    valid_idxs = self.path_field_equality_components[equality_field]
-                    modified_value = []
-                    for idx in valid_idxs:
-                        modified_value.append( value[idx] )
-                    values.append(str(modified_value))
-                else:
-                    values.append(str(value))
-            elif None != self.path_field_equality_components and\
-                    not self.path_field_equality_components_is_whitelist:
-                if equality_field in self.path_field_equality_components:
-                    invalid_idxs = self.path_field_equality_components[equality_field]
-                    modified_value = []
-                    assert isinstance(value, list)
-                    for component_idx in range(0,len(value)):
-                        if not component_idx in invalid_idxs:
-                            modified_value.append( value[component_idx] )
-                    values.append(str(modified_value))
+                    equality_field in self.path_field_equality_components:
+                idxs = self.path_field_equality_components[equality_field]
+                if self.path_field_equality_components_is_whitelist:
+                    value = tuple( value[idx] for idx in idxs )
                 else:
-                    values.append(str(value))
-            else:
-                values.append(str(value))
-        # watch out for errors that stem from this
-        hash = sum( map( lambda x: x.__hash__(), values ) )
-        return hash
-
-        #paths = [ idx_path, language_name_path ]
-
-        #watch out for errors that stem from this!
-        #paths = filter(lambda x:x!=None, paths)
-        #path_hashes = []
-        #for path in paths:
-        #    path_hash = sum( map( lambda x: x.__hash__(), path ) )
-        #    path_hashes.append( path_hash )
-        #  label_path_hash = sum( map( lambda x: x.__hash__(), label_path[1:] ))
-        #  result = sum( path_hashes ) + label_path_hash + text.__hash__()
-        #   return result
+                    assert isinstance(value, (list, tuple))
+                    value = tuple( value[idx] for idx in range(0, len(value)) if not idx in idxs )
+            elif self.TEXT == equality_field and isinstance( value, basestring ):
+                if isinstance( value, unicode ):
+                    value = value.encode("utf-8")
+                value = ( len(value), hashlib.sha1( value ).digest() )
+            elif isinstance( value, list ):
+                value = tuple(value)
+            components.append( value )
+        return tuple(components)
+
+    # In Python set elements must be hashable (implement __hash__())
+    def __hash__(self):
+        return hash( self.get_hash_key() )
 
     # We want to define some basic notions of equality so as to compare 
     #  elements in sets
     def __eq__(self, other):
-
+        if self is other:
+            return True
         if self.path_field_equality_components != other.path_field_equality_components:
             raise RuntimeWarning("Path field equality components are not the same in elements!")
         if self.path_field_equality_components_is_whitelist != other.path_field_equality_components_is_whitelist:
             raise RuntimeWarning("Path field equality components are not both black|white lists!")
         if self.element_equality_fields != other.element_equality_fields:
             raise RuntimeWarning("Element equality fields are not equal in elements being compared!")
-
-        for equality_field in self.element_equality_fields:
-            self_value = self.get_field(equality_field)
-            other_value = other.get_field(equality_field)
-
-            if None != self.path_field_equality_components and\
-                    self.path_field_equality_components_is_whitelist:
-                if equality_field in self.path_field_equality_components:
-                    valid_idxs = self.path_field_equality_components[equality_field]
-                    modified_self_value = []
-                    modified_other_value = []
-                    for idx in valid_idxs:
-                        modified_self_value.append( self_value[idx] )
-                        modified_other_value.append( other_value[idx] )
-                    if modified_self_value != modified_other_value:
-                        return False
-                else:
-                    if self_value != other_value:
-                        return False
-            elif None != self.path_field_equality_components and\
-                    not self.path_field_equality_components_is_whitelist:
-                if equality_field in self.path_field_equality_components:
-                    invalid_idxs = self.path_field_equality_components[equality_field]
-                    modified_self_value = []
-                    modified_other_value = []
-                    assert isinstance(self_value, list)
-                    assert isinstance(other_value, list)
-                    assert len(self_value) == len(other_value)
-                    for component_idx in range(0, len(self_value)):
-                        if not component_idx in invalid_idxs:
-                            modified_self_value.append( self_value[component_idx] )
-                            modified_other_value.append( other_value[component_idx] )
-                    if modified_self_value != modified_other_value:
-                        return False
-                else:
-                    if self_value != other_value:
-                        return False
-            else:
-                if self_value != other_value:
-                    return False
-        return True
-
-    # if self.label_path[1:] != other.label_path[1:]:
-    # return False
-    #  elif self.language_name_path != other.language_name_path:
-    #       return False
-    #   elif self.text != other.text:
-    #       return False
-    #   else:
-    #       return True
+        return self.get_equality_key() == other.get_equality_key()
 
     # We want to print out the corpus element
     def __str__(self):
@@ -422,4 +1037,182 @@ class CorpusElement():
         result.append( "label path: " + ":".join(self.label_path) )
         result.append( "language name path " + ":".join(self.language_name_path) )
         return "\n".join(result)
-        
+
+## Find the strings in a text that belong to the given language name.
+#
+#  @param[in] text The text to scan
+#  @param[in] language_name The language that we want to extract
+#  @param[in] capture_lines True to find the offsets within the text at
+#    which the lines of each match begin as well, from the parse of the
+#    match; the language must capture lines, see
+#    LanguageRecord.captures_lines
+#  @return a list of (s, e, start, end, label) tuples, one per match, 
+#    where text[s:e] is the match and text[start:end] is the match 
+#    with surrounding whitespace stripped.  If capture_lines, each
+#    tuple ends with the sorted offsets as well, or with None if the
+#    text has tabs (the scanners expand them, which moves the offsets).
+#  @exception ParseBudgetExceeded if the scan exceeded the parse budget
+def scan_text(text, language_name, capture_lines=False):
+    language_record = CorpusElement.grammar_library.get_language_record( language_name )
+    GrammarLibrary.start_parse_budget()
+    try:
+        if not capture_lines:
+            results = get_match_bounds( text, language_record.scan( text ) )
+        elif "\t" in text:
+            results = [ result + ( None, ) for result in get_match_bounds( text, language_record.scan( text ) ) ]
+        else:
+            matches = list( language_record.scan( text, True ) )
+            results = [ result + ( match[3], ) for result, match in\
+                            zip( get_match_bounds( text, [ match[:3] for match in matches ] ), matches ) ]
+    finally:
+        GrammarLibrary.stop_parse_budget()
+        GrammarLibrary.clear_packrat_cache()
+    return results
+
+## Find the strings in a text that belong to each of several language
+#   names, see GrammarLibrary.scan_many
+#
+#  @param[in] text The text to scan
+#  @param[in] language_names The languages that we want to extract
+#  @return a dictionary of lists of matches, by language name, see scan_text
+def scan_text_many(text, language_names):
+    GrammarLibrary.start_parse_budget()
+    try:
+        scanned = CorpusElement.grammar_library.scan_many( text, language_names )
+        results = dict( [ ( language_name, get_match_bounds( text, matches ) )\
+                              for language_name, matches in scanned.items() ] )
+    finally:
+        GrammarLibrary.stop_parse_budget()
+        GrammarLibrary.clear_packrat_cache()
+    return results
+
+## Add to each (s, e, label) the bounds of text[s:e].strip()
+#
+#  @param[in] text The text that was scanned
+#  @param[in] matches The (s, e, label) of each match
+#  @return a list of (s, e, start, end, label), see scan_text
+def get_match_bounds(text, matches):
+    text_length = len( text )
+    results = []
+
+    for s, e, label in matches:
+        # Find the bounds of text[s:e].strip() without copying it
+        start = min( s, text_length )
+        end = min( e, text_length )
+        while start < end and text[start].isspace():
+            start = start + 1
+        while end > start and text[end - 1].isspace():
+            end = end - 1
+
+        results.append( ( s, e, start, end, label ) )
+    return results
+
+## Compute the matches of builtin:line in a text from the offsets at
+#   which its lines begin, see CorpusElement.line_starts
+#
+#  @param[in] text The text
+#  @param[in] line_starts The sorted offsets at which the lines begin,
+#    within the buffer of the text; the first may lie before the text,
+#    which is stripped, the last ones after it, and an offset may
+#    repeat
+#  @param[in] text_start The offset of the text within its buffer
+#  @return a list of (s, e, start, end, label), see scan_text
+def get_captured_line_matches(text, line_starts, text_start):
+    text_length = len( text )
+    starts = [ 0 ]
+    for line_start in line_starts:
+        line_start = line_start - text_start
+        if starts[-1] < line_start < text_length:
+            starts.append( line_start )
+    ends = starts[1:] + [ text_length ]
+    return get_match_bounds( text, [ ( s, e, str(line_idx) ) for line_idx, ( s, e )\
+                                         in enumerate( zip( starts, ends ) ) ] )
+
+## Compute the matches of builtin:line in a text from its newlines
+#
+#  @param[in] text The text, without tabs
+#  @param[in] line_ends The offsets just past each newline in the text
+#  @return a list of (s, e, start, end, label), see scan_text
+def get_line_matches(text, line_ends):
+    text_length = len( text )
+    line_starts = [ 0 ] + line_ends
+    if line_starts[-1] < text_length:
+        line_ends.append( text_length )
+    else:
+        line_starts.pop()
+
+    results = []
+    for idx, ( s, e ) in enumerate( itertools.izip( line_starts, line_ends ) ):
+        line = text[s:e]
+        stripped_line = line.strip()
+        if stripped_line:
+            start = s + len(line) - len( line.lstrip() )
+            end = start + len( stripped_line )
+        else:
+            start = end = e
+        results.append( ( s, e, start, end, str(idx) ) )
+    return results
+
+## Scan the text of a corpus element in a worker process.
+#
+#  @param[in] task A (text_source, language_name, capture_lines) tuple,
+#    where the text source comes from CorpusElement.get_text_source
+#  @return the matches, see scan_text, or the ParseBudgetExceeded if
+#    the scan exceeded the parse budget, as a task result, see run_task
+def scan_task(task):
+    text_source, language_name, capture_lines = task
+    return run_task( lambda: scan_text( read_text_source( text_source ), language_name, capture_lines ) )
+
+## Scan the text of a corpus element for several languages in a worker
+#   process.
+#
+#  @param[in] task A (text_source, language_names) pair, see scan_task
+#  @return the matches by language name, see scan_text_many, or the
+#    ParseBudgetExceeded, as a task result, see run_task
+def scan_many_task(task):
+    text_source, language_names = task
+    return run_task( lambda: scan_text_many( read_text_source( text_source ), language_names ) )
+
+## Run the scan of a task in a worker process.  A worker that was
+#   created while profiling was enabled inherits the profile, see
+#   GrammarLibrary.enable_profiling; it counts each task afresh, so that
+#   the counts of the task are sent back with its result.
+#
+#  @param[in] scan A function that scans the text of the task
+#  @return a (result, counters) pair, where the result is that of the
+#    scan or the ParseBudgetExceeded that it raised, and the counters
+#    are those of the profile of the task, or None if the worker is not
+#    profiling
+def run_task(scan):
+    profile = GrammarLibrary.get_profile()
+    if None != profile:
+        profile.counters = {}
+    try:
+        result = scan()
+    except ParseBudgetExceeded, e:
+        result = e
+    if None == profile:
+        return ( result, None )
+    return ( result, profile.counters )
+
+## Add the counts of a task to the profile of this process, if it is
+#   profiling, see run_task
+#
+#  @param[in] task_result The (result, counters) pair of the task
+#  @return the result of the task
+def get_task_result(task_result):
+    result, counters = task_result
+    profile = GrammarLibrary.get_profile()
+    if None != counters and None != profile:
+        profile.merge( counters )
+    return result
+
+## @param[in] text_source See CorpusElement.get_text_source
+#  @return the text
+def read_text_source(text_source):
+    text, file_path, start, end = text_source
+    if None == text:
+        text_buffer = FileBuffer( file_path )
+        text = text_buffer.read( start, end )
+        text_buffer.release()
+    return text
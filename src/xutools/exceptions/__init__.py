@@ -27,3 +27,14 @@ class UndefinedLanguageName(Exception):
     def __str__(self):
         return repr(self.value)
 
+
+# If the grammar takes more than the parse budget to scan a text (see
+#  GrammarLibrary.set_parse_budget), then XUTools will throw this
+#  exception from within the scan.
+class ParseBudgetExceeded(Exception):
+    def __init__(self, value):
+        Exception.__init__(self, value)
+        self.value = value
+
+    def __str__(self):
+        return str(self.value)
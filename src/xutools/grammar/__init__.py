@@ -16,10 +16,429 @@ for more details.
 You should have received a copy of the GNU General Public License               
 along with this program.  If not, see http://www.gnu.org/licenses/
 """
-from xutools.grammar.pyparsing.BuiltinGrammar import BuiltinGrammar
-from xutools.grammar.pyparsing.CiscoIOSGrammar import CiscoIOSGrammar
-from xutools.grammar.pyparsing.TEIXMLGrammar import TEIXMLGrammar
-from xutools.grammar.pyparsing.XUPathGrammar import XUPathGrammar
+from __future__ import absolute_import
+import collections
+import hashlib
+import importlib
+import inspect
+import json
+from pyparsing import Group, LineEnd, ParseBaseException, ParseException, ParserElement
+import re
+import time
+from xutools.exceptions import ParseBudgetExceeded
+
+## What the library knows about a language name, resolved once: the
+#   instance of the grammar that specifies it, the production that 
+#   recognizes it, the function that labels its matches, the languages
+#   that it captures, and the native scanner for it, if there is one.
+class LanguageRecord():
+
+    language_name = None
+    grammar_instance = None
+    production = None
+    scanner = None
+    line_scanner = None
+    scanner_instance = None
+    anchor = None
+    label_kind = None
+    captured_language_names = None
+
+    ## @param[in] language_name
+    #  @param[in] grammar_instance The grammar that specifies the language
+    #  @param[in] scanner_instance The native scanner for the grammar, or None
+    #  @return the record for the language
+    @staticmethod
+    def create(language_name, grammar_instance, scanner_instance=None):
+        record = LanguageRecord()
+        record.language_name = language_name
+        record.grammar_instance = grammar_instance
+        record.production = grammar_instance.get_grammar( language_name )
+        anchor = grammar_instance.get_anchor( language_name )
+        if None != anchor:
+            record.anchor = re.compile( anchor, re.M )
+        record.label_kind = grammar_instance.get_label_kind( language_name )
+        record.captured_language_names = grammar_instance.get_captured_language_names( language_name )
+        if None != scanner_instance and language_name in scanner_instance.get_language_names():
+            record.scanner = scanner_instance.get_scanner( language_name )
+            record.scanner_instance = scanner_instance
+            if record.captures_lines() and hasattr( scanner_instance, "get_line_scanner" ):
+                record.line_scanner = scanner_instance.get_line_scanner( language_name )
+        return record
+
+    ## @return true if the lines of each match begin where the match or
+    #    a Group of its parse results begins, see scan
+    def captures_lines(self):
+        return GrammarLibrary.LINE_LANGUAGE_NAME in self.captured_language_names
+
+    ## Label a match of the production
+    #
+    #  @param[in] match The parse results of the match
+    #  @param[in] match_idx The index of the match within its text
+    #  @return the label
+    def get_label(self, match, match_idx):
+        return self.grammar_instance.get_label_for_match( self.language_name, match, match_idx )
+
+    ## Find the strings in a text that belong to the language, with the
+    #   native scanner if there is one and with the production otherwise.
+    #   The offsets are those of scanString.  A scanner returns None for
+    #   a text that it cannot scan exactly as the production would.
+    #
+    #  @param[in] text The text to scan
+    #  @param[in] capture_lines True to find the offsets at which the
+    #    lines of each match begin as well, from the parse of the match;
+    #    the language must capture lines, see captures_lines
+    #  @return a generator of (start, end, label), or of (start, end,
+    #    label, line starts)
+    def scan(self, text, capture_lines=False):
+        scanner = self.scanner
+        if capture_lines:
+            scanner = self.line_scanner
+        if None != scanner:
+            start_time = time.time()
+            matches = scanner( text )
+            if None != GrammarLibrary.profile:
+                if None != matches:
+                    matches = list( matches )
+                GrammarLibrary.profile.record_scanner( [ self.language_name ], None != matches,\
+                                                           time.time() - start_time )
+            if None != matches:
+                return matches
+        return self.scan_production( text, capture_lines )
+
+    def scan_production(self, text, capture_lines=False):
+        production = self.production
+        if capture_lines:
+            production = GrammarLibrary().get_capture_production( self.language_name )
+        if None != self.anchor:
+            matches = self.scan_anchors( text, production )
+        else:
+            matches = production.scanString( text )
+        match_idx = 0
+        for match, s, e in matches:
+            if capture_lines:
+                yield ( s, e, self.get_label( match, match_idx ), get_captured_line_starts( match, s ) )
+            else:
+                yield ( s, e, self.get_label( match, match_idx ) )
+            match_idx = match_idx + 1
+
+    ## Do what scanString does, but try the production only where its
+    #   anchor matches rather than at every offset.  Since every match
+    #   begins with the anchor, the other offsets could only fail.
+    #
+    #  @param[in] text The text to scan
+    #  @param[in] production The production, or a copy of it
+    #  @return a generator of (match, start, end), as scanString
+    def scan_anchors(self, text, production):
+        if not production.streamlined:
+            production.streamline()
+        if not production.keepTabs:
+            text = text.expandtabs()
+        text_length = len( text )
+        ParserElement.resetCache()
+        loc = 0
+        try:
+            while loc <= text_length:
+                anchor = self.anchor.search( text, loc )
+                if None == anchor:
+                    break
+                loc = anchor.start()
+                try:
+                    preloc = production.preParse( text, loc )
+                    end, match = production._parse( text, preloc, callPreParse=False )
+                except ParseException:
+                    loc = loc + 1
+                else:
+                    if end > loc:
+                        yield match, preloc, end
+                        loc = end
+                    else:
+                        loc = preloc + 1
+        except ParseBaseException, e:
+            # As scanString does, drop pyparsing's stack from the traceback
+            raise e
+
+## The parse results of a Group of a tree production, see
+#   GrammarLibrary.get_tree_production: a list of the results, which
+#   stands in for them within the results of the production around it,
+#   and the normalized parse tree that the grammar built from them when
+#   the Group matched, so that the tree of the production around it is
+#   built from its tree rather than from its results again.
+class ParseTreeGroup(list):
+
+    ## @param[in] tokens The parse results of the Group
+    #  @param[in] node The normalized parse tree of the results
+    def __init__(self, tokens, node):
+        list.__init__(self, tokens)
+        self.node = node
+
+## The newline that a LineEnd of a capture production matched, see
+#   GrammarLibrary.get_capture_production, with the offset of the line
+#   that it begins
+class CapturedLineEnd(str):
+    starts = None
+
+## The parse results of a Group of a capture production: a list of the
+#   results, which stands in for them within the results of the
+#   production around it, and the offsets of the lines that the
+#   newlines within them begin, so that those of a match are found 
+#   without walking its results.
+class CapturedGroup(list):
+
+    ## @param[in] tokens The parse results of the Group
+    def __init__(self, tokens):
+        list.__init__(self, tokens)
+        self.starts = get_captured_starts( tokens )
+
+## @param[in] tokens The parse results of a capture production, or of a
+#    Group within it
+#  @return the offsets of the lines that the newlines within the results
+#    begin, see CapturedGroup
+def get_captured_starts(tokens):
+    starts = []
+    for token in tokens:
+        if isinstance( token, ( CapturedGroup, CapturedLineEnd ) ):
+            starts.extend( token.starts )
+    return starts
+
+## Get the offsets at which the lines of a match of a capture
+#   production begin
+#
+#  @param[in] match The parse results of the match
+#  @param[in] start The offset at which the match begins
+#  @return a sorted tuple of the offsets
+def get_captured_line_starts(match, start):
+    starts = set( get_captured_starts( match ) )
+    starts.add( start )
+    return tuple( sorted( starts ) )
+
+## A packrat cache that holds at most max_size results.  When it is
+#   full, the oldest result is dropped to make room for the next one.
+#   pyparsing only uses membership, lookup, assignment, and clear.
+class PackratCache(dict):
+
+    def __init__(self, max_size):
+        dict.__init__(self)
+        self.max_size = max_size
+        self.keys_by_age = collections.deque()
+
+    def __setitem__(self, key, value):
+        if not key in self:
+            if len(self.keys_by_age) >= self.max_size:
+                dict.__delitem__( self, self.keys_by_age.popleft() )
+            self.keys_by_age.append( key )
+        dict.__setitem__( self, key, value )
+
+    def clear(self):
+        dict.clear(self)
+        self.keys_by_age.clear()
+
+## Counts, for each named production of a set of grammars, how often
+#   it was attempted, how often it matched, how often it failed (and so
+#   made its caller backtrack), and the time spent in it, including the
+#   time spent in the productions within it.
+#
+#  The productions are the pyparsing elements that a grammar class
+#   names.  pyparsing copies the elements that a production is built
+#   from, as does GrammarLibrary.get_tree_production, so the copies
+#   are recognized by their description once the elements are
+#   streamlined; elements with the same description (the start tags
+#   of the TEI divisions, for example) share a row named after all of
+#   them.  The native scanners do not run the productions,
+#   so their scans are counted by language name: a scan matches if the
+#   scanner accepted the text and fails if it left it to pyparsing.
+class GrammarProfile():
+
+    FIELD_NAMES = [ "production", "attempts", "matches", "failures", "seconds" ]
+    FORMATS = [ "table", "json" ]
+
+    # Production names by the id of each pyparsing element
+    production_names = None
+    # [ attempts, matches, failures, seconds ] by production name
+    counters = None
+
+    ## @param[in] grammar_instances The grammars whose productions to count
+    #  @return an empty profile
+    @staticmethod
+    def create(grammar_instances):
+        profile = GrammarProfile()
+        profile.production_names = {}
+        profile.counters = {}
+        for grammar_instance in grammar_instances:
+            profile.add_grammar( grammar_instance )
+        return profile
+
+    ## Name the elements of every production of a grammar
+    def add_grammar(self, grammar_instance):
+        grammar_name = grammar_instance.GRAMMAR_NAME
+        elements = [ ( attribute_name, element ) for attribute_name, element\
+                         in sorted( vars( grammar_instance.__class__ ).items() )\
+                         if isinstance( element, ParserElement ) ]
+        # Streamlining flattens the elements, so describe them afterwards
+        for attribute_name, element in elements:
+            element.streamline()
+        attribute_names = collections.defaultdict(list)
+        for attribute_name, element in elements:
+            attribute_names[ str(element) ].append( attribute_name )
+
+        library = GrammarLibrary()
+        for language_name in grammar_instance.get_language_names():
+            visited = set()
+            stack = [ grammar_instance.get_grammar( language_name ),\
+                          library.get_tree_production( language_name ) ]
+            if grammar_instance.get_captured_language_names( language_name ):
+                stack.append( library.get_capture_production( language_name ) )
+            while stack:
+                element = stack.pop()
+                if id(element) in visited:
+                    continue
+                visited.add( id(element) )
+                names = attribute_names.get( str(element) )
+                if None != names:
+                    self.production_names[ id(element) ] = grammar_name + ":" + "|".join( names )
+                stack.extend( getattr( element, "exprs", [] ) )
+                if None != getattr( element, "expr", None ):
+                    stack.append( element.expr )
+
+    ## Count one attempt of a production
+    #
+    #  @param[in] production_name
+    #  @param[in] matched True if the production matched
+    #  @param[in] elapsed The seconds spent in the attempt
+    def record(self, production_name, matched, elapsed):
+        counter = self.counters.get( production_name )
+        if None == counter:
+            counter = [ 0, 0, 0, 0.0 ]
+            self.counters[production_name] = counter
+        counter[0] = counter[0] + 1
+        if matched:
+            counter[1] = counter[1] + 1
+        else:
+            counter[2] = counter[2] + 1
+        counter[3] = counter[3] + elapsed
+
+    ## Add the counts of another profile of the same grammars, such as
+    #   that of a worker process, see xutools.corpus.run_task
+    #
+    #  @param[in] counters The counters of the other profile
+    def merge(self, counters):
+        for production_name, other_counter in counters.items():
+            counter = self.counters.get( production_name )
+            if None == counter:
+                counter = [ 0, 0, 0, 0.0 ]
+                self.counters[production_name] = counter
+            for idx, value in enumerate( other_counter ):
+                counter[idx] = counter[idx] + value
+
+    ## Count one scan of a text by a native scanner, see record
+    #
+    #  @param[in] language_names The languages scanned for
+    def record_scanner(self, language_names, matched, elapsed):
+        self.record( " ".join( language_names ) + " (native)", matched, elapsed )
+
+    ## @return a list of [ production, attempts, matches, failures,
+    #    seconds ], the slowest production first
+    def get_rows(self):
+        rows = [ [ production_name ] + counter for production_name, counter in self.counters.items() ]
+        rows.sort( key=lambda row: ( -row[4], row[0] ) )
+        return rows
+
+    ## @return the profile as a table, one line per production
+    def format_table(self):
+        rows = [ row[:4] + [ "%.6f" % row[4] ] for row in self.get_rows() ]
+        rows = [ self.FIELD_NAMES ] + [ [ str(value) for value in row ] for row in rows ]
+        widths = [ max( [ len( row[idx] ) for row in rows ] ) for idx in range( len( self.FIELD_NAMES ) ) ]
+        lines = []
+        for row in rows:
+            lines.append( "  ".join( [ row[0].ljust( widths[0] ) ] +\
+                                         [ value.rjust( width ) for value, width in zip( row[1:], widths[1:] ) ] ) )
+        return "\n".join( lines )
+
+    ## @return the profile as a JSON list of objects, one per production
+    def format_json(self):
+        return json.dumps( [ dict( zip( self.FIELD_NAMES, row ) ) for row in self.get_rows() ], indent=1, sort_keys=True )
+
+    ## Write the profile in one of FORMATS
+    #
+    #  @param[in] format_name "table" or "json"
+    #  @param[in] fp The file to write to
+    def write(self, format_name, fp):
+        if "json" == format_name:
+            fp.write( self.format_json() + "\n" )
+        else:
+            fp.write( self.format_table() + "\n" )
+
+## Limits on the time and the number of steps (attempts of a pyparsing
+#   element) that the grammar may take to scan one text, so that a
+#   malformed text on which a production backtracks to the end of the
+#   text again and again (an unclosed TEI division, for example) cannot
+#   stall a batch.  The budget runs from start to stop, see
+#   xutools.corpus.scan_text; outside of a scan nothing is charged.
+#
+#  The texts that are skipped because they exceeded the budget are
+#   recorded as events, as (file path, label path, language names,
+#   reason).
+class ParseBudget():
+
+    # The clock is read once every CLOCK_INTERVAL steps
+    CLOCK_INTERVAL = 256
+
+    max_seconds = None
+    max_steps = None
+    steps = 0
+    deadline = None
+    running = False
+    events = None
+
+    ## @param[in] max_seconds The most seconds per text, or None
+    #  @param[in] max_steps The most steps per text, or None
+    #  @return the budget
+    @staticmethod
+    def create(max_seconds=None, max_steps=None):
+        budget = ParseBudget()
+        budget.max_seconds = max_seconds
+        budget.max_steps = max_steps
+        budget.events = []
+        return budget
+
+    ## Start charging the scan of a text
+    def start(self):
+        self.steps = 0
+        self.deadline = None
+        if None != self.max_seconds:
+            self.deadline = time.time() + self.max_seconds
+        self.running = True
+
+    ## Stop charging, see start
+    def stop(self):
+        self.running = False
+
+    ## Charge one step
+    #
+    #  @exception ParseBudgetExceeded if the scan is over budget
+    def charge(self):
+        if not self.running:
+            return
+        self.steps = self.steps + 1
+        if None != self.max_steps and self.steps > self.max_steps:
+            self.running = False
+            raise ParseBudgetExceeded( "more than " + str( self.max_steps ) + " parse steps" )
+        if None != self.deadline and 0 == self.steps % self.CLOCK_INTERVAL and time.time() > self.deadline:
+            self.running = False
+            raise ParseBudgetExceeded( "more than " + str( self.max_seconds ) + " seconds" )
+
+    ## Record a text that was skipped
+    #
+    #  @param[in] file_path The file that the text is from
+    #  @param[in] label_path The labels of the text within its file
+    #  @param[in] language_names The languages the text was scanned for
+    #  @param[in] reason The ParseBudgetExceeded, or its message
+    def add_event(self, file_path, label_path, language_names, reason):
+        self.events.append( ( file_path, tuple( label_path ), tuple( language_names ), str( reason ) ) )
+
+    ## @return a line that describes each event
+    def format_events(self):
+        return [ "skipped " + ":".join( ( file_path, ) + label_path[1:] ) + " for " + ", ".join( language_names ) +\
+                     ": " + reason for file_path, label_path, language_names, reason in self.events ]
 
 class GrammarLibrary():
     
@@ -28,6 +447,55 @@ class GrammarLibrary():
     TEIXML_GRAMMAR_NAME = "tei"
     XUPATH_GRAMMAR_NAME = "xupath"
 
+    # Grammar revisions by grammar name, see get_grammar_revision
+    grammar_revisions = {}
+
+    # The modules that every match depends upon, whatever its grammar:
+    #  the anchored scan of this module, and the bounds that
+    #  xutools.corpus adds to each match
+    REVISION_MODULE_NAMES = [ "xutools.grammar", "xutools.corpus" ]
+
+    # Tree productions by language name, see get_tree_production
+    tree_productions = {}
+
+    # Capture productions by language name, see get_capture_production
+    capture_productions = {}
+
+    # The language of lines, which a language may capture, see
+    #  LanguageRecord.captures_lines
+    LINE_LANGUAGE_NAME = BUILTIN_GRAMMAR_NAME + ":line"
+
+    # The default bound on the number of packrat results, see enable_packrat
+    PACKRAT_CACHE_SIZE = 100000
+
+    # The grammars are stateless, so every library shares one instance
+    #  of each grammar, and one record per language name.
+    grammar_instances = {}
+    language_records = {}
+
+    # The class of each grammar, by grammar name.  A grammar builds its
+    #  productions when its module is imported, so the module is only
+    #  imported when its grammar name is first requested, see
+    #  get_grammar_class.
+    grammar_class_paths = { BUILTIN_GRAMMAR_NAME:"xutools.grammar.pyparsing.BuiltinGrammar.BuiltinGrammar",\
+                                CISCOIOS_GRAMMAR_NAME:"xutools.grammar.pyparsing.CiscoIOSGrammar.CiscoIOSGrammar",\
+                                TEIXML_GRAMMAR_NAME:"xutools.grammar.pyparsing.TEIXMLGrammar.TEIXMLGrammar",\
+                                XUPATH_GRAMMAR_NAME:"xutools.grammar.pyparsing.XUPathGrammar.XUPathGrammar" }
+
+    # The class of each native scanner, by grammar name, see
+    #  xutools.grammar.native and get_scanner_class
+    scanner_class_paths = { BUILTIN_GRAMMAR_NAME:"xutools.grammar.native.BuiltinScanner.BuiltinScanner",\
+                                CISCOIOS_GRAMMAR_NAME:"xutools.grammar.native.CiscoIOSScanner.CiscoIOSScanner",\
+                                TEIXML_GRAMMAR_NAME:"xutools.grammar.native.TEIXMLScanner.TEIXMLScanner" }
+    native_scanners_enabled = True
+
+    # The grammars that a profile counts, see enable_profiling
+    PROFILED_GRAMMAR_NAMES = [ BUILTIN_GRAMMAR_NAME, CISCOIOS_GRAMMAR_NAME, TEIXML_GRAMMAR_NAME ]
+    profile = None
+
+    # The limits on a scan, see set_parse_budget
+    parse_budget = None
+
     # Given a language name, return the path to the grammar 
     #  in which that language construct is specified.
     #
@@ -52,18 +520,211 @@ class GrammarLibrary():
         [ grammar_name, production_name ] = language_name.split(':')
         return production_name
 
+    # Memoize the result of every production at every location of the
+    #  text being scanned, so that the productions that backtrack (the 
+    #  TEI sections, the IOS configuration regions) do not parse the
+    #  same text twice.  The cache is cleared before and after each
+    #  text is scanned, so it does not grow across a corpus.  This is
+    #  process-wide, as is pyparsing's packrat mode.
+    #
+    # @param[in] cache_size The most results to hold at once
+    @staticmethod
+    def enable_packrat(cache_size=PACKRAT_CACHE_SIZE):
+        ParserElement._exprArgCache = PackratCache( cache_size )
+        ParserElement._packratEnabled = True
+        GrammarLibrary.install_parse()
+
+    # Stop memoizing, see enable_packrat
+    @staticmethod
+    def disable_packrat():
+        ParserElement._packratEnabled = False
+        ParserElement._exprArgCache = {}
+        GrammarLibrary.install_parse()
+
+    # @return true if packrat memoization is enabled
+    @staticmethod
+    def is_packrat_enabled():
+        return ParserElement._packratEnabled
+
+    # Drop the memoized results, and with them the text they refer to
+    @staticmethod
+    def clear_packrat_cache():
+        ParserElement.resetCache()
+
+    # Count the attempts, matches, failures, and time of every production
+    #  of the grammars in PROFILED_GRAMMAR_NAMES, and of every scan by a
+    #  native scanner, see GrammarProfile.  Memoized results are counted
+    #  as attempts.  The workers of a multiprocessing.Pool inherit the
+    #  profile when they are created, so enable it before creating the
+    #  pool; the counts of each of their tasks are added to the profile
+    #  of this process, see xutools.corpus.run_task.
+    #
+    # @return the profile, which counts until profiling is disabled
+    @staticmethod
+    def enable_profiling():
+        library = GrammarLibrary()
+        GrammarLibrary.profile = GrammarProfile.create( [ library.get_grammar_instance_for_name( grammar_name )\
+                                                              for grammar_name in GrammarLibrary.PROFILED_GRAMMAR_NAMES ] )
+        GrammarLibrary.install_parse()
+        return GrammarLibrary.profile
+
+    # Stop profiling, see enable_profiling
+    #
+    # @return the profile, or None if profiling was not enabled
+    @staticmethod
+    def disable_profiling():
+        profile = GrammarLibrary.profile
+        GrammarLibrary.profile = None
+        GrammarLibrary.install_parse()
+        return profile
+
+    # @return the profile being counted, or None if profiling is disabled
+    @staticmethod
+    def get_profile():
+        return GrammarLibrary.profile
+
+    # Limit the time and the number of steps that the grammar may take
+    #  to scan one text, see ParseBudget.  A budget without limits 
+    #  removes the budget.  The workers of a multiprocessing.Pool inherit
+    #  the budget when they are created, so set it before creating the
+    #  pool.
+    #
+    # @param[in] max_seconds The most seconds per text, or None
+    # @param[in] max_steps The most steps per text, or None
+    # @return the budget, or None if there are no limits
+    @staticmethod
+    def set_parse_budget(max_seconds=None, max_steps=None):
+        GrammarLibrary.parse_budget = None
+        if None != max_seconds or None != max_steps:
+            GrammarLibrary.parse_budget = ParseBudget.create( max_seconds, max_steps )
+        GrammarLibrary.install_parse()
+        return GrammarLibrary.parse_budget
+
+    # Packrat memoization, the parse budget, and profiling each replace
+    #  the parse method of every pyparsing element.  Rather than wrap
+    #  whatever method is installed, so that turning one off could undo
+    #  another, build the method from the current settings whenever one
+    #  of them changes: the budget is charged for every attempt, and the
+    #  profile times the attempts of its productions.
+    @staticmethod
+    def install_parse():
+        if ParserElement._packratEnabled:
+            parse = ParserElement._parseCache
+        else:
+            parse = ParserElement._parseNoCache
+
+        budget = GrammarLibrary.parse_budget
+        if None != budget:
+            unbudgeted_parse = parse
+            def budgeted_parse(element, instring, loc, doActions=True, callPreParse=True):
+                budget.charge()
+                return unbudgeted_parse( element, instring, loc, doActions, callPreParse )
+            parse = budgeted_parse
+
+        profile = GrammarLibrary.profile
+        if None != profile:
+            unprofiled_parse = parse
+            production_names = profile.production_names
+            def profiled_parse(element, instring, loc, doActions=True, callPreParse=True):
+                production_name = production_names.get( id(element) )
+                if None == production_name:
+                    return unprofiled_parse( element, instring, loc, doActions, callPreParse )
+                start_time = time.time()
+                try:
+                    result = unprofiled_parse( element, instring, loc, doActions, callPreParse )
+                except ParseBaseException:
+                    profile.record( production_name, False, time.time() - start_time )
+                    raise
+                profile.record( production_name, True, time.time() - start_time )
+                return result
+            parse = profiled_parse
+
+        ParserElement._parse = parse
+
+    # @return the budget, or None if scans are not limited
+    @staticmethod
+    def get_parse_budget():
+        return GrammarLibrary.parse_budget
+
+    # Start charging the scan of a text to the budget, if there is one
+    @staticmethod
+    def start_parse_budget():
+        if None != GrammarLibrary.parse_budget:
+            GrammarLibrary.parse_budget.start()
+
+    # Stop charging, see start_parse_budget
+    @staticmethod
+    def stop_parse_budget():
+        if None != GrammarLibrary.parse_budget:
+            GrammarLibrary.parse_budget.stop()
+
+    # Choose whether to scan with the native scanners, where there are
+    #  any, or always with pyparsing.  The two give the same matches.
+    #
+    # @param[in] enabled True to use the native scanners
+    @staticmethod
+    def set_native_scanners_enabled(enabled):
+        GrammarLibrary.native_scanners_enabled = enabled
+        GrammarLibrary.language_records.clear()
+
     # Given a language name, get the parser used to recognize
     #  strings in that language.
     #
     # @param[in] language_name
     # @return The parser for the specified language
     def get_grammar(self, language_name):
-        grammar_name = self.get_grammar_name( language_name )
-        grammar = None
+        return self.get_language_record( language_name ).production
 
-        grammar_instance = self.get_grammar_instance(language_name)
-        grammar = grammar_instance.get_grammar(language_name)
-        return grammar
+    # Given a language name, get its grammar instance, production, and 
+    #  label function.  Each language name is resolved once.
+    #
+    # @param[in] language_name
+    # @return The LanguageRecord for the specified language
+    def get_language_record(self, language_name):
+        record = GrammarLibrary.language_records.get( language_name )
+        if None == record:
+            grammar_instance = self.get_grammar_instance( language_name )
+            scanner_instance = None
+            scanner_class = GrammarLibrary.get_scanner_class( self.get_grammar_name( language_name ) )
+            if GrammarLibrary.native_scanners_enabled and None != scanner_class:
+                scanner_instance = scanner_class()
+            record = LanguageRecord.create( language_name, grammar_instance, scanner_instance )
+            GrammarLibrary.language_records[language_name] = record
+        return record
+
+    # Find the strings in a text that belong to each of several language
+    #  names.  The languages of a grammar whose native scanner can scan
+    #  for several productions at once are found in one pass over the
+    #  text; the others are scanned for one at a time.
+    #
+    # @param[in] text The text to scan
+    # @param[in] language_names The languages that we want to extract
+    # @return a dictionary of lists of (start, end, label), by language name
+    def scan_many(self, text, language_names):
+        records_by_grammar = collections.defaultdict(list)
+        for language_name in language_names:
+            record = self.get_language_record( language_name )
+            records_by_grammar[ self.get_grammar_name( language_name ) ].append( record )
+
+        results = {}
+        for records in records_by_grammar.values():
+            scanner_instance = records[0].scanner_instance
+            if None != scanner_instance and hasattr( scanner_instance, "scan_many" ) and\
+                    not None in [ record.scanner for record in records ]:
+                language_names = [ record.language_name for record in records ]
+                start_time = time.time()
+                matches = scanner_instance.scan_many( text, language_names )
+                if None != GrammarLibrary.profile:
+                    GrammarLibrary.profile.record_scanner( language_names, None != matches,\
+                                                               time.time() - start_time )
+                if None == matches:
+                    matches = dict( [ ( record.language_name, list( record.scan_production( text ) ) )\
+                                          for record in records ] )
+            else:
+                matches = dict( [ ( record.language_name, list( record.scan( text ) ) )\
+                                      for record in records ] )
+            results.update( matches )
+        return results
 
     # Given a path to a grammar library, return a list of 
     #   grammars defined within that library
@@ -80,31 +741,208 @@ class GrammarLibrary():
     # @param[in] grammar_name
     # @return A list of grammars within that library
     def get_language_names(self, grammar_name):
-        if ( XUPATH_GRAMMAR_NAME == grammar_name ):
-            return XUPathGrammar.get_language_names()
-        else:
-            raise NotImplementedError("Coming soon...")
+        return self.get_grammar_instance_for_name( grammar_name ).get_language_names()
     
     def get_grammar_instance(self, language_name):
-        grammar_name = self.get_grammar_name( language_name )
-        grammar_instance = None
-        if ( self.BUILTIN_GRAMMAR_NAME == grammar_name ):
-            grammar_instance = BuiltinGrammar()
-        elif ( self.CISCOIOS_GRAMMAR_NAME == grammar_name ):
-            grammar_instance = CiscoIOSGrammar()
-        elif ( self.TEIXML_GRAMMAR_NAME == grammar_name ):
-            grammar_instance = TEIXMLGrammar()
-        elif ( self.XUPATH_GRAMMAR_NAME == grammar_name ):
-            grammar_instance = XUPathGrammar()
-        else:
+        return self.get_grammar_instance_for_name( self.get_grammar_name( language_name ) )
+
+    # Given a grammar name, get the instance of the grammar
+    #
+    # @param[in] grammar_name
+    # @return The instance shared by every library
+    def get_grammar_instance_for_name(self, grammar_name):
+        grammar_instance = GrammarLibrary.grammar_instances.get( grammar_name )
+        if None != grammar_instance:
+            return grammar_instance
+        grammar_class = GrammarLibrary.get_grammar_class( grammar_name )
+        if None == grammar_class:
             raise NotImplementedError("Coming soon...")
+        grammar_instance = grammar_class()
+        GrammarLibrary.grammar_instances[grammar_name] = grammar_instance
         return grammar_instance
+
+    # Given a grammar name, import the module of its grammar
+    #
+    # @param[in] grammar_name
+    # @return The grammar class, or None if there is no such grammar
+    @staticmethod
+    def get_grammar_class(grammar_name):
+        class_path = GrammarLibrary.grammar_class_paths.get( grammar_name )
+        if None == class_path:
+            return None
+        return import_class( class_path )
+
+    # Given a grammar name, import the module of its native scanner
+    #
+    # @param[in] grammar_name
+    # @return The scanner class, or None if the grammar has no scanner
+    @staticmethod
+    def get_scanner_class(grammar_name):
+        class_path = GrammarLibrary.scanner_class_paths.get( grammar_name )
+        if None == class_path:
+            return None
+        return import_class( class_path )
         
+    # Given a language name, get a digest of the source of the grammar
+    #  that specifies it, and of the modules that its matches depend
+    #  upon (its native scanner, and REVISION_MODULE_NAMES), so that
+    #  results computed with one revision of a grammar are not confused
+    #  with those of another.  A module installed without its source is
+    #  read from its compiled file instead.
+    #
+    # @param[in] language_name
+    # @return The revision of the grammar for the specified language,
+    #   or None if a module could not be read, in which case there is
+    #   no revision to tell results apart by
+    def get_grammar_revision(self, language_name):
+        grammar_name = self.get_grammar_name( language_name )
+        if not grammar_name in GrammarLibrary.grammar_revisions:
+            modules = [ inspect.getmodule( self.get_grammar_instance( language_name ).__class__ ) ]
+            scanner_class = GrammarLibrary.get_scanner_class( grammar_name )
+            if None != scanner_class:
+                modules.append( inspect.getmodule( scanner_class ) )
+            modules.extend( [ importlib.import_module( module_name )\
+                                  for module_name in GrammarLibrary.REVISION_MODULE_NAMES ] )
+            digest = hashlib.sha1()
+            revision = None
+            try:
+                for module in modules:
+                    digest.update( read_module_source( module ) )
+                revision = digest.hexdigest()
+            except ( IOError, TypeError ):
+                pass
+            GrammarLibrary.grammar_revisions[grammar_name] = revision
+        return GrammarLibrary.grammar_revisions[grammar_name]
+
+    # Given a language name, get a copy of its production that builds
+    #  the normalized parse tree that xudiff compares as it parses, so
+    #  that parseString returns the tree rather than parse results to
+    #  be walked again: each Group within the copy builds the tree of
+    #  its match when it matches, from the trees of the Groups within
+    #  it, see ParseTreeGroup, and the copy builds the tree of its own
+    #  match last.  The tree is the one normalize_parse_tree builds
+    #  from the parse results of the production.  Each copy is made 
+    #  once.
+    #
+    # @param[in] language_name
+    # @return the copy of the production, whose match is the tree
+    def get_tree_production(self, language_name):
+        tree_production = GrammarLibrary.tree_productions.get( language_name )
+        if None == tree_production:
+            normalize = self.get_grammar_instance( language_name ).normalize_parse_tree
+            def build_group(instring, loc, tokens):
+                group_tokens = tokens[0]
+                tokens[0] = ParseTreeGroup( group_tokens, normalize( group_tokens ) )
+            def build_tree(instring, loc, tokens):
+                return [ normalize( tokens ) ]
+            def get_action(element):
+                if isinstance( element, Group ):
+                    return build_group
+                return None
+            production = self.get_grammar( language_name )
+            tree_production = copy_with_actions( production, get_action, {} )
+            if tree_production is production:
+                tree_production = production.copy()
+            tree_production.addParseAction( build_tree )
+            GrammarLibrary.tree_productions[language_name] = tree_production
+        return tree_production
+
+    # Given a language that captures lines, get a copy of its production
+    #  whose LineEnds record the offset of the line that each newline
+    #  they match begins, and whose Groups gather the offsets within
+    #  them, see CapturedGroup, so that the offsets at which the lines
+    #  of a match begin are read from its parse results, see
+    #  LanguageRecord.scan.  Each copy is made once.
+    #
+    # @param[in] language_name
+    # @return the copy of the production
+    def get_capture_production(self, language_name):
+        capture_production = GrammarLibrary.capture_productions.get( language_name )
+        if None == capture_production:
+            def capture_line_end(instring, loc, tokens):
+                # At the end of the text a LineEnd matches nothing
+                if tokens:
+                    tokens[0] = CapturedLineEnd( tokens[0] )
+                    tokens[0].starts = [ loc + 1 ]
+            def capture_group(instring, loc, tokens):
+                tokens[0] = CapturedGroup( tokens[0] )
+            def get_action(element):
+                if isinstance( element, Group ):
+                    return capture_group
+                elif isinstance( element, LineEnd ):
+                    return capture_line_end
+                return None
+            capture_production = copy_with_actions( self.get_grammar( language_name ), get_action, {} )
+            GrammarLibrary.capture_productions[language_name] = capture_production
+        return capture_production
+
+    # Given the parse results of a production, build the normalized
+    #  parse tree that xudiff compares, see get_tree_production
+    #
+    # @param[in] language_name
+    # @param[in] parse_tree The parse results
+    # @return the normalized parse tree
     def normalize_parse_tree(self, language_name, parse_tree ):
         grammar = self.get_grammar_instance( language_name )
-        ptl = parse_tree.asList()
-        normalized_parse_tree = grammar.normalize_parse_tree( ptl )
+        normalized_parse_tree = grammar.normalize_parse_tree( parse_tree )
         return normalized_parse_tree
-        
-    
-    
+
+## Copy an element of a production, and the elements within it, so 
+#   that some of them run a parse action as well.  Only the elements
+#   that run an action, or that lead to one that does, are copied; the
+#   others are shared with the production.
+#
+#  @param[in] element The element to copy
+#  @param[in] get_action A function of an element that returns the
+#    parse action to add to it, or None
+#  @param[in] copies The copies made so far, by the id of each element
+#  @return the copy, or the element itself if no action was added
+def copy_with_actions(element, get_action, copies):
+    if id(element) in copies:
+        return copies[ id(element) ]
+    copy = element
+    exprs = getattr( element, "exprs", None )
+    expr = getattr( element, "expr", None )
+    if None != exprs:
+        copied_exprs = [ copy_with_actions( child, get_action, copies ) for child in exprs ]
+        if [ child for child, copied in zip( exprs, copied_exprs ) if not child is copied ]:
+            copy = element.copy()
+            copy.exprs = copied_exprs
+    elif None != expr:
+        copied_expr = copy_with_actions( expr, get_action, copies )
+        if not expr is copied_expr:
+            copy = element.copy()
+            copy.expr = copied_expr
+    action = get_action( element )
+    if None != action:
+        if copy is element:
+            copy = element.copy()
+        copy.addParseAction( action )
+    copies[ id(element) ] = copy
+    return copy
+
+## Read the source of a module, or its compiled file if it was 
+#   installed without its source
+#
+#  @param[in] module The module
+#  @exception IOError if neither can be read
+#  @return the contents of the file
+def read_module_source(module):
+    module_path = inspect.getsourcefile( module )
+    if None == module_path:
+        module_path = inspect.getfile( module )
+    fp = open( module_path, 'rb' )
+    try:
+        return fp.read()
+    finally:
+        fp.close()
+
+## Import a class by its dotted path; Python caches the module, so only
+#   the first import of a module runs it
+#
+#  @param[in] class_path The module path and the class name
+#  @return the class
+def import_class(class_path):
+    module_name, class_name = class_path.rsplit( ".", 1 )
+    module = __import__( module_name, fromlist=[ class_name ] )
+    return getattr( module, class_name )
@@ -0,0 +1,102 @@
+"""
+copyright (c) 2013 Gabriel A. Weaver <gabriel.a.l.weaver@gmail.com>
+
+This file is part of XUTools, Python Distribution.
+
+This code is free software:  you can redistribute
+it and/or modify it under the terms of the GNU General Public
+License as published by the Free Software Foundation, either version
+3 of the License, or (at your option) any later version.
+
+XUTools is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see http://www.gnu.org/licenses/
+"""
+import itertools
+from xutools.exceptions import UndefinedLanguageName
+from xutools.grammar.pyparsing.BuiltinGrammar import BuiltinGrammar
+
+## @package xutools.grammar.native
+
+## A scanner for builtin:line driven by the offsets of the newlines in
+#   the text, found with numpy when it is installed.
+#
+#  BuiltinGrammar.line matches each line with its newline, including
+#   empty lines, and the rest of the text after the last newline if it
+#   is not empty.  As with scanString, the offsets are relative to the
+#   text with its tabs expanded, and each match is labelled by its index.
+class BuiltinScanner():
+
+    ## Set to False to find newlines without numpy
+    use_numpy = True
+
+    # Given a language name, get the function that scans a text for
+    #  strings in that language
+    #
+    # @param[in] language_name
+    # @exception UndefinedLanguageName if the language name was not found
+    # @return a function of a text that yields (start, end, label)
+    def get_scanner(self, language_name):
+        if ( BuiltinGrammar.LINE == language_name ):
+            return self.scan_lines
+        else:
+            raise UndefinedLanguageName("Unable to find language name:" + language_name +\
+                                            " in BuiltinScanner")
+
+    # Get all language names
+    #
+    # @return an array of all language names that this scanner recognizes
+    def get_language_names(self):
+        return [ BuiltinGrammar.LINE ]
+
+    ## Scan a text for its lines
+    #
+    #  @param[in] text The text to scan
+    #  @return an iterator of (start, end, label)
+    def scan_lines(self, text):
+        if "\t" in text:
+            text = text.expandtabs()
+        text_length = len(text)
+        ends = self.find_line_ends( text )
+
+        starts = [ 0 ] + ends
+        last_start = starts[-1]
+        if last_start < text_length:
+            ends.append( text_length )
+        else:
+            starts.pop()
+        return itertools.izip( starts, ends, itertools.imap( str, itertools.count() ) )
+
+    ## @return a list of the offsets just past each newline in the text
+    def find_line_ends(self, text):
+        numpy = get_numpy()
+        if self.use_numpy and None != numpy and isinstance( text, str ):
+            newlines = numpy.flatnonzero( numpy.frombuffer( text, numpy.uint8 ) == ord("\n") )
+            return ( newlines + 1 ).tolist()
+
+        ends = []
+        newline = text.find("\n")
+        while -1 != newline:
+            ends.append( newline + 1 )
+            newline = text.find( "\n", newline + 1 )
+        return ends
+
+## numpy is optional, and slow to import, so we import it on first use
+numpy_module = None
+
+## @return the numpy module, or None if it is not installed
+def get_numpy():
+    global numpy_module
+    if None == numpy_module:
+        try:
+            import numpy
+            numpy_module = numpy
+        except ImportError:
+            numpy_module = False
+    if False == numpy_module:
+        return None
+    return numpy_module
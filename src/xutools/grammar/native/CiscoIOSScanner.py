@@ -0,0 +1,332 @@
+"""
+copyright (c) 2013 Gabriel A. Weaver <gabriel.a.l.weaver@gmail.com>
+
+This file is part of XUTools, Python Distribution.
+
+This code is free software:  you can redistribute
+it and/or modify it under the terms of the GNU General Public
+License as published by the Free Software Foundation, either version
+3 of the License, or (at your option) any later version.
+
+XUTools is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see http://www.gnu.org/licenses/
+"""
+from pyparsing import Keyword
+import re
+from xutools.exceptions import UndefinedLanguageName
+from xutools.grammar.pyparsing.CiscoIOSGrammar import CiscoIOSGrammar
+
+## @package xutools.grammar.native
+#    Scanners that report exactly the matches, offsets, and labels that
+#    scanString would for a grammar in xutools.grammar.pyparsing.
+
+## A line-oriented scanner for the block productions of CiscoIOSGrammar.
+#
+#  IOS configurations are structured by lines and indentation, so
+#   rather than attempting each production at every character offset,
+#   we jump from one line that starts with a block keyword to the next
+#   and consume the block a line at a time.
+#
+#  The offsets are those of scanString: they are relative to the text
+#   with its tabs expanded, and a block that runs to the end of the
+#   text ends one past it, where LineEnd matches.
+class CiscoIOSScanner():
+
+    ## (keyword, minimum number of indented lines, block end required)
+    #   for each block production; see CiscoIOSGrammar
+    BLOCKS = { CiscoIOSGrammar.INTERFACE:( "interface", 1, True ),\
+                   CiscoIOSGrammar.VLAN:( "vlan", 1, True ),\
+                   CiscoIOSGrammar.CRYPTO:( "crypto", 0, True ),\
+                   CiscoIOSGrammar.ROUTER:( "router", 0, True ),\
+                   CiscoIOSGrammar.CLASS_MAP:( "class-map", 0, False ),\
+                   CiscoIOSGrammar.POLICY_MAP:( "policy-map", 0, False ) }
+
+    ## The alternatives of configFileRegion, in order
+    CONFIG_BLOCKS = [ BLOCKS[CiscoIOSGrammar.INTERFACE],\
+                          BLOCKS[CiscoIOSGrammar.CRYPTO],\
+                          BLOCKS[CiscoIOSGrammar.VLAN],\
+                          BLOCKS[CiscoIOSGrammar.CLASS_MAP],\
+                          BLOCKS[CiscoIOSGrammar.POLICY_MAP] ]
+
+    ADDRESS_FAMILY = "address-family"
+    KEYWORD_CHARS = Keyword.DEFAULT_KEYWORD_CHARS
+
+    ## The lines on which a match may start, by language name
+    block_starts = dict( [ ( language_name, re.compile( "^" + re.escape( block[0] ), re.M ) )\
+                               for language_name, block in BLOCKS.items() ] )
+    any_block_starts = re.compile( "^(?:" + "|".join( [ re.escape( block[0] ) for block in BLOCKS.values() ] ) + ")", re.M )
+    config_starts = re.compile( "^(?:" + "|".join( [ re.escape( block[0] ) for block in CONFIG_BLOCKS ] ) +\
+                                    "| *" + ADDRESS_FAMILY + ")", re.M )
+
+    # Given a language name, get the function that scans a text for
+    #  strings in that language
+    #
+    # @param[in] language_name
+    # @exception UndefinedLanguageName if the language name was not found
+    # @return a function of a text that yields (start, end, label)
+    def get_scanner(self, language_name):
+        if ( CiscoIOSGrammar.CONFIG == language_name ):
+            return self.scan_config
+        elif ( language_name in self.BLOCKS ):
+            return lambda text: self.scan_block( text, language_name )
+        else:
+            raise UndefinedLanguageName("Unable to find language name:" + language_name +\
+                                            " in CiscoIOSScanner")
+
+    # Given a language name, get the function that scans a text for
+    #  strings in that language and the lines of each, see scan_block
+    #
+    # @param[in] language_name
+    # @exception UndefinedLanguageName if the language name was not found
+    # @return a function of a text that yields (start, end, label, line starts)
+    def get_line_scanner(self, language_name):
+        if ( CiscoIOSGrammar.CONFIG == language_name ):
+            return lambda text: self.scan_config( text, True )
+        elif ( language_name in self.BLOCKS ):
+            return lambda text: self.scan_block( text, language_name, True )
+        else:
+            raise UndefinedLanguageName("Unable to find language name:" + language_name +\
+                                            " in CiscoIOSScanner")
+
+    # Get all language names
+    #
+    # @return an array of all language names that this scanner recognizes
+    def get_language_names(self):
+        return [ CiscoIOSGrammar.CONFIG ] + sorted( self.BLOCKS.keys() )
+
+    ## Scan a text for the blocks of one production
+    #
+    #  @param[in] text The text to scan
+    #  @param[in] language_name The block production
+    #  @param[in] capture_lines True to yield the offsets at which the
+    #    lines of each block begin as well, see CiscoIOSGrammar.CAPTURES
+    #  @return a generator of (start, end, label), or of (start, end,
+    #    label, line starts)
+    def scan_block(self, text, language_name, capture_lines=False):
+        text = text.expandtabs()
+        text_length = len(text)
+        block = self.BLOCKS[language_name]
+        block_starts = self.block_starts[language_name]
+        # Only interfaces are labelled by their first line
+        labelled = ( CiscoIOSGrammar.INTERFACE == language_name )
+
+        match_idx = 0
+        loc = 0
+        while loc < text_length:
+            block_start = block_starts.search( text, loc )
+            if None == block_start:
+                break
+            start = block_start.start()
+            line_starts = None
+            if capture_lines:
+                line_starts = []
+            end, label_start, label_end = self.match_block( text, text_length, start, block, line_starts )
+            if None == end:
+                loc = start + 1
+                continue
+            if labelled:
+                label = text[label_start:label_end].strip()
+            else:
+                label = str(match_idx)
+            if capture_lines:
+                yield ( start, end, label, tuple( line_starts ) )
+            else:
+                yield ( start, end, label )
+            match_idx = match_idx + 1
+            loc = end
+
+    ## Scan a text for the blocks of several productions at once.  The
+    #   block keywords are distinct, so each line that starts with one
+    #   starts a block of exactly one production; every production keeps
+    #   its own position, as it would if the text were scanned for it
+    #   alone.
+    #
+    #  @param[in] text The text to scan
+    #  @param[in] language_names The language names, see get_language_names
+    #  @return a dictionary of lists of (start, end, label), by language name
+    def scan_many(self, text, language_names):
+        text = text.expandtabs()
+        text_length = len(text)
+        results = dict( [ ( language_name, [] ) for language_name in language_names ] )
+        if CiscoIOSGrammar.CONFIG in results:
+            results[CiscoIOSGrammar.CONFIG] = list( self.scan_config( text ) )
+
+        language_names_by_keyword = dict( [ ( self.BLOCKS[language_name][0], language_name )\
+                                                for language_name in language_names\
+                                                if language_name in self.BLOCKS ] )
+        next_locs = dict( [ ( language_name, 0 ) for language_name in language_names ] )
+        loc = 0
+        while language_names_by_keyword and loc < text_length:
+            block_start = self.any_block_starts.search( text, loc )
+            if None == block_start:
+                break
+            start = block_start.start()
+            loc = start + 1
+            language_name = language_names_by_keyword.get( block_start.group(0) )
+            if None == language_name or start < next_locs[language_name]:
+                continue
+            end, label_start, label_end = self.match_block( text, text_length, start, self.BLOCKS[language_name] )
+            if None == end:
+                continue
+            matches = results[language_name]
+            if CiscoIOSGrammar.INTERFACE == language_name:
+                label = text[label_start:label_end].strip()
+            else:
+                label = str( len(matches) )
+            matches.append( ( start, end, label ) )
+            next_locs[language_name] = end
+        return results
+
+    ## Scan a text for runs of blocks, as configFileRegion does
+    #
+    #  @param[in] text The text to scan
+    #  @param[in] capture_lines See scan_block
+    #  @return a generator of (start, end, label), or of (start, end,
+    #    label, line starts)
+    def scan_config(self, text, capture_lines=False):
+        text = text.expandtabs()
+        text_length = len(text)
+
+        match_idx = 0
+        loc = 0
+        while loc < text_length:
+            config_start = self.config_starts.search( text, loc )
+            if None == config_start:
+                break
+            start = config_start.start()
+            line_starts = None
+            if capture_lines:
+                line_starts = []
+            end = self.match_config( text, text_length, start, line_starts )
+            if None == end:
+                loc = start + 1
+                continue
+            if capture_lines:
+                yield ( start, end, str(match_idx), tuple( line_starts ) )
+            else:
+                yield ( start, end, str(match_idx) )
+            match_idx = match_idx + 1
+            loc = end
+
+    ## Match one or more blocks, or else an address family, at a location
+    #
+    #  @param[in] line_starts A list to which to append the offset at
+    #    which each line of the match begins, or None
+    #  @return the end of the match, or None
+    def match_config(self, text, text_length, loc, line_starts=None):
+        end = loc
+        while True:
+            for block in self.CONFIG_BLOCKS:
+                block_end = self.match_block( text, text_length, end, block, line_starts )[0]
+                if None != block_end:
+                    break
+            else:
+                break
+            end = block_end
+        if end > loc:
+            return end
+        return self.match_address_family( text, text_length, loc, line_starts )
+
+    ## Match a block: its first line, its indented lines, and the '!'
+    #   line (and any blank lines) that closes it.
+    #
+    #  @param[in] line_starts A list to which to append the offset at
+    #    which each line of the block begins, or None; nothing is
+    #    appended if the block does not match
+    #  @return the end of the match and the bounds of the rest of the
+    #    first line, or Nones
+    def match_block(self, text, text_length, loc, block, line_starts=None):
+        keyword, min_lines, end_required = block
+        if not ( is_line_start( text, text_length, loc ) and text.startswith( keyword, loc ) ):
+            return None, None, None
+        label_start = loc + len(keyword)
+        label_end = find_line_end( text, text_length, label_start )
+        num_line_starts = None
+        if None != line_starts:
+            num_line_starts = len( line_starts )
+            line_starts.append( loc )
+
+        end, num_lines = match_indented_lines( text, text_length, next_line( text_length, label_end ), line_starts )
+        block_end = match_block_end( text, text_length, end, line_starts )
+        if num_lines < min_lines or ( None == block_end and end_required ):
+            if None != line_starts:
+                del line_starts[num_line_starts:]
+            return None, None, None
+        if None != block_end:
+            end = block_end
+        return end, label_start, label_end
+
+    ## Match an address-family line and the indented lines that follow it
+    #
+    #  @param[in] line_starts See match_config
+    #  @return the end of the match, or None
+    def match_address_family(self, text, text_length, loc, line_starts=None):
+        if not is_line_start( text, text_length, loc ):
+            return None
+        keyword_start = loc
+        while keyword_start < text_length and " " == text[keyword_start]:
+            keyword_start = keyword_start + 1
+        keyword_end = keyword_start + len( self.ADDRESS_FAMILY )
+        if not text.startswith( self.ADDRESS_FAMILY, keyword_start ):
+            return None
+        if keyword_end < text_length and text[keyword_end] in self.KEYWORD_CHARS:
+            return None
+        line_end = find_line_end( text, text_length, keyword_end )
+        if None != line_starts:
+            line_starts.append( loc )
+        end, num_lines = match_indented_lines( text, text_length, next_line( text_length, line_end ), line_starts )
+        return end
+
+## @return true if loc is at the start of a line (LineStart)
+def is_line_start(text, text_length, loc):
+    return 0 == loc or ( loc <= text_length and "\n" == text[loc - 1] )
+
+## @return the offset of the newline that ends the line at loc, or the
+#   length of the text (restOfLine)
+def find_line_end(text, text_length, loc):
+    line_end = text.find( "\n", loc )
+    if -1 == line_end:
+        return text_length
+    return line_end
+
+## @return the offset just past the end of a line (LineEnd)
+def next_line(text_length, line_end):
+    return line_end + 1
+
+## Match zero or more lines that start with a space (indentedLineRegion)
+#
+#  @param[in] line_starts A list to which to append the offset at which
+#    each line begins, or None
+#  @return the end of the match and the number of lines
+def match_indented_lines(text, text_length, loc, line_starts=None):
+    num_lines = 0
+    while loc < text_length and " " == text[loc] and is_line_start( text, text_length, loc ):
+        if None != line_starts:
+            line_starts.append( loc )
+        loc = next_line( text_length, find_line_end( text, text_length, loc ) )
+        num_lines = num_lines + 1
+    return loc, num_lines
+
+## Match a '!' line and the newlines that follow it (blockEnd)
+#
+#  @param[in] line_starts A list to which to append the offset at which
+#    the '!' line and each blank line after it begin, or None
+#  @return the end of the match, or None
+def match_block_end(text, text_length, loc, line_starts=None):
+    if not ( loc < text_length and "!" == text[loc] and is_line_start( text, text_length, loc ) ):
+        return None
+    if None != line_starts:
+        line_starts.append( loc )
+    loc = loc + 1
+    while loc < text_length and "\n" == text[loc]:
+        loc = loc + 1
+        if None != line_starts and loc < text_length and "\n" == text[loc]:
+            line_starts.append( loc )
+    if loc == text_length:
+        loc = loc + 1
+    return loc
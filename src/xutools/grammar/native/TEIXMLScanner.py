@@ -0,0 +1,279 @@
+"""
+copyright (c) 2013 Gabriel A. Weaver <gabriel.a.l.weaver@gmail.com>
+
+This file is part of XUTools, Python Distribution.
+
+This code is free software:  you can redistribute
+it and/or modify it under the terms of the GNU General Public
+License as published by the Free Software Foundation, either version
+3 of the License, or (at your option) any later version.
+
+XUTools is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see http://www.gnu.org/licenses/
+"""
+import re
+from xml.parsers import expat
+from xutools.exceptions import UndefinedLanguageName
+from xutools.grammar.pyparsing.TEIXMLGrammar import TEIXMLGrammar
+
+## @package xutools.grammar.native
+
+## Raised when a text contains markup for which we cannot guarantee the
+#   matches of TEIXMLGrammar, so that it must be scanned with pyparsing
+class UnsupportedMarkup(Exception):
+    pass
+
+## An event-driven scanner for the productions of TEIXMLGrammar, built
+#   on expat.
+#
+#  TEIXMLGrammar does not parse XML so much as match tags: a division
+#   matches only if its head comes first and is followed by nothing but
+#   whitespace and the items its production allows, and paragraphs,
+#   heads, and tables extend to the first end tag of their name.  We
+#   follow expat's events, keep a frame for each open element, and
+#   check each division against its production when it closes.  The
+#   frames of the closed children of a division are dropped once it is
+#   checked, so memory is bounded by the depth and width of the open
+#   divisions.
+#
+#  Markup that pyparsing would read differently from expat (comments,
+#   CDATA sections or processing instructions that contain tags,
+#   backslashes in attribute values, self-closing or nested paragraphs,
+#   heads, and tables, end tags with spaces) or that expat rejects is
+#   scanned with pyparsing instead.  The offsets are those of
+#   scanString, relative to the text with its tabs expanded.
+class TEIXMLScanner():
+
+    ## The kind of element that each language name matches
+    LANGUAGE_KINDS = { TEIXMLGrammar.SECTION:"section",\
+                           TEIXMLGrammar.SUBSECTION:"subsection",\
+                           TEIXMLGrammar.SUBSUBSECTION:"subsubsection",\
+                           TEIXMLGrammar.PARAGRAPH:"paragraph" }
+
+    ## The kinds of items that may follow the head of each kind of division
+    DIVISION_ITEMS = { "section":( "paragraph", "comment", "subsection", "table" ),\
+                           "subsection":( "paragraph", "comment", "subsubsection", "table" ),\
+                           "subsubsection":( "paragraph", "comment", "table" ) }
+
+    DIVISION_TAG = "div"
+
+    ## Elements whose content the grammar skips, up to their first end tag
+    OPAQUE_KINDS = { "tei:p":"paragraph", "tei:head":"head", "tei:table":"table" }
+
+    ## A start tag that makeXMLTags can parse
+    START_TAG = re.compile( r'<([^\s/>]+)((?:[ \t\r\n]+[A-Za-z][A-Za-z0-9_\-:]*[ \t\r\n]*=[ \t\r\n]*"[^"\n\r]*")*)[ \t\r\n]*(/?)>' )
+    ATTRIBUTE = re.compile( r'([A-Za-z][A-Za-z0-9_\-:]*)[ \t\r\n]*=[ \t\r\n]*"([^"\n\r]*)"' )
+
+    ## The element that wraps a text that is not a document, so that
+    #   expat accepts text and elements around the one we want
+    WRAPPER_START = "<xutools>"
+    WRAPPER_END = "</xutools>"
+
+    # Given a language name, get the function that scans a text for
+    #  strings in that language
+    #
+    # @param[in] language_name
+    # @exception UndefinedLanguageName if the language name was not found
+    # @return a function of a text that yields (start, end, label), or
+    #   returns None if the text must be scanned with pyparsing
+    def get_scanner(self, language_name):
+        if ( language_name in self.LANGUAGE_KINDS ):
+            return lambda text: self.scan_elements( text, self.LANGUAGE_KINDS[language_name] )
+        else:
+            raise UndefinedLanguageName("Unable to find language name:" + language_name +\
+                                            " in TEIXMLScanner")
+
+    # Get all language names
+    #
+    # @return an array of all language names that this scanner recognizes
+    def get_language_names(self):
+        return sorted( self.LANGUAGE_KINDS.keys() )
+
+    ## Scan a text for the elements of one kind
+    #
+    #  @param[in] text The text to scan
+    #  @param[in] kind The kind of element, see LANGUAGE_KINDS
+    #  @return a list of (start, end, label), or None if the text must be
+    #    scanned with pyparsing
+    def scan_elements(self, text, kind):
+        matches = self.scan_kinds( text, [ kind ] )
+        if None == matches:
+            return None
+        return matches[kind]
+
+    ## Scan a text for several productions in one pass of expat
+    #
+    #  @param[in] text The text to scan
+    #  @param[in] language_names The language names, see get_language_names
+    #  @return a dictionary of lists of (start, end, label), by language
+    #    name, or None if the text must be scanned with pyparsing
+    def scan_many(self, text, language_names):
+        matches = self.scan_kinds( text, [ self.LANGUAGE_KINDS[language_name] for language_name in language_names ] )
+        if None == matches:
+            return None
+        return dict( [ ( language_name, matches[self.LANGUAGE_KINDS[language_name]] )\
+                           for language_name in language_names ] )
+
+    ## @return a dictionary of lists of (start, end, label), by kind, or
+    #    None if the text must be scanned with pyparsing
+    def scan_kinds(self, text, kinds):
+        # expat reports offsets in bytes
+        if not isinstance( text, str ):
+            return None
+        if "\t" in text:
+            text = text.expandtabs()
+        try:
+            matches = self.find_elements( text, kinds )
+        except ( expat.ExpatError, UnsupportedMarkup ):
+            return None
+
+        # As scanString does, skip matches within an earlier match
+        results = {}
+        for kind in kinds:
+            matches[kind].sort()
+            results[kind] = []
+            end = 0
+            for match_start, match_end, label in matches[kind]:
+                if match_start >= end:
+                    if "paragraph" != kind:
+                        label = label.strip()
+                    results[kind].append( ( match_start, match_end, label ) )
+                    end = match_end
+        return results
+
+    ## Run expat over a text and collect the valid elements of some kinds
+    #
+    #  @exception UnsupportedMarkup, ExpatError
+    #  @return a dictionary of unordered lists of (start, end, label), by kind
+    def find_elements(self, text, kinds):
+        parser = expat.ParserCreate()
+        parser.returns_unicode = False
+        # Each frame is [ name, start, end of start tag (or None if the
+        #  grammar cannot parse the start tag), attributes, items ],
+        #  where only divisions have a list of items.
+        stack = []
+        open_opaque = dict( [ ( name, 0 ) for name in self.OPAQUE_KINDS ] )
+        matches = dict( [ ( kind, [] ) for kind in kinds ] )
+        wrapped = not text.startswith("<?xml")
+        offset = [ 0 ]
+        if wrapped:
+            offset[0] = len( self.WRAPPER_START )
+
+        def add_item(item):
+            if stack and None != stack[-1][4]:
+                stack[-1][4].append( item )
+
+        def start_element(name, attributes):
+            loc = parser.CurrentByteIndex - offset[0]
+            frame = [ name, loc, None, None, None ]
+            if self.DIVISION_TAG == name or name in self.OPAQUE_KINDS:
+                if name in open_opaque:
+                    if open_opaque[name] > 0:
+                        raise UnsupportedMarkup( name + " within " + name )
+                    open_opaque[name] = open_opaque[name] + 1
+                start_tag = self.START_TAG.match( text, loc )
+                if None != start_tag and name == start_tag.group(1):
+                    if "\\" in start_tag.group(2) or "/" == start_tag.group(3):
+                        raise UnsupportedMarkup( start_tag.group(0) )
+                    frame[2] = start_tag.end()
+                    frame[3] = dict( self.ATTRIBUTE.findall( start_tag.group(2) ) )
+                if self.DIVISION_TAG == name:
+                    frame[4] = []
+            stack.append( frame )
+
+        def end_element(name):
+            loc = parser.CurrentByteIndex - offset[0]
+            name, start, tag_end, attributes, items = stack.pop()
+            if not ( self.DIVISION_TAG == name or name in self.OPAQUE_KINDS ):
+                add_item( ( "other", start, None, False, None ) )
+                return
+            if name in open_opaque:
+                open_opaque[name] = open_opaque[name] - 1
+            end_tag = "</" + name + ">"
+            if not text.startswith( end_tag, loc ):
+                raise UnsupportedMarkup( name + " end tag" )
+            end = loc + len( end_tag )
+
+            label = None
+            if None == tag_end:
+                element_kind, valid = "other", False
+            elif self.DIVISION_TAG == name:
+                element_kind = attributes.get("type")
+                valid = element_kind in self.DIVISION_ITEMS
+                if valid:
+                    valid, label = self.check_division( text, element_kind, tag_end, items, loc )
+                else:
+                    element_kind = "other"
+            else:
+                element_kind = self.OPAQUE_KINDS[name]
+                valid = True
+                if "paragraph" == element_kind:
+                    valid = "n" in attributes
+                    label = attributes.get("n")
+                elif "head" == element_kind:
+                    label = text[tag_end:loc]
+            add_item( ( element_kind, start, end, valid, label ) )
+            if valid and element_kind in matches:
+                matches[element_kind].append( ( start, end, label ) )
+
+        def comment(data):
+            loc = parser.CurrentByteIndex - offset[0]
+            if "<" in data:
+                raise UnsupportedMarkup( "tag in comment" )
+            add_item( ( "comment", loc, text.find( "-->", loc ) + 3, True, None ) )
+
+        def processing_instruction(target, data):
+            if "<" in data:
+                raise UnsupportedMarkup( "tag in processing instruction" )
+            add_item( ( "other", None, None, False, None ) )
+
+        def start_cdata():
+            loc = parser.CurrentByteIndex - offset[0]
+            if "<" in text[loc + len("<![CDATA["):text.find( "]]>", loc )]:
+                raise UnsupportedMarkup( "tag in CDATA section" )
+            add_item( ( "other", None, None, False, None ) )
+
+        def start_doctype(doctype_name, system_id, public_id, has_internal_subset):
+            if has_internal_subset:
+                raise UnsupportedMarkup( "internal DTD subset" )
+
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        parser.CommentHandler = comment
+        parser.ProcessingInstructionHandler = processing_instruction
+        parser.StartCdataSectionHandler = start_cdata
+        parser.StartDoctypeDeclHandler = start_doctype
+
+        if wrapped:
+            parser.Parse( self.WRAPPER_START, False )
+            parser.Parse( text, False )
+            parser.Parse( self.WRAPPER_END, True )
+        else:
+            parser.Parse( text, True )
+        return matches
+
+    ## Check the items of a division against its production: a head,
+    #   then the items that the kind of division allows, separated by
+    #   whitespace.
+    #
+    #  @return whether the division is valid, and the text of its head
+    def check_division(self, text, division_kind, tag_end, items, end_tag_start):
+        if not items or "head" != items[0][0]:
+            return False, None
+        allowed = ( "head", ) + self.DIVISION_ITEMS[division_kind]
+        loc = tag_end
+        for item_kind, start, end, valid, label in items:
+            if not valid or not item_kind in allowed:
+                return False, None
+            if text[loc:start].strip(" \t\r\n"):
+                return False, None
+            loc = end
+            allowed = self.DIVISION_ITEMS[division_kind]
+        if text[loc:end_tag_start].strip(" \t\r\n"):
+            return False, None
+        return True, items[0][4]
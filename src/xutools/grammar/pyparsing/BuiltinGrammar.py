@@ -32,6 +32,9 @@ class BuiltinGrammar():
     FILE = GRAMMAR_NAME + ":" + "file"
     LINE = GRAMMAR_NAME + ":" + "line"
     WORD = GRAMMAR_NAME + ":" + "word"
+
+    ## What labels the matches of each production, see get_label_kind
+    LABEL_KINDS = { LINE:"index" }
     
     def get_grammar(self, language_name):
         
@@ -44,6 +47,32 @@ class BuiltinGrammar():
         language_names = [ self.LINE ]
         return language_names
 
+    # Given a language name, get the anchor with which its matches begin
+    #
+    # @param[in] language_name
+    # @return a regular expression, or None if the language has no anchor
+    def get_anchor(self, language_name):
+        return None
+
+    # Given a language name, get what labels its matches: "name" if a
+    #  name within each match, "index" if the index of each match within
+    #  the text that was scanned
+    #
+    # @param[in] language_name
+    # @return "name", "index", or None if that depends upon the match
+    def get_label_kind(self, language_name):
+        return self.LABEL_KINDS.get( language_name )
+
+    # Given a language name, get the languages whose matches within a
+    #  match of it begin where the match or a Group of its parse results
+    #  begins, so that they can be found from the parse of the match
+    #  rather than by scanning its text again
+    #
+    # @param[in] language_name
+    # @return a list of language names
+    def get_captured_language_names(self, language_name):
+        return []
+
     def get_label_for_match(self, language_name, match, match_idx):
         label = None
         if ( "label" in match ):
@@ -18,6 +18,8 @@ along with this program.  If not, see http://www.gnu.org/licenses/
 """
 from pyparsing import *
 from xutools.exceptions import UndefinedLanguageName
+from xutools.grammar import ParseTreeGroup
+from xutools.grammar.pyparsing.BuiltinGrammar import BuiltinGrammar
 import sys
 import types
 
@@ -111,10 +113,45 @@ class CiscoIOSGrammar():
         Group(policyMapRegion)) | Group(address_family_region))
     configFileRegion.leaveWhitespace()
 
+    ## The types of the nested lists in a parse tree, see normalize_parse_tree
+    PARSE_TREE_LIST_TYPES = ( types.ListType, ParseResults )
+
     GRAMMAR_NAME = "ios"
     
     CONFIG = GRAMMAR_NAME + ":" + "config"
     INTERFACE = GRAMMAR_NAME + ":" + "interface"
+    CRYPTO = GRAMMAR_NAME + ":" + "crypto"
+    VLAN = GRAMMAR_NAME + ":" + "vlan"
+    ROUTER = GRAMMAR_NAME + ":" + "router"
+    CLASS_MAP = GRAMMAR_NAME + ":" + "class-map"
+    POLICY_MAP = GRAMMAR_NAME + ":" + "policy-map"
+
+    ## Every match of a production begins with its anchor, a regular
+    #   expression compiled with re.M
+    ANCHORS = { CONFIG:"^(?:interface|crypto|vlan|class-map|policy-map| *address-family)",\
+                    INTERFACE:"^interface",\
+                    CRYPTO:"^crypto",\
+                    VLAN:"^vlan",\
+                    ROUTER:"^router",\
+                    CLASS_MAP:"^class-map",\
+                    POLICY_MAP:"^policy-map" }
+
+    ## What labels the matches of each production, see get_label_kind.
+    #   Only interfaces are labelled by their first line.
+    LABEL_KINDS = { CONFIG:"index",\
+                        INTERFACE:"name",\
+                        CRYPTO:"index",\
+                        VLAN:"index",\
+                        ROUTER:"index",\
+                        CLASS_MAP:"index",\
+                        POLICY_MAP:"index" }
+
+    ## The languages that each production captures, see
+    #   get_captured_language_names.  Every line of a block begins with
+    #   the block, or with a Group: an indented line, or the '!' that
+    #   closes it.
+    CAPTURES = dict( [ ( language_name, [ BuiltinGrammar.LINE ] ) for language_name in\
+                           [ CONFIG, INTERFACE, CRYPTO, VLAN, ROUTER, CLASS_MAP, POLICY_MAP ] ] )
     
     # Given a language name, get the grammar that specifies strings in 
     #  that language
@@ -126,6 +163,16 @@ class CiscoIOSGrammar():
             return self.configFileRegion
         elif ( self.INTERFACE == language_name ):
             return self.interfaceRegion
+        elif ( self.CRYPTO == language_name ):
+            return self.cryptoRegion
+        elif ( self.VLAN == language_name ):
+            return self.vlanRegion
+        elif ( self.ROUTER == language_name ):
+            return self.router_region
+        elif ( self.CLASS_MAP == language_name ):
+            return self.classMapRegion
+        elif ( self.POLICY_MAP == language_name ):
+            return self.policyMapRegion
         else:
             raise UndefinedLanguageName("Unable to find language name:" + language_name +\
                                             " in CiscoIOSGrammar")
@@ -133,9 +180,36 @@ class CiscoIOSGrammar():
     #
     # @return an array of all language names defined by the grammar
     def get_language_names(self):
-        language_names = [ self.CONFIG, self.INTERFACE ]
+        language_names = [ self.CONFIG, self.INTERFACE, self.CRYPTO, self.VLAN,\
+                               self.ROUTER, self.CLASS_MAP, self.POLICY_MAP ]
         return language_names
     
+    # Given a language name, get the anchor with which its matches begin
+    #
+    # @param[in] language_name
+    # @return a regular expression, or None if the language has no anchor
+    def get_anchor(self, language_name):
+        return self.ANCHORS.get( language_name )
+
+    # Given a language name, get what labels its matches: "name" if a
+    #  name within each match, "index" if the index of each match within
+    #  the text that was scanned
+    #
+    # @param[in] language_name
+    # @return "name", "index", or None if that depends upon the match
+    def get_label_kind(self, language_name):
+        return self.LABEL_KINDS.get( language_name )
+
+    # Given a language name, get the languages whose matches within a
+    #  match of it begin where the match or a Group of its parse results
+    #  begins, so that they can be found from the parse of the match
+    #  rather than by scanning its text again
+    #
+    # @param[in] language_name
+    # @return a list of language names
+    def get_captured_language_names(self, language_name):
+        return self.CAPTURES.get( language_name, [] )
+
     def get_label_for_match(self, language_name, match, match_idx):
         label = None
         if ( "label" in match ):
@@ -148,16 +222,20 @@ class CiscoIOSGrammar():
     #   parse tree representation.  This method should go bye-bye.
     #
     #  @param parse_tree_list The list of parse trees that resulted 
-    #    from parsing
+    #    from parsing, either the parse results themselves or
+    #    their asList(), or a ParseTreeGroup whose tree was built as
+    #    it was parsed, see GrammarLibrary.get_tree_production
     #  @return the normalized parse tree
     #  @note  think about how to do this more generally in a language-agnostic way
     def normalize_parse_tree( self, parse_tree_list ):
+        if isinstance( parse_tree_list, ParseTreeGroup ):
+            return parse_tree_list.node
         ntree = { 'id':None,
                   'type':'ios:config',
                   'value':'root',
                   'children':[] }
         for item in parse_tree_list:
-            if isinstance( item, types.ListType ) and len(item) > 0:
+            if isinstance( item, self.PARSE_TREE_LIST_TYPES ) and len(item) > 0:
                 if ( 'interface' == item[0] ):
                     ntree['type'] = 'ios:interface'
                     ntree['id'] = item[1].strip()
@@ -166,7 +244,7 @@ class CiscoIOSGrammar():
                     ntree['type'] = 'crypto'
                     ntree['id'] = item[1].strip()
                     ntree['value'] = ntree['id']
-                elif ( isinstance( item[0], types.ListType ) ):
+                elif ( isinstance( item[0], self.PARSE_TREE_LIST_TYPES ) ):
                     #ntree['type'] = ''
                     #ntree['id'] = ''
                     #ntree['value'] = ''
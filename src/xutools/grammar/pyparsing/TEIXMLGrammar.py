@@ -18,6 +18,7 @@ along with this program.  If not, see http://www.gnu.org/licenses/
 """
 from pyparsing import *
 from xutools.exceptions import UndefinedLanguageName
+from xutools.grammar import ParseTreeGroup
 import sys
 import types
 
@@ -61,6 +62,9 @@ class TEIXMLGrammar():
     ## Production for the entire TEI document, reference is 'edition'
     editionRegion = Group( OneOrMore( Group( sRegion ) ) )
     
+    ## The types of the nested lists in a parse tree, see normalize_parse_tree
+    PARSE_TREE_LIST_TYPES = ( types.ListType, ParseResults )
+
     GRAMMAR_NAME = "tei"
 
     SECTION = GRAMMAR_NAME + ":" + "section"
@@ -68,6 +72,22 @@ class TEIXMLGrammar():
     SUBSUBSECTION = GRAMMAR_NAME + ":" + "subsubsection"
     PARAGRAPH = GRAMMAR_NAME + ":" + "paragraph"
 
+    ## Every match of a production begins with its anchor, a regular
+    #   expression compiled with re.M.  makeXMLTags allows whitespace 
+    #   between the '<' and the tag name.
+    ANCHORS = { SECTION:"<[ \t\r\n]*div",\
+                    SUBSECTION:"<[ \t\r\n]*div",\
+                    SUBSUBSECTION:"<[ \t\r\n]*div",\
+                    PARAGRAPH:"<[ \t\r\n]*tei:p" }
+
+    ## What labels the matches of each production, see get_label_kind.
+    #   Divisions are labelled by their head, and paragraphs by their n
+    #   attribute, which pStart requires.
+    LABEL_KINDS = { SECTION:"name",\
+                        SUBSECTION:"name",\
+                        SUBSUBSECTION:"name",\
+                        PARAGRAPH:"name" }
+
     # Given a language name, get the grammar that specifies strings in
     #  that language
     #
@@ -94,6 +114,35 @@ class TEIXMLGrammar():
         language_names = [ self.SECTION, self.SUBSECTION, self.SUBSUBSECTION, self.PARAGRAPH]
         return language_names
 
+    # Given a language name, get the anchor with which its matches begin
+    #
+    # @param[in] language_name
+    # @return a regular expression, or None if the language has no anchor
+    def get_anchor(self, language_name):
+        return self.ANCHORS.get( language_name )
+
+    # Given a language name, get what labels its matches: "name" if a
+    #  name within each match, "index" if the index of each match within
+    #  the text that was scanned
+    #
+    # @param[in] language_name
+    # @return "name", "index", or None if that depends upon the match
+    def get_label_kind(self, language_name):
+        return self.LABEL_KINDS.get( language_name )
+
+    # Given a language name, get the languages whose matches within a
+    #  match of it begin where the match or a Group of its parse results
+    #  begins, so that they can be found from the parse of the match
+    #  rather than by scanning its text again
+    #
+    # @param[in] language_name
+    # @return a list of language names
+    def get_captured_language_names(self, language_name):
+        # A division ends a line within its text, and a paragraph
+        #  begins within a line, so neither lines nor paragraphs begin
+        #  only where a Group does
+        return []
+
     def get_label_for_match(self, language_name, match, match_idx):
         label = None
         if ( "label" in match ):
@@ -113,20 +162,24 @@ class TEIXMLGrammar():
     #   of extant libraries such as libaugeas.
     #
     #  @param parse_tree_list The list of parse trees that resulted
-    #   from parsing
+    #   from parsing, either the parse results themselves or
+    #   their asList(), or a ParseTreeGroup whose tree was built as
+    #   it was parsed, see GrammarLibrary.get_tree_production
     #  @return the normalized parse tree
     #  @note  think about how to do this more generally in a language-agnostic way.
     def normalize_parse_tree( self, parse_tree_list ):
+        if isinstance( parse_tree_list, ParseTreeGroup ):
+            return parse_tree_list.node
         ntree = { 'id':None, 
                   'type':None,
                   'children':[] }
         for item in parse_tree_list:
-            if isinstance( item, types.ListType ):
+            if isinstance( item, self.PARSE_TREE_LIST_TYPES ):
                 if ( item[0] == 'n' ):
                     ntree['id'] = item[1]
                 elif ( 'type' == item[0] ):
                     ntree['type'] = item[1]
-                elif ( isinstance( item[0], types.ListType ) ):
+                elif ( isinstance( item[0], self.PARSE_TREE_LIST_TYPES ) ):
                     for subtree_list in item:
                         nsubtree = self.normalize_parse_tree( subtree_list )
                         ntree['children'].append( nsubtree );
@@ -37,7 +37,7 @@ class XUPathGrammar():
             Literal(")"))).setResultsName("re_match")
 
     stepExpr = Forward()
-    expr = regexpexpr + Group(ZeroOrMore((Literal('/') | Literal('//')) + \
+    expr = regexpexpr + Group(ZeroOrMore((Literal('//') | Literal('/')) + \
         Group(stepExpr))).setResultsName("next_steps")
     predicate = Literal('[') + expr + Literal(']')
 
@@ -46,7 +46,7 @@ class XUPathGrammar():
         abbrevForwardStep).setResultsName("production") + \
         Group(Optional(predicate)).setResultsName("predicate")
     relativePathExpr = Group(stepExpr).setResultsName("current_step") + \
-        Group(ZeroOrMore((Literal('/') | Literal('//')) + \
+        Group(ZeroOrMore((Literal('//') | Literal('/')) + \
             Group(stepExpr))).setResultsName("next_steps")
     pathExpr = (Literal('//') + \
         Group(Optional(relativePathExpr)).setResultsName("path")) | \
@@ -57,6 +57,9 @@ class XUPathGrammar():
     GRAMMAR_NAME = "xupath"
     XUPATH =  GRAMMAR_NAME + ":" + "xupath"
 
+    ## What labels the matches of each production, see get_label_kind
+    LABEL_KINDS = { XUPATH:"index" }
+
     # Given a language name, get the grammar that specifies strings in
     #  that language
     #
@@ -73,6 +76,32 @@ class XUPathGrammar():
         language_names = [ self.XUPATH ]
         return language_names
 
+    # Given a language name, get the anchor with which its matches begin
+    #
+    # @param[in] language_name
+    # @return a regular expression, or None if the language has no anchor
+    def get_anchor(self, language_name):
+        return None
+
+    # Given a language name, get what labels its matches: "name" if a
+    #  name within each match, "index" if the index of each match within
+    #  the text that was scanned
+    #
+    # @param[in] language_name
+    # @return "name", "index", or None if that depends upon the match
+    def get_label_kind(self, language_name):
+        return self.LABEL_KINDS.get( language_name )
+
+    # Given a language name, get the languages whose matches within a
+    #  match of it begin where the match or a Group of its parse results
+    #  begins, so that they can be found from the parse of the match
+    #  rather than by scanning its text again
+    #
+    # @param[in] language_name
+    # @return a list of language names
+    def get_captured_language_names(self, language_name):
+        return []
+
     def get_label_for_match(self, language_name, match, match_idx):
         label = str(match_idx)
         return label
@@ -32,14 +32,26 @@ class PythonDictionaryParseTree():
     # The root of the parse tree
     root = None
 
+    ## Parse a text into a tree.  The tree is built as the text is
+    #   parsed, by the tree production of the language, see
+    #   GrammarLibrary.get_tree_production.
+    #
+    #  @param[in] text The text to parse
+    #  @param[in] language_name The language of the text
+    #  @exception ParseBudgetExceeded if the parse exceeded the parse
+    #    budget, see GrammarLibrary.set_parse_budget
+    #  @return the parse tree
     @staticmethod
     def create(text, language_name):
         pd_parse_tree = PythonDictionaryParseTree()
         grammar_library = GrammarLibrary()
-        production_parser = grammar_library.get_grammar( language_name )
-        parse_tree = production_parser.parseString( text )
-        normalized_pt = grammar_library.normalize_parse_tree( language_name, parse_tree )
-        pd_parse_tree.root = normalized_pt
+        tree_production = grammar_library.get_tree_production( language_name )
+        GrammarLibrary.start_parse_budget()
+        try:
+            parse_tree = tree_production.parseString( text )
+        finally:
+            GrammarLibrary.stop_parse_budget()
+        pd_parse_tree.root = parse_tree[0]
         return pd_parse_tree
 
     @staticmethod
@@ -0,0 +1,164 @@
+"""
+copyright (c) 2013 Gabriel A. Weaver <gabriel.a.l.weaver@gmail.com>
+
+This file is part of XUTools, Python Distribution.
+
+This code is free software:  you can redistribute                
+it and/or modify it under the terms of the GNU General Public                   
+License as published by the Free Software Foundation, either version            
+3 of the License, or (at your option) any later version.                        
+                                                                                
+XUTools is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+                                                                                
+You should have received a copy of the GNU General Public License               
+along with this program.  If not, see http://www.gnu.org/licenses/
+"""
+import ConfigParser
+import inspect
+import os
+import shutil
+import tempfile
+from xutools.cache import ParseCache
+import xutools.corpus
+from xutools.corpus import Corpus, CorpusElement
+import xutools.grammar
+from xutools.grammar import GrammarLibrary
+from xutools.grammar.pyparsing.CiscoIOSGrammar import CiscoIOSGrammar
+import unittest
+
+## @package test
+#    This module contains methods to test our XUTools parse cache
+
+class TestParseCache( unittest.TestCase ):
+    ios_data_path1 = None
+    ios_data_path2 = None
+    cache_dir = None
+
+    element_equality_fields = [ CorpusElement.LABEL_PATH, CorpusElement.LANGUAGE_NAME_PATH, CorpusElement.TEXT ]
+    attribute_names = element_equality_fields
+
+    def setUp(self):
+        config = ConfigParser.RawConfigParser()
+        config.read('./config/xutools.test.ini')
+
+        self.ios_data_path1 = config.get('xutools.test.test_cache', 'IOSDataPath1')
+        self.ios_data_path2 = config.get('xutools.test.test_cache', 'IOSDataPath2')
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree( self.cache_dir )
+
+    def test_parse(self):
+        file_paths = [ self.ios_data_path1, self.ios_data_path2 ]
+        cache = ParseCache.create( self.cache_dir, min_text_length=0 )
+        corpus = Corpus.create_from_files( file_paths, self.element_equality_fields )
+        expected = corpus.parse( CiscoIOSGrammar.INTERFACE, cache=cache ).output( self.attribute_names, True )
+        self.assertEqual( len( cache.list_entries() ), 2 )
+
+        # On a hit, the grammar is not run at all
+        scan_text = xutools.corpus.scan_text
+        def fail_scan_text(text, language_name):
+            self.fail("scan_text called on a cache hit")
+        xutools.corpus.scan_text = fail_scan_text
+        try:
+            cache = ParseCache.create( self.cache_dir, min_text_length=0 )
+            corpus = Corpus.create_from_files( file_paths, self.element_equality_fields, lazy_load=True )
+            result = corpus.parse( CiscoIOSGrammar.INTERFACE, cache=cache ).output( self.attribute_names, True )
+        finally:
+            xutools.corpus.scan_text = scan_text
+        self.assertEqual( sorted(expected), sorted(result) )
+
+        # The key depends upon the language name and the text
+        text = "interface Ethernet0\n ip address 10.0.0.1\n"
+        keys = set([ cache.get_key( text, CiscoIOSGrammar.INTERFACE ),\
+                         cache.get_key( text, CiscoIOSGrammar.CONFIG ),\
+                         cache.get_key( text + "\n", CiscoIOSGrammar.INTERFACE ) ])
+        self.assertEqual( len(keys), 3 )
+
+        # Short texts are not cached
+        cache = ParseCache.create( self.cache_dir, min_text_length=len(text) + 1 )
+        self.assertEqual( cache.get_key( text, CiscoIOSGrammar.INTERFACE ), None )
+
+    def test_revision(self):
+        grammar_library = GrammarLibrary()
+        read_module_source = xutools.grammar.read_module_source
+        getsourcefile = inspect.getsourcefile
+        getfile = inspect.getfile
+        try:
+            revision = grammar_library.get_grammar_revision( CiscoIOSGrammar.INTERFACE )
+            self.assertNotEqual( revision, None )
+
+            # The revision depends upon the modules that the matches do,
+            #  not only upon the grammar
+            def read_changed_source(module):
+                source = read_module_source( module )
+                if xutools.corpus == module:
+                    source = source + "\n"
+                return source
+            xutools.grammar.read_module_source = read_changed_source
+            GrammarLibrary.grammar_revisions.clear()
+            self.assertNotEqual( revision, grammar_library.get_grammar_revision( CiscoIOSGrammar.INTERFACE ) )
+            xutools.grammar.read_module_source = read_module_source
+
+            # A module installed without its source is read compiled
+            inspect.getsourcefile = lambda module: None
+            GrammarLibrary.grammar_revisions.clear()
+            self.assertNotEqual( grammar_library.get_grammar_revision( CiscoIOSGrammar.INTERFACE ), None )
+
+            # Without either, the texts are parsed but not cached
+            inspect.getfile = lambda module: os.path.join( self.cache_dir, "missing.pyc" )
+            GrammarLibrary.grammar_revisions.clear()
+            cache = ParseCache.create( self.cache_dir, min_text_length=0 )
+            file_paths = [ self.ios_data_path1, self.ios_data_path2 ]
+            corpus = Corpus.create_from_files( file_paths, self.element_equality_fields )
+            expected = corpus.parse( CiscoIOSGrammar.INTERFACE ).output( self.attribute_names, True )
+            result = corpus.parse( CiscoIOSGrammar.INTERFACE, cache=cache ).output( self.attribute_names, True )
+            self.assertEqual( sorted(expected), sorted(result) )
+            self.assertEqual( cache.list_entries(), [] )
+        finally:
+            xutools.grammar.read_module_source = read_module_source
+            inspect.getsourcefile = getsourcefile
+            inspect.getfile = getfile
+            GrammarLibrary.grammar_revisions.clear()
+
+    def test_trim(self):
+        cache = ParseCache.create( self.cache_dir, min_text_length=0 )
+        matches = [ ( 0, 10, 0, 9, "Ethernet0" ) ]
+        cache.put( cache.get_key( "first", CiscoIOSGrammar.INTERFACE ), matches )
+        entry_size = cache.get_size()
+        cache.max_size = 4 * entry_size
+        keys = [ cache.get_key( str(idx), CiscoIOSGrammar.INTERFACE ) for idx in range(0, 8) ]
+        for key in keys:
+            cache.put( key, matches )
+            # Use the first entry, so that it is never the least recently used
+            os.utime( cache.get_entry_path( keys[0] ), ( 0, 2**31 - 1 ) )
+        self.assertTrue( cache.get_size() <= cache.max_size )
+        self.assertEqual( cache.get( keys[0] ), matches )
+        self.assertEqual( cache.get( keys[1] ), None )
+
+    def test_unwritable(self):
+        # A cache that cannot be written to is skipped, not an error
+        not_a_dir = os.path.join( self.cache_dir, "file" )
+        fp = open( not_a_dir, 'w' )
+        fp.write("")
+        fp.close()
+        cache = ParseCache.create( os.path.join( not_a_dir, "xutools" ), min_text_length=0 )
+        file_paths = [ self.ios_data_path1, self.ios_data_path2 ]
+        corpus = Corpus.create_from_files( file_paths, self.element_equality_fields )
+        expected = corpus.parse( CiscoIOSGrammar.INTERFACE ).output( self.attribute_names, True )
+        result = corpus.parse( CiscoIOSGrammar.INTERFACE, cache=cache ).output( self.attribute_names, True )
+        self.assertEqual( sorted(expected), sorted(result) )
+        self.assertEqual( cache.list_entries(), [] )
+
+        # An entry that cannot be moved into place leaves no temporary file
+        entry_dir = os.path.join( self.cache_dir, "entries" )
+        cache = ParseCache.create( entry_dir, min_text_length=0 )
+        key = cache.get_key( "first", CiscoIOSGrammar.INTERFACE )
+        os.makedirs( os.path.dirname( cache.get_entry_path( key ) ) )
+        os.mkdir( cache.get_entry_path( key ) )
+        cache.put( key, [ ( 0, 10, 0, 9, "Ethernet0" ) ] )
+        self.assertEqual( cache.get( key ), None )
+        self.assertEqual( os.listdir( os.path.dirname( cache.get_entry_path( key ) ) ), [ key[2:] ] )
@@ -18,11 +18,17 @@ along with this program.  If not, see http://www.gnu.org/licenses/
 """
 import codecs
 import ConfigParser
+import multiprocessing
 from operator import attrgetter
 import os
 from pyparsing import *
 import pprint
-from xutools.corpus import Corpus, CorpusElement
+import shutil
+import tempfile
+from xutools.cache import ParseCache
+from xutools.corpus import Corpus, CorpusElement, FileBuffer
+from xutools.grammar import GrammarLibrary
+from xutools.grammar.native.BuiltinScanner import BuiltinScanner
 from xutools.grammar.pyparsing.BuiltinGrammar import BuiltinGrammar
 from xutools.grammar.pyparsing.CiscoIOSGrammar import CiscoIOSGrammar
 from xutools.grammar.pyparsing.TEIXMLGrammar import TEIXMLGrammar 
@@ -68,6 +74,66 @@ class TestCorpus( unittest.TestCase ):
         result_corpus = Corpus.create_from_files( file_paths, self.element_equality_fields )
         self.assertEqual( len( result_corpus ), 2 )
 
+    def test_create_from_files_lazy(self):
+        file_paths = [ self.tei_data_path1, self.tei_data_path3 ]
+        eager_corpus = Corpus.create_from_files( file_paths, self.element_equality_fields )
+        lazy_corpus = Corpus.create_from_files( file_paths, self.element_equality_fields, lazy_load=True )
+        self.assertEqual( len( lazy_corpus ), 2 )
+        for element in lazy_corpus.list():
+            # Nothing is read until the text is requested
+            self.assertEqual( element.text, None )
+            fp = open( element.get_file_path() )
+            self.assertEqual( element.get_text(), fp.read() )
+            fp.close()
+        self.assertEqual( set( eager_corpus.list() ), set( lazy_corpus.list() ) )
+
+        eager_sections = eager_corpus.parse( TEIXMLGrammar.SECTION )
+        lazy_sections = lazy_corpus.parse( TEIXMLGrammar.SECTION )
+        # Parsed files are unmapped until one of their children is read
+        for element in lazy_corpus.list():
+            self.assertEqual( element.text_buffer.mapping, None )
+        self.assertEqual( len( lazy_sections ), 4 )
+        self.assertEqual( set( eager_sections.list() ), set( lazy_sections.list() ) )
+
+    def test_create_from_files_lazy_unread(self):
+        # No file is mapped or read until the first parse
+        file_paths = [ self.tei_data_path1, self.tei_data_path2, self.tei_data_path3 ]
+        opened_paths = []
+        file_buffer_open = FileBuffer.open
+        def open_buffer(file_buffer):
+            opened_paths.append( file_buffer.file_path )
+            return file_buffer_open( file_buffer )
+        FileBuffer.open = open_buffer
+        try:
+            result_corpus = Corpus.create_from_files( file_paths, self.element_equality_fields, lazy_load=True )
+            self.assertEqual( len( result_corpus ), 3 )
+            self.assertEqual( opened_paths, [] )
+            result_corpus.parse( TEIXMLGrammar.SECTION )
+            self.assertEqual( sorted( set( opened_paths ) ), sorted( file_paths ) )
+        finally:
+            FileBuffer.open = file_buffer_open
+
+        # Elements whose hashes collide are compared by a digest of
+        #  their text
+        path_field_equality_components = { "label_path":[0] }
+        result_corpus = Corpus.create_from_files( [ self.tei_data_path1, self.tei_data_path2 ], self.element_equality_fields,\
+                                                      path_field_equality_components, False, lazy_load=True )
+        self.assertEqual( len( result_corpus ), 1 )
+
+    def test_create_from_files_lazy_open_buffers(self):
+        # Only a bounded number of files may be mapped at once
+        file_paths = [ self.tei_data_path1, self.tei_data_path2, self.tei_data_path3 ]
+        max_open_buffers = FileBuffer.MAX_OPEN_BUFFERS
+        FileBuffer.MAX_OPEN_BUFFERS = 2
+        try:
+            result_corpus = Corpus.create_from_files( file_paths, self.element_equality_fields, lazy_load=True )
+            self.assertTrue( len( FileBuffer.open_buffers ) <= 2 )
+            sections_corpus = result_corpus.parse( TEIXMLGrammar.SECTION )
+            self.assertTrue( len( FileBuffer.open_buffers ) <= 2 )
+            self.assertEqual( len( sections_corpus ), 6 )
+        finally:
+            FileBuffer.MAX_OPEN_BUFFERS = max_open_buffers
+
     def test_parse(self):
         file_paths = [ self.tei_data_path1, self.tei_data_path3 ]
         result_corpus = Corpus.create_from_files( file_paths, self.element_equality_fields )
@@ -108,6 +174,223 @@ class TestCorpus( unittest.TestCase ):
         self.assertEqual( len( sections_corpus ), 4 )
         # We should get 2 sections here since these are identical modulo file path
 
+    def test_parse_many(self):
+        config = ConfigParser.RawConfigParser()
+        config.read('./config/xutools.test.ini')
+        ios_data_paths = [ config.get('xutools.test.test_corpus', 'IOSDataPath1'),\
+                               config.get('xutools.test.test_corpus', 'IOSDataPath2') ]
+        language_names = CiscoIOSGrammar().get_language_names() + TEIXMLGrammar().get_language_names()
+        file_paths = [ self.tei_data_path1, self.tei_data_path3 ] + ios_data_paths
+        result_corpus = Corpus.create_from_files( file_paths, self.element_equality_fields )
+
+        new_corpora = result_corpus.parse_many( language_names )
+        self.assertEqual( sorted( language_names ), sorted( new_corpora.keys() ) )
+        for language_name in language_names:
+            expected = [ ( element.get_label_path(), element.get_text_ranges(), element.get_text() )\
+                             for element in result_corpus.parse( language_name ).list() ]
+            elements = [ ( element.get_label_path(), element.get_text_ranges(), element.get_text() )\
+                             for element in new_corpora[language_name].list() ]
+            self.assertEqual( sorted(expected), sorted(elements), language_name )
+        self.assertTrue( len( new_corpora[CiscoIOSGrammar.INTERFACE] ) > 0 )
+        self.assertTrue( len( new_corpora[TEIXMLGrammar.SECTION] ) > 0 )
+
+    def test_parse_lines(self):
+        config = ConfigParser.RawConfigParser()
+        config.read('./config/xutools.test.ini')
+        ios_data_path = config.get('xutools.test.test_corpus', 'IOSDataPath1')
+        fp = open( ios_data_path, 'r' )
+        text = fp.read()
+        fp.close()
+        directory = tempfile.mkdtemp()
+        tabs_data_path = os.path.join( directory, "tabs.example" )
+        fp = open( tabs_data_path, 'w' )
+        fp.write( text.replace( "  ", "\t" ) )
+        fp.close()
+
+        file_paths = [ self.tei_data_path1, ios_data_path, tabs_data_path ]
+        try:
+            for use_numpy in [ True, False ]:
+                BuiltinScanner.use_numpy = use_numpy
+                for lazy_load in [ False, True ]:
+                    result_corpus = Corpus.create_from_files( file_paths, self.element_equality_fields, lazy_load=lazy_load )
+                    for corpus in [ result_corpus, result_corpus.parse( TEIXMLGrammar.SECTION ),\
+                                        result_corpus.parse( CiscoIOSGrammar.INTERFACE ),\
+                                        result_corpus.parse( CiscoIOSGrammar.INTERFACE, capture_lines=True ) ]:
+                        expected = [ ( element.get_label_path(), element.get_text_ranges(), element.get_text() )\
+                                         for element in corpus.parse( BuiltinGrammar.LINE ).list() ]
+                        elements = [ ( element.get_label_path(), element.get_text_ranges(), element.get_text() )\
+                                         for element in corpus.parse_lines().list() ]
+                        self.assertTrue( len(expected) > 0 )
+                        self.assertEqual( sorted(expected), sorted(elements) )
+
+                    # An element whose text was set has the lines of that
+                    #  text rather than those of its buffer
+                    corpus = result_corpus.parse( CiscoIOSGrammar.INTERFACE )
+                    for element in corpus.list():
+                        element.set_field( CorpusElement.TEXT, "description set\n" + element.get_text() + "\n shutdown" )
+                    expected = [ ( element.get_label_path(), element.get_text_ranges(), element.get_text() )\
+                                     for element in corpus.parse( BuiltinGrammar.LINE ).list() ]
+                    elements = [ ( element.get_label_path(), element.get_text_ranges(), element.get_text() )\
+                                     for element in corpus.parse_lines().list() ]
+                    self.assertTrue( "description set" in [ text for label_path, text_ranges, text in elements ] )
+                    self.assertEqual( sorted(expected), sorted(elements) )
+
+            # A parse that keeps the lines keeps them in a pool and in
+            #  the cache as well, except for a text with tabs
+            result_corpus = Corpus.create_from_files( file_paths, self.element_equality_fields )
+            get_rows = lambda corpus: sorted( [ ( element.get_label_path(), element.get_text_ranges(), element.get_text() )\
+                                                    for element in corpus.list() ] )
+            expected = get_rows( result_corpus.parse( CiscoIOSGrammar.INTERFACE ).parse( BuiltinGrammar.LINE ) )
+            cache = ParseCache.create( os.path.join( directory, "cache" ), min_text_length=0 )
+            pool = multiprocessing.Pool( 2 )
+            try:
+                for pool_or_none, cache_or_none in [ ( pool, None ), ( None, cache ), ( None, cache ), ( pool, cache ) ]:
+                    interfaces = result_corpus.parse( CiscoIOSGrammar.INTERFACE, pool_or_none, cache_or_none, True )
+                    self.assertEqual( [ tabs_data_path == element.get_file_path() for element in interfaces.list() ],\
+                                          [ None == element.line_starts for element in interfaces.list() ] )
+                    self.assertEqual( expected, get_rows( interfaces.parse_lines() ) )
+                self.assertEqual( 6, cache.hits )
+                self.assertEqual( None, cache.get( cache.get_key( text, CiscoIOSGrammar.INTERFACE ) ) )
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            BuiltinScanner.use_numpy = True
+            shutil.rmtree( directory )
+
+    def test_parse_descendants(self):
+        config = ConfigParser.RawConfigParser()
+        config.read('./config/xutools.test.ini')
+        ios_data_path = config.get('xutools.test.test_corpus', 'IOSDataPath1')
+        fp = open( self.tei_data_path1, 'r' )
+        text = fp.read()
+        fp.close()
+        directory = tempfile.mkdtemp()
+        tei_data_path = os.path.join( directory, "section.tei.xml" )
+        fp = open( tei_data_path, 'w' )
+        fp.write( text.expandtabs() )
+        fp.close()
+
+        def get_elements(corpus):
+            return sorted([ ( element.get_label_path(), element.get_text() ) for element in corpus.list() ])
+        try:
+            for lazy_load in [ False, True ]:
+                for file_paths in [ [ ios_data_path, tei_data_path ], [ self.tei_data_path1 ] ]:
+                    result_corpus = Corpus.create_from_files( file_paths, self.element_equality_fields, lazy_load=lazy_load )
+                    for context_corpus, language_name in [ ( result_corpus, CiscoIOSGrammar.INTERFACE ),\
+                                                               ( result_corpus.parse( CiscoIOSGrammar.CONFIG ), CiscoIOSGrammar.INTERFACE ),\
+                                                               ( result_corpus.parse( TEIXMLGrammar.SECTION ), TEIXMLGrammar.PARAGRAPH ) ]:
+                        expected = get_elements( context_corpus.parse( language_name ) )
+                        self.assertEqual( get_elements( context_corpus.parse_descendants( language_name ) ), expected )
+
+                    # An element is not its own descendant
+                    sections = result_corpus.parse( TEIXMLGrammar.SECTION )
+                    self.assertTrue( len(sections) > 0 )
+                    self.assertEqual( len( sections.parse_descendants( TEIXMLGrammar.SECTION ) ), 0 )
+
+                # Descendants are labelled as a scan of their context would
+                #  label them, whether or not the file has tabs
+                for file_path in [ tei_data_path, self.tei_data_path1 ]:
+                    result_corpus = Corpus.create_from_files( [ file_path ], self.element_equality_fields, lazy_load=lazy_load )
+                    sections = result_corpus.parse( TEIXMLGrammar.SECTION )
+                    descendants = get_elements( sections.parse_descendants( BuiltinGrammar.LINE ) )
+                    self.assertTrue( len(descendants) > 0 )
+                    self.assertEqual( descendants, get_elements( sections.parse( BuiltinGrammar.LINE ) ) )
+
+            # A blank line just before or after a context is not within it,
+            #  and labels that are indexes are numbered within each context
+            for text in [ "hostname r1\n!\n\ninterface Lo0\n no shut\n!\n\ncrypto map a\n!\ninterface Lo1\n shut\n!\n\n",\
+                              "hostname r1\n!\n\ninterface Lo0\n no\tshut\n!\n\ncrypto map a\n!\ninterface Lo1\n shut\n!\n\n" ]:
+                ios_path = os.path.join( directory, "router.example" )
+                fp = open( ios_path, 'w' )
+                fp.write( text )
+                fp.close()
+                result_corpus = Corpus.create_from_files( [ ios_path ], self.element_equality_fields, lazy_load=lazy_load )
+                interfaces = result_corpus.parse( CiscoIOSGrammar.INTERFACE )
+                if not "\t" in text:
+                    self.assertEqual( len( interfaces.parse_descendants( BuiltinGrammar.LINE ) ), 6 )
+                self.assertEqual( get_elements( interfaces.parse_descendants( BuiltinGrammar.LINE ) ),\
+                                      get_elements( interfaces.parse( BuiltinGrammar.LINE ) ) )
+                configs = result_corpus.parse( CiscoIOSGrammar.CONFIG )
+                for language_name in [ CiscoIOSGrammar.CRYPTO, CiscoIOSGrammar.INTERFACE ]:
+                    self.assertEqual( get_elements( configs.parse_descendants( language_name ) ),\
+                                          get_elements( configs.parse( language_name ) ) )
+        finally:
+            shutil.rmtree( directory )
+
+    def test_parse_profile(self):
+        # The workers of a pool profile their scans, and their counts are
+        #  added to the profile of this process
+        config = ConfigParser.RawConfigParser()
+        config.read('./config/xutools.test.ini')
+        ios_data_path = config.get('xutools.test.test_corpus', 'IOSDataPath1')
+        result_corpus = Corpus.create_from_files( [ ios_data_path, self.tei_data_path1 ], self.element_equality_fields )
+        GrammarLibrary.set_native_scanners_enabled( False )
+        try:
+            rows = []
+            for workers in [ None, 2 ]:
+                profile = GrammarLibrary.enable_profiling()
+                pool = None
+                if None != workers:
+                    pool = multiprocessing.Pool( workers )
+                try:
+                    result_corpus.parse( CiscoIOSGrammar.INTERFACE, pool )
+                    result_corpus.parse_many( [ CiscoIOSGrammar.CRYPTO, TEIXMLGrammar.SECTION ], pool )
+                finally:
+                    GrammarLibrary.disable_profiling()
+                    if None != pool:
+                        pool.close()
+                        pool.join()
+                rows.append( sorted( [ row[:4] for row in profile.get_rows() ] ) )
+            self.assertTrue( "ios:interfaceRegion" in [ row[0] for row in rows[0] ] )
+            self.assertEqual( rows[0], rows[1] )
+        finally:
+            GrammarLibrary.set_native_scanners_enabled( True )
+
+    def test_parse_budget(self):
+        # An unclosed section: expat rejects it, so pyparsing scans it
+        fp = open( self.tei_data_path1, 'r' )
+        text = fp.read()
+        fp.close()
+        end = text.rfind("</div>")
+        directory = tempfile.mkdtemp()
+        bad_data_path = os.path.join( directory, "unclosed.xml" )
+        fp = open( bad_data_path, 'w' )
+        fp.write( text[:end] + text[end + len("</div>"):] )
+        fp.close()
+
+        file_paths = [ self.tei_data_path1, bad_data_path ]
+        result_corpus = Corpus.create_from_files( file_paths, self.element_equality_fields )
+        get_rows = lambda corpus: sorted( [ ( element.get_label_path(), element.get_text() ) for element in corpus.list() ] )
+        expected = get_rows( Corpus.create_from_files( file_paths[:1], self.element_equality_fields ).parse( TEIXMLGrammar.SECTION ) )
+        cache = ParseCache.create( os.path.join( directory, "cache" ), min_text_length=0 )
+        # Workers inherit the budget when they are created
+        budget = GrammarLibrary.set_parse_budget( max_steps=100 )
+        pool = multiprocessing.Pool( 2 )
+        try:
+            self.assertTrue( budget is GrammarLibrary.get_parse_budget() )
+            self.assertEqual( expected, get_rows( result_corpus.parse( TEIXMLGrammar.SECTION, cache=cache ) ) )
+            self.assertEqual( expected, get_rows( result_corpus.parse( TEIXMLGrammar.SECTION, pool=pool ) ) )
+            self.assertEqual( expected, get_rows( result_corpus.parse_many( [ TEIXMLGrammar.SECTION ] )[TEIXMLGrammar.SECTION] ) )
+            self.assertEqual( 3, len( budget.events ) )
+            for file_path, label_path, language_names, reason in budget.events:
+                self.assertEqual( bad_data_path, file_path )
+                self.assertEqual( ( TEIXMLGrammar.SECTION, ), language_names )
+                self.assertEqual( "more than 100 parse steps", reason )
+            self.assertTrue( "unclosed.xml" in budget.format_events()[0] )
+            # Skipped texts are not cached
+            bad_element = [ element for element in result_corpus.list() if bad_data_path == element.get_file_path() ][0]
+            self.assertEqual( None, cache.get( cache.get_key( bad_element.get_text(), TEIXMLGrammar.SECTION ) ) )
+
+            # Without a budget, the unclosed section has matches
+            self.assertEqual( None, GrammarLibrary.set_parse_budget() )
+            self.assertTrue( len( get_rows( result_corpus.parse( TEIXMLGrammar.SECTION ) ) ) > len( expected ) )
+        finally:
+            GrammarLibrary.set_parse_budget()
+            pool.close()
+            pool.join()
+            shutil.rmtree( directory )
+
     def test_filter(self):
         file_paths = [ self.tei_data_path1, self.tei_data_path3 ]
         result_corpus = Corpus.create_from_files( file_paths, self.element_equality_fields )
@@ -1165,6 +1448,47 @@ class TestCorpusElement( unittest.TestCase ):
         self.assertEqual( sssection1_element.get_text_ranges()[0], [0, 2763] )
         self.assertEqual( sssection1_element.get_text_ranges()[1], [364, 2502] )
 
+    def test_equality_key(self):
+        element_equality_fields = [ CorpusElement.LABEL_PATH, CorpusElement.LANGUAGE_NAME_PATH ]
+        corpus_element1 = CorpusElement()
+        corpus_element1.set_field( CorpusElement.LABEL_PATH, [ "router.v1.example", "Loopback0" ] )
+        corpus_element1.set_field( CorpusElement.LANGUAGE_NAME_PATH, [ BuiltinGrammar.FILE, CiscoIOSGrammar.INTERFACE ] )
+        corpus_element1.set_field( CorpusElement.ELEMENT_EQUALITY_FIELDS, element_equality_fields )
+
+        # The same path components in different fields must not collide
+        corpus_element2 = CorpusElement()
+        corpus_element2.set_field( CorpusElement.LABEL_PATH, [ BuiltinGrammar.FILE, CiscoIOSGrammar.INTERFACE ] )
+        corpus_element2.set_field( CorpusElement.LANGUAGE_NAME_PATH, [ "router.v1.example", "Loopback0" ] )
+        corpus_element2.set_field( CorpusElement.ELEMENT_EQUALITY_FIELDS, element_equality_fields )
+        self.assertNotEqual( hash(corpus_element1), hash(corpus_element2) )
+        self.assertFalse( corpus_element1 == corpus_element2 )
+
+        # The key is cached, and recomputed once a field is set
+        self.assertTrue( corpus_element1.get_equality_key() is corpus_element1.get_equality_key() )
+        for corpus_element in [ corpus_element1, corpus_element2 ]:
+            corpus_element.set_field( CorpusElement.PATH_FIELD_EQUALITY_COMPONENTS, { "label_path":[1], "language_name_path":[1] } )
+            corpus_element.set_field( CorpusElement.PATH_FIELD_EQUALITY_COMPONENTS_IS_WHITELIST, True )
+        corpus_element2.set_field( CorpusElement.LABEL_PATH, [ "router.v2.example", "Loopback0" ] )
+        corpus_element2.set_field( CorpusElement.LANGUAGE_NAME_PATH, [ BuiltinGrammar.FILE, CiscoIOSGrammar.INTERFACE ] )
+        self.assertEqual( hash(corpus_element1), hash(corpus_element2) )
+        self.assertTrue( corpus_element1 == corpus_element2 )
+
+    def test_layout(self):
+        idx_path = [ 1 ]
+        label_path = [ os.path.basename(self.ios_data_path1) ]
+        language_name_path = [ BuiltinGrammar.FILE ]
+        element_equality_fields = [ CorpusElement.LABEL_PATH, CorpusElement.LANGUAGE_NAME_PATH, CorpusElement.TEXT ]
+        corpus_element = CorpusElement.create(idx_path, label_path, language_name_path, self.ios_data_path1, element_equality_fields)
+        self.assertFalse( hasattr( corpus_element, "__dict__" ) )
+
+        line_elements = list( corpus_element.parse( BuiltinGrammar.LINE ) )
+        self.assertTrue( len(line_elements) > 1 )
+        # Siblings share their paths and interned path components
+        for line_element in line_elements:
+            self.assertTrue( line_element.language_name_path is line_elements[0].language_name_path )
+            self.assertTrue( line_element.label_path[0] is line_elements[0].label_path[0] )
+            self.assertTrue( line_element.grammar_library is corpus_element.grammar_library )
+
     def test_parse_ios(self):
         
         idx_path = [ 1 ]
@@ -0,0 +1,375 @@
+"""
+copyright (c) 2013 Gabriel A. Weaver <gabriel.a.l.weaver@gmail.com>
+
+This file is part of XUTools, Python Distribution.
+
+This code is free software:  you can redistribute                
+it and/or modify it under the terms of the GNU General Public                   
+License as published by the Free Software Foundation, either version            
+3 of the License, or (at your option) any later version.                        
+                                                                                
+XUTools is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+for more details.
+                                                                                
+You should have received a copy of the GNU General Public License               
+along with this program.  If not, see http://www.gnu.org/licenses/
+"""
+import ConfigParser
+import json
+from pyparsing import ParserElement
+import random
+import subprocess
+import sys
+from xutools.benchmark import generate_tei_document
+from xutools.corpus import get_captured_line_matches, get_match_bounds, scan_text
+from xutools.exceptions import ParseBudgetExceeded
+from xutools.grammar import GrammarLibrary, LanguageRecord
+from xutools.grammar.native.BuiltinScanner import BuiltinScanner
+from xutools.grammar.native.CiscoIOSScanner import CiscoIOSScanner
+from xutools.grammar.native.TEIXMLScanner import TEIXMLScanner
+from xutools.grammar.pyparsing.BuiltinGrammar import BuiltinGrammar
+from xutools.grammar.pyparsing.CiscoIOSGrammar import CiscoIOSGrammar
+from xutools.grammar.pyparsing.TEIXMLGrammar import TEIXMLGrammar
+from xutools.parsers import PythonDictionaryParseTree
+import unittest
+
+## @package test
+#    This module contains methods to test our XUTools GrammarLibrary
+
+class TestGrammarLibrary( unittest.TestCase ):
+    tei_data_path1 = None
+    ios_data_path1 = None
+
+    def setUp(self):
+        config = ConfigParser.RawConfigParser()
+        config.read('./config/xutools.test.ini')
+
+        self.tei_data_path1 = config.get('xutools.test.test_grammar', 'TEIDataPath1')
+        self.ios_data_path1 = config.get('xutools.test.test_grammar', 'IOSDataPath1')
+
+    def tearDown(self):
+        GrammarLibrary.disable_profiling()
+        GrammarLibrary.disable_packrat()
+        GrammarLibrary.set_native_scanners_enabled( True )
+
+    def test_language_record(self):
+        grammar_library = GrammarLibrary()
+        record = grammar_library.get_language_record( TEIXMLGrammar.SECTION )
+        self.assertTrue( record is GrammarLibrary().get_language_record( TEIXMLGrammar.SECTION ) )
+        self.assertTrue( record.production is grammar_library.get_grammar( TEIXMLGrammar.SECTION ) )
+        self.assertTrue( record.grammar_instance is grammar_library.get_grammar_instance( TEIXMLGrammar.SUBSECTION ) )
+
+    def test_lazy_registry(self):
+        grammar_library = GrammarLibrary()
+        self.assertTrue( TEIXMLGrammar is GrammarLibrary.get_grammar_class( GrammarLibrary.TEIXML_GRAMMAR_NAME ) )
+        self.assertTrue( TEIXMLScanner is GrammarLibrary.get_scanner_class( GrammarLibrary.TEIXML_GRAMMAR_NAME ) )
+        self.assertEqual( None, GrammarLibrary.get_scanner_class( GrammarLibrary.XUPATH_GRAMMAR_NAME ) )
+        self.assertEqual( CiscoIOSGrammar().get_language_names(),\
+                              grammar_library.get_language_names( GrammarLibrary.CISCOIOS_GRAMMAR_NAME ) )
+
+        # A fresh interpreter imports a grammar, and numpy, only when it is used
+        script = "import sys, xutools.tools\n" +\
+            "modules = [ 'numpy', 'xutools.grammar.pyparsing.TEIXMLGrammar', 'xutools.grammar.pyparsing.CiscoIOSGrammar' ]\n" +\
+            "print [ None != sys.modules.get( module ) for module in modules ]\n" +\
+            "xutools.tools.GrammarLibrary().get_language_record( 'ios:interface' )\n" +\
+            "print [ None != sys.modules.get( module ) for module in modules ]\n"
+        output = subprocess.Popen( [ sys.executable, "-c", script ], stdout=subprocess.PIPE ).communicate()[0]
+        self.assertEqual( "[False, False, False]\n[False, False, True]\n", output )
+
+    def test_packrat(self):
+        for data_path, language_names in [ ( self.tei_data_path1, [ TEIXMLGrammar.SECTION, TEIXMLGrammar.SUBSUBSECTION ] ),\
+                                               ( self.ios_data_path1, [ CiscoIOSGrammar.INTERFACE, CiscoIOSGrammar.CONFIG ] ) ]:
+            fp = open( data_path, 'r' )
+            text = fp.read()
+            fp.close()
+            for language_name in language_names:
+                GrammarLibrary.disable_packrat()
+                expected = scan_text( text, language_name )
+                GrammarLibrary.enable_packrat( 50 )
+                self.assertTrue( GrammarLibrary.is_packrat_enabled() )
+                self.assertEqual( expected, scan_text( text, language_name ) )
+                # The cache is cleared after each text
+                self.assertEqual( len( ParserElement._exprArgCache ), 0 )
+
+        # The cache is bounded
+        fp = open( self.tei_data_path1, 'r' )
+        text = fp.read()
+        fp.close()
+        production = GrammarLibrary().get_grammar( TEIXMLGrammar.SECTION )
+        list( production.scanString( text ) )
+        self.assertEqual( len( ParserElement._exprArgCache ), 50 )
+        GrammarLibrary.disable_packrat()
+        self.assertFalse( GrammarLibrary.is_packrat_enabled() )
+
+    def test_profiling(self):
+        fp = open( self.ios_data_path1, 'r' )
+        text = fp.read()
+        fp.close()
+        expected = scan_text( text, CiscoIOSGrammar.INTERFACE )
+        parse = ParserElement._parse
+
+        GrammarLibrary.set_native_scanners_enabled( False )
+        profile = GrammarLibrary.enable_profiling()
+        self.assertTrue( profile is GrammarLibrary.get_profile() )
+        self.assertEqual( expected, scan_text( text, CiscoIOSGrammar.INTERFACE ) )
+        GrammarLibrary.set_native_scanners_enabled( True )
+        self.assertEqual( expected, scan_text( text, CiscoIOSGrammar.INTERFACE ) )
+        self.assertTrue( profile is GrammarLibrary.disable_profiling() )
+        self.assertEqual( parse, ParserElement._parse )
+        self.assertEqual( None, GrammarLibrary.get_profile() )
+
+        rows = dict( [ ( row[0], row[1:] ) for row in profile.get_rows() ] )
+        attempts, matches, failures, seconds = rows["ios:interfaceRegion"]
+        self.assertEqual( len(expected), matches )
+        self.assertEqual( attempts, matches + failures )
+        self.assertTrue( rows["ios:indentedLineRegion"][0] > 0 )
+        self.assertEqual( [ 1, 1, 0 ], rows[ CiscoIOSGrammar.INTERFACE + " (native)" ][:3] )
+        self.assertTrue( "ios:interfaceRegion" in profile.format_table() )
+        self.assertEqual( len(rows), len( json.loads( profile.format_json() ) ) )
+
+    def test_parse_settings(self):
+        # Turning off profiling, the budget, or packrat leaves the others
+        fp = open( self.ios_data_path1, 'r' )
+        text = fp.read()
+        fp.close()
+        parse = ParserElement._parse
+        GrammarLibrary.set_native_scanners_enabled( False )
+        try:
+            for first, second in [ ( "profile", "budget" ), ( "budget", "profile" ), ( "packrat", "budget" ) ]:
+                enable = { "profile":GrammarLibrary.enable_profiling,\
+                               "budget":lambda: GrammarLibrary.set_parse_budget( max_steps=5 ),\
+                               "packrat":GrammarLibrary.enable_packrat }
+                disable = { "profile":GrammarLibrary.disable_profiling,\
+                                "budget":GrammarLibrary.set_parse_budget,\
+                                "packrat":GrammarLibrary.disable_packrat }
+                enable[first]()
+                enable[second]()
+                disable[first]()
+                if "budget" == second:
+                    self.assertRaises( ParseBudgetExceeded, scan_text, text, CiscoIOSGrammar.INTERFACE )
+                else:
+                    scan_text( text, CiscoIOSGrammar.INTERFACE )
+                    self.assertTrue( sum( [ row[1] for row in GrammarLibrary.get_profile().get_rows() ] ) > 0 )
+                disable[second]()
+                self.assertEqual( parse, ParserElement._parse )
+        finally:
+            GrammarLibrary.set_native_scanners_enabled( True )
+
+    def test_normalize_parse_tree(self):
+        grammar_library = GrammarLibrary()
+        for data_path, language_names in [ ( self.tei_data_path1, [ TEIXMLGrammar.SECTION, TEIXMLGrammar.SUBSECTION ] ),\
+                                               ( self.ios_data_path1, [ CiscoIOSGrammar.CONFIG, CiscoIOSGrammar.INTERFACE ] ) ]:
+            fp = open( data_path, 'r' )
+            text = fp.read()
+            fp.close()
+            for language_name in language_names:
+                grammar_instance = grammar_library.get_grammar_instance( language_name )
+                production = grammar_library.get_grammar( language_name )
+                num_parse_actions = len( production.parseAction )
+                tree_production = grammar_library.get_tree_production( language_name )
+                self.assertTrue( tree_production is grammar_library.get_tree_production( language_name ) )
+                for enable_packrat in [ False, True ]:
+                    if enable_packrat:
+                        GrammarLibrary.enable_packrat()
+                    expected_trees = []
+                    for match, s, e in production.scanString( text ):
+                        expected = grammar_instance.normalize_parse_tree( match.asList() )
+                        self.assertEqual( expected, grammar_library.normalize_parse_tree( language_name, match ) )
+                        expected_trees.append( ( expected, s, e ) )
+                    # The tree production builds the same trees as it parses
+                    trees = [ ( match[0], s, e ) for match, s, e in tree_production.scanString( text ) ]
+                    self.assertEqual( expected_trees, trees )
+                    self.assertTrue( len( trees ) > 0 )
+                    # scanString gives offsets into the text with its tabs expanded
+                    tree, s, e = trees[-1]
+                    self.assertEqual( tree, PythonDictionaryParseTree.create( text.expandtabs()[s:e], language_name ).root )
+                    GrammarLibrary.disable_packrat()
+                # The production itself is left as it was
+                self.assertEqual( num_parse_actions, len( production.parseAction ) )
+
+    def test_anchors(self):
+        texts = []
+        for data_path in [ self.tei_data_path1, self.ios_data_path1 ]:
+            fp = open( data_path, 'r' )
+            texts.append( fp.read() )
+            fp.close()
+        texts.extend( [ "  interface Loopback0\n ip address\n!\n\tcrypto map\n!",\
+                            " address-family ipv4\n  x\n!\ninterface\n vlan 1\n!",\
+                            '<\tdiv type="section"><tei:head>A</tei:head>< tei:p n="1">a</tei:p></div>' ] )
+        for grammar in [ CiscoIOSGrammar(), TEIXMLGrammar() ]:
+            for language_name in grammar.get_language_names():
+                record = LanguageRecord.create( language_name, grammar )
+                self.assertNotEqual( None, record.anchor )
+                for text in texts:
+                    expected = [ ( s, e, match.asList() ) for match, s, e in record.production.scanString( text ) ]
+                    self.assertEqual( expected, [ ( s, e, match.asList() ) for match, s, e in record.scan_anchors( text, record.production ) ] )
+
+class TestCiscoIOSScanner( unittest.TestCase ):
+    ios_data_paths = None
+
+    # Lines from which to build configurations that exercise the corners
+    #  of the grammar: tabs, unterminated blocks, '!' lines with trailing
+    #  text, keywords that are prefixes of other words, address families
+    lines = [ "interface GigabitEthernet0/1", "interface", "interfaces x", " ip address 10.0.0.1",\
+                  "  description uplink", "!", "!x", "", " !", "crypto map azalea", "vlan 10",\
+                  "router bgp 1", "class-map match-any voice", "policy-map qos", " address-family ipv4",\
+                  "address-family ipv6 x", "  address-familyx", "\tinterface Tunnel0", " \tshutdown",\
+                  "hostname router", " ", "end", "!!", "vlan", "crypto" ]
+
+    def setUp(self):
+        config = ConfigParser.RawConfigParser()
+        config.read('./config/xutools.test.ini')
+
+        self.ios_data_paths = [ config.get('xutools.test.test_grammar', 'IOSDataPath1'),\
+                                    config.get('xutools.test.test_grammar', 'IOSDataPath2'),\
+                                    config.get('xutools.test.test_grammar', 'IOSDataPath3') ]
+
+    ## Assert that the native scanner finds exactly what scanString does
+    def assertScansEqual(self, text):
+        grammar = CiscoIOSGrammar()
+        scanner = CiscoIOSScanner()
+        scanned = scanner.scan_many( text, grammar.get_language_names() )
+        for language_name in grammar.get_language_names():
+            record = LanguageRecord.create( language_name, grammar )
+            expected = list( record.scan_production( text ) )
+            self.assertEqual( expected, list( scanner.get_scanner( language_name )( text ) ),\
+                                  language_name + " differs on " + repr(text) )
+            self.assertEqual( expected, scanned[language_name],\
+                                  language_name + " differs in scan_many on " + repr(text) )
+
+    ## Assert that the lines of each match, from the offsets that the
+    #   native scanner and the capture production keep, are those that
+    #   a scan of its text for builtin:line finds
+    def assertLinesEqual(self, text):
+        grammar = CiscoIOSGrammar()
+        scanner = CiscoIOSScanner()
+        text = text.expandtabs()
+        for language_name in grammar.get_language_names():
+            record = LanguageRecord.create( language_name, grammar )
+            expected = list( record.scan_production( text ) )
+            for matches in [ list( scanner.get_line_scanner( language_name )( text ) ),\
+                                 list( record.scan_production( text, True ) ) ]:
+                self.assertEqual( expected, [ match[:3] for match in matches ] )
+                for bounds, match in zip( get_match_bounds( text, expected ), matches ):
+                    match_text = text[ bounds[2]:bounds[3] ]
+                    self.assertEqual( scan_text( match_text, BuiltinGrammar.LINE ),\
+                                          get_captured_line_matches( match_text, match[3], bounds[2] ),\
+                                          language_name + " lines differ on " + repr(text) )
+
+    def test_fixtures(self):
+        for data_path in self.ios_data_paths:
+            fp = open( data_path, 'r' )
+            text = fp.read()
+            fp.close()
+            self.assertScansEqual( text )
+            self.assertScansEqual( text.rstrip() )
+            self.assertScansEqual( unicode( text ) )
+            self.assertLinesEqual( text )
+
+    def test_generated(self):
+        generator = random.Random(0)
+        for idx in range(0, 300):
+            lines = [ generator.choice( self.lines ) for line_idx in range(0, generator.randint(0, 14)) ]
+            text = generator.choice( [ "\n", "\n\n" ] ).join( lines )
+            if generator.random() < 0.5:
+                text = text + "\n"
+            self.assertScansEqual( text )
+            self.assertLinesEqual( text )
+
+class TestBuiltinScanner( unittest.TestCase ):
+    data_paths = None
+
+    def setUp(self):
+        config = ConfigParser.RawConfigParser()
+        config.read('./config/xutools.test.ini')
+
+        self.data_paths = [ config.get('xutools.test.test_grammar', 'TEIDataPath1'),\
+                                config.get('xutools.test.test_grammar', 'IOSDataPath1') ]
+
+    ## Assert that the line scanner finds exactly what scanString does,
+    #   with and without numpy
+    def assertScansEqual(self, text):
+        record = LanguageRecord.create( BuiltinGrammar.LINE, BuiltinGrammar() )
+        expected = list( record.scan_production( text ) )
+        scanner = BuiltinScanner()
+        self.assertEqual( expected, list( scanner.scan_lines( text ) ), repr(text) )
+        scanner.use_numpy = False
+        self.assertEqual( expected, list( scanner.scan_lines( text ) ), repr(text) )
+
+    def test_fixtures(self):
+        for data_path in self.data_paths:
+            fp = open( data_path, 'r' )
+            text = fp.read()
+            fp.close()
+            self.assertScansEqual( text )
+            self.assertScansEqual( text.rstrip() )
+            self.assertScansEqual( unicode( text, "utf-8" ) )
+
+    def test_corners(self):
+        for text in [ "", "\n", "\n\n", "a", "a\n", "a\n\nb", " \t x\n\ty\n", "a\r\nb\rc\n", "\x0bz\n\n " ]:
+            self.assertScansEqual( text )
+
+class TestTEIXMLScanner( unittest.TestCase ):
+    tei_data_paths = None
+
+    # Markup to insert into documents to exercise the corners of the
+    #  grammar: items that divisions do not allow, paragraphs without an
+    #  n, single quotes, tabs, and markup that expat and pyparsing read
+    #  differently
+    snippets = [ '<!-- note -->', '<!-- <b> -->', 'stray text', '<tei:table><row/></tei:table>',\
+                     '<tei:p n="x">a</tei:p>', '<tei:p>no n</tei:p>', "<tei:p n='q'>single</tei:p>",\
+                     '<tei:p n="a\\b">b</tei:p>', '<tei:head>Extra</tei:head>', '<?pi data?>',\
+                     '<div type="subsection"><tei:head>S</tei:head></div>',\
+                     '<div type="subsubsection"><tei:head>SS</tei:head>\t<tei:p n="1">t</tei:p></div>',\
+                     '<div type="other"><tei:head>O</tei:head></div>', '<![CDATA[ <x> ]]>', '<foo/>',\
+                     '<tei:p n="z"><tei:p n="y">n</tei:p></tei:p>', '<tei:p  n = "sp" >sp</tei:p >',\
+                     '<tei:p n="in"><div type="section"><tei:head>In</tei:head></div></tei:p>', '<tei:head/>' ]
+
+    def setUp(self):
+        config = ConfigParser.RawConfigParser()
+        config.read('./config/xutools.test.ini')
+
+        self.tei_data_paths = [ config.get('xutools.test.test_grammar', 'TEIDataPath1'),\
+                                    config.get('xutools.test.test_grammar', 'TEIDataPath2'),\
+                                    config.get('xutools.test.test_grammar', 'TEIDataPath3') ]
+
+    ## Assert that the native scanner finds exactly what scanString does,
+    #   unless it declines the text
+    #
+    #  @return the number of languages for which the scanner did not decline
+    def assertScansEqual(self, text):
+        grammar = TEIXMLGrammar()
+        scanner = TEIXMLScanner()
+        num_scanned = 0
+        scanned = scanner.scan_many( text, scanner.get_language_names() )
+        for language_name in scanner.get_language_names():
+            record = LanguageRecord.create( language_name, grammar )
+            matches = scanner.get_scanner( language_name )( text )
+            self.assertEqual( None == matches, None == scanned )
+            if None != matches:
+                expected = list( record.scan_production( text ) )
+                self.assertEqual( expected, matches, language_name + " differs on " + repr(text) )
+                self.assertEqual( expected, scanned[language_name],\
+                                      language_name + " differs in scan_many on " + repr(text) )
+                num_scanned = num_scanned + 1
+        return num_scanned
+
+    def test_fixtures(self):
+        for data_path in self.tei_data_paths:
+            fp = open( data_path, 'r' )
+            text = fp.read()
+            fp.close()
+            self.assertEqual( 4, self.assertScansEqual( text ) )
+            self.assertEqual( 4, self.assertScansEqual( text.replace("    ", "\t") ) )
+            self.assertEqual( 4, self.assertScansEqual( text[text.find("<div"):text.rfind("</div>") + 6] ) )
+
+    def test_generated(self):
+        generator = random.Random(0)
+        for idx in range(0, 40):
+            lines = generate_tei_document( generator.randint(1, 2), generator.randint(0, 2),\
+                                               generator.randint(0, 1), generator.randint(0, 2) ).split("\n")
+            for snippet_idx in range(0, generator.randint(0, 3)):
+                lines.insert( generator.randrange( len(lines) ), generator.choice( self.snippets ) )
+            self.assertScansEqual( "\n".join( lines ) )
@@ -20,13 +20,19 @@ along with this program.  If not, see http://www.gnu.org/licenses/
 import codecs
 import ConfigParser
 import os
+import re
+import shutil
+import tempfile
 from pyparsing import *
 import pprint
-from xutools.corpus import CorpusElement
+from xutools.cache import ParseCache
+from xutools.corpus import Corpus, CorpusElement
+from xutools.exceptions import UndefinedLanguageName
+from xutools.grammar import GrammarLibrary
 from xutools.grammar.pyparsing.BuiltinGrammar import BuiltinGrammar
 from xutools.grammar.pyparsing.CiscoIOSGrammar import CiscoIOSGrammar
 from xutools.grammar.pyparsing.TEIXMLGrammar import TEIXMLGrammar
-from xutools.tools import XUGrep, XUWc
+from xutools.tools import XUGrep, XUPathAnalysis, XUPathBatch, XUPathPlan, XUWc, get_required_literals
 import unittest
 
 ## @package test
@@ -105,6 +111,305 @@ class TestXUGrep( unittest.TestCase ):
         print "\n"
         print "\n".join(results)
 
+    def test_xugrep_workers(self):
+        file_paths = [ self.tei_data_path1, self.tei_data_path2, self.tei_data_path3, self.ios_data_path1 ]
+        element_equality_fields = [ CorpusElement.LABEL_PATH,\
+                                        CorpusElement.LANGUAGE_NAME_PATH,\
+                                        CorpusElement.TEXT ]
+        attribute_names = element_equality_fields
+        for xupath in [ self.tei_xupath2, "/builtin:file/ios:interface/builtin:line" ]:
+            serial = XUGrep.create(xupath, file_paths, element_equality_fields)
+            parallel = XUGrep.create(xupath, file_paths, element_equality_fields, lazy_load=True, workers=2)
+            # The parallel result is the same, in the same order
+            self.assertEqual( serial.corpus.output( attribute_names, True ),\
+                                  parallel.corpus.output( attribute_names, True ) )
+
+    def test_xugrep_stream(self):
+        file_paths = [ self.tei_data_path1, self.tei_data_path2, self.tei_data_path3 ]
+        element_equality_fields = [ CorpusElement.LABEL_PATH,\
+                                        CorpusElement.LANGUAGE_NAME_PATH,\
+                                        CorpusElement.TEXT ]
+        attribute_names = element_equality_fields
+        xugrep = XUGrep.create(self.tei_xupath2, file_paths, element_equality_fields)
+        results = XUGrep.stream(self.tei_xupath2, file_paths, element_equality_fields)
+        self.assertEqual( sorted( xugrep.corpus.output( attribute_names, True ) ),\
+                              sorted( [ Corpus.output_element( x, attribute_names, True ) for x in results ] ) )
+
+        # The first file is emitted before the second file is read
+        results = XUGrep.stream(self.tei_xupath2, [ self.tei_data_path1, "/nonexistent" ], element_equality_fields)
+        first = results.next()
+        self.assertEqual( first.get_label_path()[0], "section.tei.v1.xml" )
+        self.assertRaises( IOError, list, results )
+
+        # Results equal to an earlier file's results are not repeated
+        results = list( XUGrep.stream(self.tei_xupath2, [ self.tei_data_path1, self.tei_data_path1 ], element_equality_fields) )
+        self.assertEqual( len( XUGrep.create(self.tei_xupath2, [ self.tei_data_path1 ], element_equality_fields).corpus ),\
+                              len( results ) )
+
+        # Only files with the same basename are remembered, unless the
+        #  equality fields leave out the basename
+        self.assertEqual( [ ( "section.tei.v1.xml", False ), ( "section.tei.v1.xml", False ), None, ( "section.tei.v1.xml", True ) ],\
+                              XUGrep.get_result_groups( [ self.tei_data_path1, self.tei_data_path1,\
+                                                              self.tei_data_path2, self.tei_data_path1 ],\
+                                                            element_equality_fields ) )
+        self.assertEqual( [ ( "", False ), ( "", True ) ],\
+                              XUGrep.get_result_groups( [ self.tei_data_path1, self.tei_data_path2 ],\
+                                                            element_equality_fields, { "label_path":[0] }, False ) )
+        results = list( XUGrep.stream(self.tei_xupath1, [ self.tei_data_path1, self.tei_data_path2 ], element_equality_fields,\
+                                          { "label_path":[0] }, False) )
+        self.assertEqual( 2, len( results ) )
+
+    def test_xupath_plan(self):
+        element_equality_fields = [ CorpusElement.LABEL_PATH,\
+                                        CorpusElement.LANGUAGE_NAME_PATH,\
+                                        CorpusElement.TEXT ]
+        attribute_names = element_equality_fields
+        plan = XUPathPlan.compile( self.tei_xupath2 )
+        self.assertEqual( [ operation[0] for operation in plan.operations ],\
+                              [ XUPathPlan.PREFILTER, XUPathPlan.PARSE, XUPathPlan.PARSE, XUPathPlan.PARSE, XUPathPlan.FILTER ] )
+        self.assertEqual( plan.operations[3][1], TEIXMLGrammar.SUBSUBSECTION )
+        self.assertEqual( plan.operations[4][1].pattern, "Globus" )
+
+        # Plans are memoized by xupath
+        self.assertTrue( plan is XUPathPlan.compile( self.tei_xupath2 ) )
+        
+        # One plan runs against several corpora, with the results of XUGrep
+        for file_paths in [ [ self.tei_data_path1 ], [ self.tei_data_path2, self.tei_data_path3 ] ]:
+            corpus = Corpus.create_from_files( file_paths, element_equality_fields )
+            xugrep = XUGrep.create(self.tei_xupath2, file_paths, element_equality_fields)
+            self.assertEqual( plan.run( corpus ).output( attribute_names, True ),\
+                                  xugrep.corpus.output( attribute_names, True ) )
+
+        # Line steps and predicates in the middle of a path
+        plan = XUPathPlan.compile( "/builtin:file/ios:interface[ re:testsubtree('access-group','gi') ]/builtin:line" )
+        self.assertEqual( [ operation[0] for operation in plan.operations ],\
+                              [ XUPathPlan.PREFILTER, XUPathPlan.PARSE, XUPathPlan.FILTER, XUPathPlan.LINES ] )
+
+        # The parse keeps the lines of each interface, and the lines are
+        #  those that parsing each interface for builtin:line finds
+        self.assertEqual( plan.operations[1], ( XUPathPlan.PARSE, CiscoIOSGrammar.INTERFACE, BuiltinGrammar.LINE ) )
+        self.assertEqual( len( XUPathPlan.compile( "/ios:interface" ).operations[0] ), 2 )
+        self.assertEqual( len( XUPathPlan.compile( "/tei:section/builtin:line" ).operations[0] ), 2 )
+        file_paths = [ self.ios_data_path1, self.tei_data_path1 ]
+        try:
+            for native_scanners_enabled in [ True, False ]:
+                GrammarLibrary.set_native_scanners_enabled( native_scanners_enabled )
+                corpus = Corpus.create_from_files( file_paths, element_equality_fields, lazy_load=True )
+                interfaces = XUPathPlan.run_operation( plan.operations[1], corpus )
+                self.assertTrue( len( interfaces ) > 0 )
+                self.assertFalse( None in [ element.line_starts for element in interfaces.list() ] )
+                expected = corpus.parse( CiscoIOSGrammar.INTERFACE )
+                self.assertEqual( interfaces.parse_lines().output( attribute_names, True ),\
+                                      expected.parse( BuiltinGrammar.LINE ).output( attribute_names, True ) )
+                expected.filter( lambda x: "access-group" in x.get_text() )
+                self.assertEqual( plan.run( corpus ).output( attribute_names, True ),\
+                                      expected.parse( BuiltinGrammar.LINE ).output( attribute_names, True ) )
+        finally:
+            GrammarLibrary.set_native_scanners_enabled( True )
+
+        # A batch parses once for the xupaths that need the lines and
+        #  those that do not
+        batch = XUPathBatch.create( [ "/ios:interface", "/ios:interface/builtin:line" ] )
+        self.assertEqual( batch.get_num_operations(), 2 )
+        self.assertEqual( batch.root[1][0][0], ( XUPathPlan.PARSE, CiscoIOSGrammar.INTERFACE, BuiltinGrammar.LINE ) )
+
+        # An unknown grammar or production is an UndefinedLanguageName
+        for xupath in [ "/builtin:file/cisco:interface", "/builtin:file/ios:nonexistent" ]:
+            self.assertRaises( UndefinedLanguageName, XUPathPlan.compile, xupath )
+            self.assertFalse( xupath in XUPathPlan.plans )
+
+    def test_xupath_descendants(self):
+        # A step after // is on the descendant axis, rather than cut off
+        plan = XUPathPlan.compile( "/builtin:file//tei:section/tei:subsection//builtin:line" )
+        self.assertEqual( plan.operations, ( ( XUPathPlan.DESCENDANTS, TEIXMLGrammar.SECTION ),\
+                                                 ( XUPathPlan.PARSE, TEIXMLGrammar.SUBSECTION ),\
+                                                 ( XUPathPlan.DESCENDANTS, BuiltinGrammar.LINE ) ) )
+        plan = XUPathPlan.compile( "/ios:config[ re:testsubtree('access-group','gi') //ios:interface ]" )
+        self.assertEqual( [ operation[0] for operation in plan.operations ],\
+                              [ XUPathPlan.PREFILTER, XUPathPlan.PARSE, XUPathPlan.FILTER, XUPathPlan.DESCENDANTS ] )
+
+        element_equality_fields = [ CorpusElement.LABEL_PATH,\
+                                        CorpusElement.LANGUAGE_NAME_PATH,\
+                                        CorpusElement.TEXT ]
+        attribute_names = [ CorpusElement.LABEL_PATH, CorpusElement.TEXT ]
+        file_paths = [ self.ios_data_path1, self.tei_data_path1 ]
+        for xupath, child_xupath in [ ( "/ios:config//ios:interface", "/ios:config/ios:interface" ),\
+                                          ( self.tei_xupath1 + "//tei:subsubsection", self.tei_xupath1 + "/tei:subsubsection" ) ]:
+            results = XUGrep.create(xupath, file_paths, element_equality_fields).corpus.output( attribute_names, True )
+            expected = XUGrep.create(child_xupath, file_paths, element_equality_fields).corpus.output( attribute_names, True )
+            self.assertTrue( len(results) > 0 )
+            self.assertEqual( sorted( results ), sorted( expected ) )
+
+        # The descendants of each element at every depth are those that
+        #  a brute-force recursive scan finds: scan the element for the
+        #  language, and every subsection, subsubsection, and paragraph
+        #  (or block) within it, at every depth, for the language again.
+        #  They are compared by their bounds in the file, which the
+        #  scanners keep when the files have no tabs.
+        directory = tempfile.mkdtemp()
+        try:
+            file_paths = []
+            for data_path in [ self.ios_data_path1, self.tei_data_path1, self.tei_data_path3 ]:
+                fp = open( data_path, 'r' )
+                text = fp.read()
+                fp.close()
+                file_path = os.path.join( directory, os.path.basename( data_path ) )
+                fp = open( file_path, 'w' )
+                fp.write( text.expandtabs() )
+                fp.close()
+                file_paths.append( file_path )
+
+            get_bounds = lambda elements: set([ ( element.get_file_path(), element.text_start, element.text_end )\
+                                                    for element in elements ])
+            def scan_subtree(element, language_name, container_language_names):
+                bounds = get_bounds( element.parse( language_name ) )
+                for container_language_name in container_language_names:
+                    for child in element.parse( container_language_name ):
+                        if ( child.text_start, child.text_end ) != ( element.text_start, element.text_end ):
+                            bounds.update( scan_subtree( child, language_name, container_language_names ) )
+                return bounds
+
+            tei_containers = [ TEIXMLGrammar.SUBSECTION, TEIXMLGrammar.SUBSUBSECTION, TEIXMLGrammar.PARAGRAPH ]
+            ios_containers = [ CiscoIOSGrammar.INTERFACE, CiscoIOSGrammar.CRYPTO, CiscoIOSGrammar.VLAN ]
+            for context_xupath, language_name, container_language_names in\
+                    [ ( "/builtin:file/tei:section", BuiltinGrammar.LINE, tei_containers ),\
+                          ( "/builtin:file/tei:section", TEIXMLGrammar.SUBSUBSECTION, tei_containers ),\
+                          ( "/builtin:file/tei:section", TEIXMLGrammar.PARAGRAPH, tei_containers ),\
+                          ( "/builtin:file/tei:section/tei:subsection", BuiltinGrammar.LINE, tei_containers ),\
+                          ( "/builtin:file/ios:config", BuiltinGrammar.LINE, ios_containers ) ]:
+                contexts = XUGrep.create(context_xupath, file_paths, element_equality_fields).corpus.list()
+                expected = set()
+                for context in contexts:
+                    expected.update( scan_subtree( context, language_name, container_language_names ) -\
+                                         get_bounds( [ context ] ) )
+                results = XUGrep.create(context_xupath + "//" + language_name, file_paths, element_equality_fields).corpus
+                self.assertTrue( len(contexts) > 0 and len(results) > 0 )
+                self.assertEqual( expected, get_bounds( results.list() ), context_xupath + "//" + language_name )
+
+            # The lines of the subsubsections, two levels down, are among
+            #  the lines of their sections
+            sections = XUGrep.create("/builtin:file/tei:section", file_paths, element_equality_fields).corpus
+            subsubsection_lines = sections.parse( TEIXMLGrammar.SUBSUBSECTION ).parse( BuiltinGrammar.LINE )
+            section_lines = get_bounds( XUGrep.create("/builtin:file/tei:section//builtin:line", file_paths,\
+                                                          element_equality_fields).corpus.list() )
+            self.assertTrue( len( subsubsection_lines ) > 0 )
+            self.assertTrue( get_bounds( subsubsection_lines.list() ) <= section_lines )
+
+            # No production contains a match of itself, so a scan of an
+            #  element (/) already reaches every depth, and the
+            #  descendant axis differs from it only in that an element is
+            #  not its own descendant
+            for xupath in [ "/builtin:file/tei:section", "/builtin:file/ios:config" ]:
+                language_name = xupath.split("/")[-1]
+                contexts = XUGrep.create(xupath, file_paths, element_equality_fields).corpus.list()
+                children = XUGrep.create(xupath + "/" + language_name, file_paths, element_equality_fields).corpus
+                descendants = XUGrep.create(xupath + "//" + language_name, file_paths, element_equality_fields).corpus
+                self.assertEqual( get_bounds( children.list() ), get_bounds( contexts ) )
+                self.assertEqual( 0, len( descendants ) )
+        finally:
+            shutil.rmtree( directory )
+
+    def test_xupath_analysis(self):
+        xupath = "/builtin:file/ios:interface[ re:testsubtree('access-group','gi') ]/builtin:line"
+        plan = XUPathPlan.compile( xupath )
+        self.assertEqual( plan.get_rows(), [ [ 1, XUPathPlan.PREFILTER, "'access-group'" ],\
+                                                 [ 2, XUPathPlan.PARSE, CiscoIOSGrammar.INTERFACE + " with " + BuiltinGrammar.LINE ],\
+                                                 [ 3, XUPathPlan.FILTER, "access-group" ],\
+                                                 [ 4, XUPathPlan.LINES, BuiltinGrammar.LINE ] ] )
+
+        element_equality_fields = [ CorpusElement.LABEL_PATH,\
+                                        CorpusElement.LANGUAGE_NAME_PATH,\
+                                        CorpusElement.TEXT ]
+        file_paths = [ self.ios_data_path1, self.tei_data_path1 ]
+        cache_dir = tempfile.mkdtemp()
+        try:
+            cache = ParseCache.create( cache_dir, min_text_length=0 )
+            for run_idx in range(0, 2):
+                analysis = XUPathAnalysis.create( plan )
+                xugrep = XUGrep.create(xupath, file_paths, element_equality_fields, cache=cache, analysis=analysis)
+                rows = analysis.get_rows()
+                self.assertEqual( len(rows), len( plan.operations ) )
+                self.assertEqual( rows[0][3], len(file_paths) )
+                self.assertEqual( rows[-1][4], len( xugrep.corpus ) )
+                self.assertEqual( rows[1][3:6], [ 1, 2, os.path.getsize( self.ios_data_path1 ) ] )
+                for row, next_row in zip( rows, rows[1:] ):
+                    self.assertEqual( row[4], next_row[3] )
+                # The second run reads the interfaces from the cache
+                self.assertEqual( rows[1][6], run_idx )
+        finally:
+            shutil.rmtree( cache_dir )
+
+        # The statistics of streamed files add up
+        streamed = XUPathAnalysis.create( plan )
+        list( XUGrep.stream(xupath, file_paths, element_equality_fields, analysis=streamed) )
+        self.assertEqual( [ row[3:6] for row in streamed.get_rows() ], [ row[3:6] for row in rows ] )
+        self.assertEqual( len( streamed.format_table().split("\n") ), len(rows) + 1 )
+
+    def test_xupath_prefilter(self):
+        self.assertEqual( get_required_literals( re.compile("^interface (Vlan|Loopback)100\\b") ),\
+                              [ "interface", "100" ] )
+        self.assertEqual( get_required_literals( re.compile("access group") ), [ "access", "group" ] )
+        self.assertEqual( get_required_literals( re.compile("acl1|acl2") ), [ "acl" ] )
+        self.assertEqual( get_required_literals( re.compile("acl|vlan") ), [] )
+        self.assertEqual( get_required_literals( re.compile("(?i)Globus") ), [] )
+        self.assertEqual( XUPathPlan.compile( self.tei_xupath1 ).operations[0][0], XUPathPlan.PARSE )
+
+        # Files without the literal are not parsed, and the results are
+        #  those of the predicate alone
+        element_equality_fields = [ CorpusElement.LABEL_PATH,\
+                                        CorpusElement.LANGUAGE_NAME_PATH,\
+                                        CorpusElement.TEXT ]
+        attribute_names = element_equality_fields
+        file_paths = [ self.ios_data_path1, self.tei_data_path1 ]
+        for lazy_load in [ False, True ]:
+            for pattern in [ "access-group", "Loopback", "outbound", "Vlan3" ]:
+                xupath = "/builtin:file/ios:interface[ re:testsubtree('" + pattern + "','gi') ]"
+                corpus = Corpus.create_from_files( file_paths, element_equality_fields, lazy_load=lazy_load )
+                unfiltered = corpus.parse( CiscoIOSGrammar.INTERFACE )
+                unfiltered.filter( lambda x: re.search( pattern, x.get_text() ) != None )
+                xugrep = XUGrep.create(xupath, file_paths, element_equality_fields, lazy_load=lazy_load)
+                self.assertEqual( sorted( xugrep.corpus.output( attribute_names, True ) ),\
+                                      sorted( unfiltered.output( attribute_names, True ) ) )
+
+        # Running a plan leaves its corpus as it was, so that another
+        #  plan may run against it
+        corpus = Corpus.create_from_files( file_paths, element_equality_fields )
+        XUPathPlan.compile( self.ios_xupath2.replace( "//", "/builtin:file/" ) ).run( corpus )
+        self.assertEqual( len( corpus ), 2 )
+        self.assertEqual( len( XUPathPlan.compile( "/builtin:file/tei:section" ).run( corpus ) ), 2 )
+
+    def test_xugrep_batch(self):
+        file_paths = [ self.ios_data_path1, self.tei_data_path1, self.tei_data_path2 ]
+        element_equality_fields = [ CorpusElement.LABEL_PATH,\
+                                        CorpusElement.LANGUAGE_NAME_PATH,\
+                                        CorpusElement.TEXT ]
+        attribute_names = element_equality_fields
+        xupaths = [ "/builtin:file/ios:interface",\
+                        "/builtin:file/ios:interface/builtin:line",\
+                        "/builtin:file/ios:interface[ re:testsubtree('access-group','gi') ]/builtin:line",\
+                        "/builtin:file/ios:interface[ re:testsubtree('Loopback','gi') ]",\
+                        self.tei_xupath2,\
+                        "/builtin:file/ios:interface" ]
+
+        # The interfaces are extracted once for all four ios xupaths
+        batch = XUPathBatch.create( xupaths )
+        self.assertEqual( batch.get_num_operations(), 9 )
+
+        xugreps = XUGrep.create_batch(xupaths, file_paths, element_equality_fields)
+        streamed = [ [] for xupath in xupaths ]
+        for xupath_idx, element in XUGrep.stream_batch(xupaths, file_paths, element_equality_fields):
+            streamed[xupath_idx].append( Corpus.output_element( element, attribute_names, True ) )
+        for xupath, xugrep, streamed_results in zip( xupaths, xugreps, streamed ):
+            results = XUGrep.create(xupath, file_paths, element_equality_fields).corpus.output( attribute_names, True )
+            self.assertTrue( len(results) > 0 )
+            self.assertEqual( xugrep.corpus.output( attribute_names, True ), results )
+            self.assertEqual( sorted( streamed_results ), sorted( results ) )
+
+        # A predicate on the first step does not filter the corpus of the batch
+        corpus = Corpus.create_from_files( file_paths, element_equality_fields )
+        XUPathBatch.create([ "/builtin:file[ re:testsubtree('Globus','gi') ]", "/builtin:file" ]).run( corpus )
+        self.assertEqual( len(corpus), 3 )
+
 class TestXUWc( unittest.TestCase ):
     
     tei_data_path1 = None
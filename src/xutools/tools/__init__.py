@@ -17,88 +17,645 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see http://www.gnu.org/licenses/
 """
 from pyparsing import *
-from xutools.corpus import Corpus
+from xutools.corpus import Corpus, CorpusElement
+from xutools.exceptions import UndefinedLanguageName
 from xutools.analysis.distances import ZhangShashaTreeDist as TD
 from xutools.grammar import GrammarLibrary
 from xutools.grammar.pyparsing.BuiltinGrammar import BuiltinGrammar
 from xutools.grammar.pyparsing.XUPathGrammar import XUPathGrammar
 from xutools.parsers import PythonDictionaryParseTree
+import json
+import multiprocessing
+import os
 import re
+import sre_constants
+import sre_parse
 import sys
+import time
 
 ## package xutools.tools
 #   This module contains classes for each of our XUTools.  Currently 
 #     this means xugrep, xuwc, and xudiff.
 
+## A compiled xupath: the operations that evaluating it performs on a
+#   corpus, in order.  Each operation is a tuple whose first item is
+#   its kind:
+#
+#   (PARSE, language_name) extracts the strings of a language,
+#   (DESCENDANTS, language_name) extracts the strings of a language in
+#   the file that lie within each element, for a step after //; see
+#   Corpus.parse_descendants,
+#   (LINES,) extracts lines, see Corpus.parse_lines, and
+#   (FILTER, pattern) keeps the elements whose text the compiled
+#   pattern of a predicate matches, and
+#   (PREFILTER, literals) keeps the elements whose text contains every
+#   literal; see get_required_literals.
+#
+#  A result is a string within its file that every predicate above it
+#   matched, so a file that lacks a literal that some predicate
+#   requires has no results.  When the predicates require literals, the
+#   plan starts with a PREFILTER, so that such files are never parsed.
+#
+#  A plan is immutable and holds no corpus, so one plan can be run
+#   against any number of corpora.  Plans are memoized by xupath, see
+#   compile.
+class XUPathPlan():
+
+    PARSE = "parse"
+    DESCENDANTS = "descendants"
+    LINES = "lines"
+    FILTER = "filter"
+    PREFILTER = "prefilter"
+
+    # Plans by xupath; cleared when it holds MAX_PLANS
+    MAX_PLANS = 1000
+    plans = {}
+
+    xupath = None
+    operations = None
+
+    ## Compile an xupath, or get the plan it was compiled to before
+    #
+    #  @param[in] xupath The xupath query
+    #  @exception UndefinedLanguageName if a step names a grammar or a
+    #    production that the GrammarLibrary does not define
+    #  @return the plan
+    @staticmethod
+    def compile(xupath):
+        plan = XUPathPlan.plans.get( xupath )
+        if None != plan:
+            return plan
+        plan = XUPathPlan()
+        plan.xupath = xupath
+        operations = []
+        plan.add_path( XUGrep.parse_xupath( xupath ), operations )
+        literals = []
+        for operation in operations:
+            if XUPathPlan.FILTER == operation[0]:
+                for literal in get_required_literals( operation[1] ):
+                    if not literal in literals:
+                        literals.append( literal )
+        if literals:
+            operations.insert( 0, ( XUPathPlan.PREFILTER, tuple( literals ) ) )
+
+        # Resolve the productions now rather than at the first element
+        grammar_library = GrammarLibrary()
+        for operation in operations:
+            if operation[0] in ( XUPathPlan.PARSE, XUPathPlan.DESCENDANTS ):
+                grammar_name = grammar_library.get_grammar_name( operation[1] )
+                if None == GrammarLibrary.get_grammar_class( grammar_name ):
+                    raise UndefinedLanguageName("Unable to find grammar:" + grammar_name +\
+                                                    " for language name:" + operation[1])
+                grammar_library.get_language_record( operation[1] )
+
+        # A parse whose matches are split into lines next (filters keep
+        #  the elements they take) keeps the lines that its grammar
+        #  captures, so that the lines are not found again
+        for operation_idx, operation in enumerate( operations ):
+            if XUPathPlan.PARSE != operation[0]:
+                continue
+            next_operations = [ next_operation for next_operation in operations[operation_idx + 1:]\
+                                    if XUPathPlan.FILTER != next_operation[0] ]
+            if next_operations and XUPathPlan.LINES == next_operations[0][0] and\
+                    grammar_library.get_language_record( operation[1] ).captures_lines():
+                operations[operation_idx] = ( XUPathPlan.PARSE, operation[1], BuiltinGrammar.LINE )
+        plan.operations = tuple( operations )
+
+        if len( XUPathPlan.plans ) >= XUPathPlan.MAX_PLANS:
+            XUPathPlan.plans.clear()
+        XUPathPlan.plans[xupath] = plan
+        return plan
+
+    ## Evaluate the plan
+    #
+    #  @param[in] corpus The corpus to start from, which is not changed
+    #  @param[in] pool An optional multiprocessing.Pool, see Corpus.parse
+    #  @param[in] cache An optional xutools.cache.ParseCache, see Corpus.parse
+    #  @param[in] analysis An optional XUPathAnalysis of this plan, to
+    #    which the statistics of each operation are added
+    #  @return the result corpus
+    def run(self, corpus, pool=None, cache=None, analysis=None):
+        for operation_idx, operation in enumerate( self.operations ):
+            if None == analysis:
+                corpus = XUPathPlan.run_operation( operation, corpus, pool, cache )
+                continue
+            num_elements = len(corpus)
+            num_bytes = sum([ element.get_text_length() for element in corpus.corpus_elements ])
+            cache_hits = 0
+            if None != cache:
+                cache_hits = cache.hits
+            start_time = time.time()
+            start_cpu_time = sum( os.times()[:2] )
+            corpus = XUPathPlan.run_operation( operation, corpus, pool, cache )
+            elapsed = time.time() - start_time
+            cpu_elapsed = sum( os.times()[:2] ) - start_cpu_time
+            if None != cache:
+                cache_hits = cache.hits - cache_hits
+            analysis.record( operation_idx, num_elements, len(corpus), num_bytes, cache_hits, elapsed, cpu_elapsed )
+        return corpus
+
+    ## Describe the operations of the plan, for xugrep --explain
+    #
+    #  @return a list of [ step, operation, argument ], one per operation
+    def get_rows(self):
+        rows = []
+        for operation_idx, operation in enumerate( self.operations ):
+            if XUPathPlan.LINES == operation[0]:
+                argument = BuiltinGrammar.LINE
+            elif XUPathPlan.FILTER == operation[0]:
+                argument = operation[1].pattern
+            elif XUPathPlan.PREFILTER == operation[0]:
+                argument = " ".join( [ repr(literal) for literal in operation[1] ] )
+            elif XUPathPlan.PARSE == operation[0] and 2 < len(operation):
+                argument = operation[1] + " with " + operation[2]
+            else:
+                argument = operation[1]
+            rows.append( [ operation_idx + 1, operation[0], argument ] )
+        return rows
+
+    ## @return the plan as a table, one line per operation
+    def format_table(self):
+        return format_plan_table( [ "step", "operation", "argument" ], self.get_rows() )
+
+    ## Perform one operation on a corpus
+    #
+    #  @return the result corpus; the corpus itself is not changed, as
+    #    filters select its elements into a copy
+    @staticmethod
+    def run_operation(operation, corpus, pool=None, cache=None):
+        if XUPathPlan.PARSE == operation[0]:
+            # A third item is the language whose matches the parse keeps
+            corpus = corpus.parse( operation[1], pool, cache, 2 < len(operation) )
+        elif XUPathPlan.DESCENDANTS == operation[0]:
+            corpus = corpus.parse_descendants( operation[1], cache )
+        elif XUPathPlan.LINES == operation[0]:
+            # The lines of an element come from its parse, or from the
+            #  newlines of its file, without scanning its text again
+            corpus = corpus.parse_lines()
+        elif XUPathPlan.PREFILTER == operation[0]:
+            literals = operation[1]
+            corpus = corpus.copy()
+            corpus.filter( lambda x: may_match( x, literals ) )
+        else:
+            pattern = operation[1]
+            corpus = corpus.copy()
+            corpus.filter( lambda x: pattern.search(x.get_text()) != None )
+        return corpus
+
+    ## @return a key that is equal for equal operations
+    @staticmethod
+    def get_operation_key(operation):
+        if XUPathPlan.FILTER == operation[0]:
+            return ( XUPathPlan.FILTER, operation[1].pattern, operation[1].flags )
+        if XUPathPlan.PARSE == operation[0]:
+            return operation[:2]
+        return operation
+
+    # The operations of a path node, its current step and then its next steps
+    def add_path(self, xupath_pt_node, operations):
+        if xupath_pt_node == None or len(xupath_pt_node) == 0:
+            return
+        self.add_step( xupath_pt_node.current_step, operations )
+        self.add_next_steps( xupath_pt_node.next_steps, operations )
+
+    # The operations of a step, its production and then its predicate
+    def add_step(self, step_pt_node, operations, descendant=False):
+        if step_pt_node == None or len(step_pt_node) == 0:
+            return
+        production_pt_node = step_pt_node.production
+        if production_pt_node != None:
+            language_name = production_pt_node[0]
+            if descendant and language_name != BuiltinGrammar.FILE:
+                operations.append( ( XUPathPlan.DESCENDANTS, language_name ) )
+            elif BuiltinGrammar.LINE == language_name:
+                operations.append( ( XUPathPlan.LINES, ) )
+            elif language_name != BuiltinGrammar.FILE:
+                operations.append( ( XUPathPlan.PARSE, language_name ) )
+
+        predicate_pt_node = step_pt_node.predicate
+        if predicate_pt_node == None or len(predicate_pt_node) == 0:
+            return
+        operations.append( ( XUPathPlan.FILTER, re.compile(predicate_pt_node.re_match[2]) ) )
+        self.add_next_steps( predicate_pt_node.next_steps, operations )
+
+    def add_next_steps(self, next_steps_pt_nodes, operations):
+        if next_steps_pt_nodes == None or len(next_steps_pt_nodes) == 0:
+            return
+        # A step after // is on the descendant axis
+        descendant = False
+        for step_pt_node in next_steps_pt_nodes:
+            if step_pt_node == '/' or step_pt_node == '//':
+                descendant = ( step_pt_node == '//' )
+            else:
+                self.add_step( step_pt_node, operations, descendant )
+
+## The statistics of each operation of a plan over one or more runs, for
+#   xugrep --analyze: the number of elements that it took and returned,
+#   the bytes of the text of the elements that it took, the parse cache
+#   hits, and its wall and CPU time.  The CPU time is that of this
+#   process, not of the workers of a pool.
+class XUPathAnalysis():
+    FIELD_NAMES = [ "step", "operation", "argument", "elements in", "elements out",\
+                        "bytes in", "cache hits", "seconds", "cpu seconds" ]
+    FORMATS = [ "table", "json" ]
+
+    plan = None
+    # [ elements in, elements out, bytes in, cache hits, seconds,
+    #  cpu seconds ] by the index of each operation
+    counters = None
+
+    ## @param[in] plan The XUPathPlan to analyze
+    #  @return an empty analysis
+    @staticmethod
+    def create(plan):
+        analysis = XUPathAnalysis()
+        analysis.plan = plan
+        analysis.counters = [ [ 0, 0, 0, 0, 0.0, 0.0 ] for operation in plan.operations ]
+        return analysis
+
+    ## Add the statistics of one run of an operation
+    def record(self, operation_idx, num_elements_in, num_elements_out, num_bytes_in, cache_hits,\
+                   elapsed, cpu_elapsed):
+        counter = self.counters[operation_idx]
+        for idx, value in enumerate( [ num_elements_in, num_elements_out, num_bytes_in, cache_hits,\
+                                           elapsed, cpu_elapsed ] ):
+            counter[idx] = counter[idx] + value
+
+    ## @return a list of rows, one per operation in the order that they
+    #    run, see FIELD_NAMES
+    def get_rows(self):
+        return [ row + counter for row, counter in zip( self.plan.get_rows(), self.counters ) ]
+
+    ## @return the analysis as a table, one line per operation
+    def format_table(self):
+        rows = [ row[:7] + [ "%.6f" % row[7], "%.6f" % row[8] ] for row in self.get_rows() ]
+        return format_plan_table( self.FIELD_NAMES, rows )
+
+    ## @return the analysis as a JSON list of objects, one per operation
+    def format_json(self):
+        return json.dumps( [ dict( zip( self.FIELD_NAMES, row ) ) for row in self.get_rows() ], indent=1, sort_keys=True )
+
+    ## Write the analysis in one of FORMATS
+    #
+    #  @param[in] format_name "table" or "json"
+    #  @param[in] fp The file to write to
+    def write(self, format_name, fp):
+        if "json" == format_name:
+            fp.write( self.format_json() + "\n" )
+        else:
+            fp.write( self.format_table() + "\n" )
+
+## Format rows as a table with aligned columns: the step on the right,
+#   the operation and its argument on the left, and numbers on the right
+#
+#  @param[in] field_names The header of each column
+#  @param[in] rows The rows, each a step, an operation, an argument, and
+#    then numbers
+#  @return the table
+def format_plan_table(field_names, rows):
+    rows = [ field_names ] + [ [ str(value) for value in row ] for row in rows ]
+    widths = [ max( [ len( row[idx] ) for row in rows ] ) for idx in range( len( field_names ) ) ]
+    lines = []
+    for row in rows:
+        values = [ value.rjust( width ) for value, width in zip( row, widths ) ]
+        values[1:3] = [ value.ljust( width ) for value, width in zip( row[1:3], widths[1:3] ) ]
+        lines.append( "  ".join( values ).rstrip() )
+    return "\n".join( lines )
+
+## A batch of xupaths evaluated together.  The operations of their
+#   plans form a trie, so xupaths that share a prefix, such as
+#   /builtin:file/ios:interface, share its results: each distinct
+#   operation runs once, and the result of every xupath is the corpus
+#   at the node where its operations end.
+#
+#  Each node of the trie is a list [ operation, children, indexes of
+#   the xupaths that end at the node ].  The PREFILTER of each plan is
+#   left out of the trie; instead an element passes the root if it may
+#   match any xupath of the batch.
+class XUPathBatch():
+
+    xupaths = None
+    plans = None
+    root = None
+
+    ## @param[in] xupaths The xupath queries
+    #  @return the batch
+    @staticmethod
+    def create(xupaths):
+        batch = XUPathBatch()
+        batch.xupaths = list(xupaths)
+        batch.plans = [ XUPathPlan.compile( xupath ) for xupath in batch.xupaths ]
+        batch.root = [ None, [], [] ]
+        for plan_idx, plan in enumerate( batch.plans ):
+            node = batch.root
+            for operation in plan.operations:
+                if XUPathPlan.PREFILTER == operation[0]:
+                    continue
+                node = batch.get_child( node, operation )
+            node[2].append( plan_idx )
+        return batch
+
+    # Get the child of a node for an operation, adding it if needed
+    def get_child(self, node, operation):
+        key = XUPathPlan.get_operation_key( operation )
+        for child in node[1]:
+            if key == XUPathPlan.get_operation_key( child[0] ):
+                # A parse that keeps the lines of its matches serves the
+                #  xupaths that do not need them as well
+                if len(operation) > len( child[0] ):
+                    child[0] = operation
+                return child
+        child = [ operation, [], [] ]
+        node[1].append( child )
+        return child
+
+    ## @return the number of operations in the trie, which is the number
+    #    that run evaluates
+    def get_num_operations(self):
+        num_operations = 0
+        nodes = list( self.root[1] )
+        while nodes:
+            node = nodes.pop()
+            num_operations = num_operations + 1
+            nodes.extend( node[1] )
+        return num_operations
+
+    ## Evaluate every xupath of the batch
+    #
+    #  @param[in] corpus The corpus to start from, which is not changed
+    #  @param[in] pool An optional multiprocessing.Pool, see Corpus.parse
+    #  @param[in] cache An optional xutools.cache.ParseCache, see Corpus.parse
+    #  @return a list of result corpora, one per xupath, in order
+    def run(self, corpus, pool=None, cache=None):
+        results = [ None ] * len( self.plans )
+        prefilters = [ plan.operations[0][1] for plan in self.plans\
+                           if plan.operations and XUPathPlan.PREFILTER == plan.operations[0][0] ]
+        if prefilters and len(prefilters) == len( self.plans ):
+            corpus = corpus.copy()
+            corpus.filter( lambda x: any( may_match( x, literals ) for literals in prefilters ) )
+        self.run_node( self.root, corpus, results, pool, cache )
+        return results
+
+    # Evaluate a node and its children, depth first, so that only the
+    #  corpora along one path of the trie are held at a time
+    def run_node(self, node, corpus, results, pool, cache):
+        for plan_idx in node[2]:
+            results[plan_idx] = corpus
+        for child in node[1]:
+            child_corpus = XUPathPlan.run_operation( child[0], corpus, pool, cache )
+            self.run_node( child, child_corpus, results, pool, cache )
+
+## Whether the text of an element contains every literal.  We release
+#   the buffer of an element that does not, since it will not be parsed.
+def may_match(corpus_element, literals):
+    for literal in literals:
+        if not corpus_element.contains_text( literal ):
+            corpus_element.release_text()
+            return False
+    return True
+
+## Find strings that every match of a pattern contains.
+#
+#  The text of an element may have had its tabs expanded, so we only
+#   keep runs of literal ASCII characters other than whitespace, and
+#   give up on patterns that ignore case.
+#
+#  @param[in] pattern A compiled regular expression
+#  @return a list of strings, empty if we know of none
+def get_required_literals(pattern):
+    try:
+        subpattern = sre_parse.parse( pattern.pattern, pattern.flags )
+    except ( sre_constants.error, TypeError ):
+        return []
+    if subpattern.pattern.flags & re.IGNORECASE:
+        return []
+    literals = []
+    add_required_literals( subpattern, literals )
+    return literals
+
+# Add the runs of literal characters that a parsed pattern requires
+def add_required_literals(subpattern, literals):
+    run = []
+    for op, av in subpattern:
+        if sre_constants.LITERAL == op and av < 128 and not chr(av).isspace():
+            run.append( chr(av) )
+            continue
+        if run:
+            literals.append( "".join(run) )
+            run = []
+        if sre_constants.SUBPATTERN == op:
+            add_required_literals( av[1], literals )
+        elif op in ( sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT ) and av[0] >= 1:
+            add_required_literals( av[2], literals )
+    if run:
+        literals.append( "".join(run) )
+
 ## The XUGrep class implements xugrep
 class XUGrep():
     
     corpus = None
     element_equality_fields = None
+    pool = None
+    cache = None
     ## Method used by the command line interface.
     #  @param[in] xupath The xupath query that specifies a result set
     #  @param[in] input_corpus The corpus from which to extract results
+    #  @param[in] lazy_load If true, read each file only when a step parses it
+    #  @param[in] workers If greater than one, the number of processes
+    #    over which to scan the elements of the corpus at each step
+    #  @param[in] cache An optional xutools.cache.ParseCache of parse results
+    #  @param[in] analysis An optional XUPathAnalysis of the plan of the
+    #    xupath, see XUPathPlan.run
     #  @return the result corpus
     @staticmethod
     def create(xupath, file_paths, element_equality_fields,\
                    path_field_equality_components=None,\
-                   path_field_equality_components_is_whitelist=None):
-        # Instantiate the XUPath
-        xupath_parse_trees = []
-        grammar_library = GrammarLibrary()
-        grammar_production = grammar_library.get_grammar( XUPathGrammar.XUPATH )
-        matches = grammar_production.scanString( xupath )
-        for p, s, e in matches:
-            xupath_parse_trees.append(p)
-        xupath_pt_node = xupath_parse_trees[0].path
+                   path_field_equality_components_is_whitelist=None,\
+                   lazy_load=False, workers=None, cache=None, analysis=None):
+        plan = XUPathPlan.compile( xupath )
 
         # Now do XUGrep
         xugrep = XUGrep()
         xugrep.corpus = Corpus.create_from_files( file_paths, element_equality_fields,\
                                                       path_field_equality_components,\
-                                                      path_field_equality_components_is_whitelist )
-        xugrep.process_xupath(xupath_pt_node)
+                                                      path_field_equality_components_is_whitelist,\
+                                                      lazy_load )
+        xugrep.cache = cache
+        if None != workers and workers > 1:
+            xugrep.pool = multiprocessing.Pool( workers )
+        try:
+            xugrep.corpus = plan.run( xugrep.corpus, xugrep.pool, xugrep.cache, analysis )
+        finally:
+            if None != xugrep.pool:
+                xugrep.pool.close()
+                xugrep.pool.join()
+                xugrep.pool = None
         return xugrep
 
-    def process_xupath(self, xupath_pt_node):
-        if xupath_pt_node == None or len(xupath_pt_node) == 0:
-            return
+    ## Evaluate a batch of xupaths over the same files, sharing the
+    #   steps that they have in common; see XUPathBatch.
+    #
+    #  @param[in] xupaths The xupath queries
+    #  @return a list of XUGreps, one per xupath, in order
+    @staticmethod
+    def create_batch(xupaths, file_paths, element_equality_fields,\
+                         path_field_equality_components=None,\
+                         path_field_equality_components_is_whitelist=None,\
+                         lazy_load=False, workers=None, cache=None):
+        batch = XUPathBatch.create( xupaths )
+        corpus = Corpus.create_from_files( file_paths, element_equality_fields,\
+                                               path_field_equality_components,\
+                                               path_field_equality_components_is_whitelist,\
+                                               lazy_load )
+        pool = None
+        if None != workers and workers > 1:
+            pool = multiprocessing.Pool( workers )
+        try:
+            corpora = batch.run( corpus, pool, cache )
+        finally:
+            if None != pool:
+                pool.close()
+                pool.join()
+        xugreps = []
+        for result_corpus in corpora:
+            xugrep = XUGrep()
+            xugrep.corpus = result_corpus
+            xugrep.cache = cache
+            xugreps.append( xugrep )
+        return xugreps
 
-        self.process_step(xupath_pt_node.current_step )
-        self.process_next_steps(xupath_pt_node.next_steps )
-        
-    def process_step(self, step_pt_node):
-        if step_pt_node == None or len(step_pt_node) == 0:
-            return
-        
-        self.process_production( step_pt_node.production )
-        self.process_predicate( step_pt_node.predicate )
-        
-    def process_next_steps(self, next_steps_pt_nodes):
-        if next_steps_pt_nodes == None or len(next_steps_pt_nodes) == 0:
-            return
-        
-        for step_pt_node in next_steps_pt_nodes:
-            if step_pt_node != '/' and step_pt_node != '//':
-                self.process_step(step_pt_node)
-                
-    def process_production(self, production_pt_node):
-        if production_pt_node == None:
-            return
-        
-        old_corpus = self.corpus
-        language_name = production_pt_node[0]
-        if language_name != BuiltinGrammar.FILE:
-            self.corpus = old_corpus.parse( language_name )
+    ## Evaluate an xupath one file at a time.  Each file flows through 
+    #   every step and predicate of the xupath, and its results are
+    #   yielded before the next file is read, so memory is bounded by 
+    #   the largest file rather than by the corpus.
+    #
+    #  @param[in] xupath The xupath query that specifies a result set
+    #  @param[in] file_paths The files from which to extract results, in
+    #    the order in which they are processed
+    #  @param[in] unique If true, do not yield a result equal to one
+    #    that an earlier file yielded.  Only the results of files that
+    #    may share results are remembered (see get_result_groups), and
+    #    only until the last of those files is read.
+    #  @param[in] cache An optional xutools.cache.ParseCache of parse results
+    #  @param[in] analysis An optional XUPathAnalysis, to which the 
+    #    statistics of every file are added
+    #  @return a generator of result corpus elements
+    @staticmethod
+    def stream(xupath, file_paths, element_equality_fields,\
+                   path_field_equality_components=None,\
+                   path_field_equality_components_is_whitelist=None,\
+                   lazy_load=False, unique=True, cache=None, analysis=None):
+        plan = XUPathPlan.compile( xupath )
+        result_groups = XUGrep.get_result_groups( file_paths, element_equality_fields,\
+                                                      path_field_equality_components,\
+                                                      path_field_equality_components_is_whitelist )
+        yielded_keys = {}
+        for file_idx, file_path in enumerate( file_paths ):
+            xugrep = XUGrep()
+            xugrep.corpus = Corpus.create_from_files( [ file_path ], element_equality_fields,\
+                                                          path_field_equality_components,\
+                                                          path_field_equality_components_is_whitelist,\
+                                                          lazy_load )
+            xugrep.cache = cache
+            xugrep.corpus = plan.run( xugrep.corpus, cache=cache, analysis=analysis )
+            keys = None
+            if unique and None != result_groups[file_idx]:
+                keys = yielded_keys.setdefault( result_groups[file_idx][0], set() )
+            for element in xugrep.corpus.list():
+                if None != keys:
+                    equality_key = element.get_equality_key()
+                    if equality_key in keys:
+                        continue
+                    keys.add( equality_key )
+                yield element
+            if None != keys and result_groups[file_idx][1]:
+                del yielded_keys[ result_groups[file_idx][0] ]
 
+    ## Group files whose results may be equal.  A result's label path
+    #   starts with the basename of its file, so unless the equality 
+    #   fields leave out that component, only files with the same
+    #   basename may share results.
+    #
+    #  @param[in] file_paths The files, in the order they are processed
+    #  @return a list with, for each file, None if no other file may 
+    #    share its results, or (group, is_last) where is_last is true
+    #    for the last file of its group
+    @staticmethod
+    def get_result_groups(file_paths, element_equality_fields,\
+                              path_field_equality_components=None,\
+                              path_field_equality_components_is_whitelist=None):
+        by_basename = CorpusElement.LABEL_PATH in element_equality_fields
+        if by_basename and None != path_field_equality_components and\
+                None != path_field_equality_components_is_whitelist and\
+                CorpusElement.LABEL_PATH in path_field_equality_components:
+            idxs = path_field_equality_components[CorpusElement.LABEL_PATH]
+            by_basename = ( 0 in idxs ) == bool( path_field_equality_components_is_whitelist )
+        groups = []
+        for file_path in file_paths:
+            if by_basename:
+                groups.append( os.path.basename( file_path ) )
+            else:
+                groups.append( "" )
+        last_idxs = {}
+        group_sizes = {}
+        for idx, group in enumerate( groups ):
+            last_idxs[group] = idx
+            group_sizes[group] = group_sizes.get( group, 0 ) + 1
+        result_groups = []
+        for idx, group in enumerate( groups ):
+            if 1 == group_sizes[group]:
+                result_groups.append( None )
+            else:
+                result_groups.append( ( group, idx == last_idxs[group] ) )
+        return result_groups
 
-    def process_predicate( self, predicate_pt_node ):
-        if predicate_pt_node == None or len(predicate_pt_node) == 0:
-            return
-        
-        pattern = re.compile(predicate_pt_node.re_match[2])
-        self.corpus.filter( lambda x: pattern.search(x.text) != None )
-        self.process_next_steps(predicate_pt_node.next_steps)
+    ## Evaluate a batch of xupaths one file at a time; see stream and
+    #   create_batch.
+    #
+    #  @param[in] xupaths The xupath queries
+    #  @return a generator of (index of the xupath, result corpus element)
+    @staticmethod
+    def stream_batch(xupaths, file_paths, element_equality_fields,\
+                         path_field_equality_components=None,\
+                         path_field_equality_components_is_whitelist=None,\
+                         lazy_load=False, unique=True, cache=None):
+        batch = XUPathBatch.create( xupaths )
+        result_groups = XUGrep.get_result_groups( file_paths, element_equality_fields,\
+                                                      path_field_equality_components,\
+                                                      path_field_equality_components_is_whitelist )
+        yielded_keys = {}
+        for file_idx, file_path in enumerate( file_paths ):
+            corpus = Corpus.create_from_files( [ file_path ], element_equality_fields,\
+                                                   path_field_equality_components,\
+                                                   path_field_equality_components_is_whitelist,\
+                                                   lazy_load )
+            keys = None
+            if unique and None != result_groups[file_idx]:
+                keys = yielded_keys.setdefault( result_groups[file_idx][0], [ set() for xupath in batch.xupaths ] )
+            for xupath_idx, result_corpus in enumerate( batch.run( corpus, cache=cache ) ):
+                for element in result_corpus.list():
+                    if None != keys:
+                        equality_key = element.get_equality_key()
+                        if equality_key in keys[xupath_idx]:
+                            continue
+                        keys[xupath_idx].add( equality_key )
+                    yield ( xupath_idx, element )
+            if None != keys and result_groups[file_idx][1]:
+                del yielded_keys[ result_groups[file_idx][0] ]
+
+    ## Parse an xupath
+    #
+    #  @param[in] xupath The xupath query 
+    #  @return the path node of its parse tree
+    @staticmethod
+    def parse_xupath(xupath):
+        xupath_parse_trees = []
+        grammar_library = GrammarLibrary()
+        grammar_production = grammar_library.get_grammar( XUPathGrammar.XUPATH )
+        matches = grammar_production.scanString( xupath )
+        for p, s, e in matches:
+            xupath_parse_trees.append(p)
+        return xupath_parse_trees[0].path
 
 ## The XUWc class implements xuwc
 class XUWc():
@@ -114,18 +671,31 @@ class XUWc():
     #  @param[in] container_unit The context in which to count
     #  @param[in] count_unit The unit to count within the container unit
     #  @param[in] file_paths The files from which to extract results
+    #  @param[in] lazy_load If true, read each file only when a step parses it
+    #  @param[in] workers If greater than one, the number of processes
+    #    over which to run xugrep
+    #  @param[in] stream If true, count the results of XUGrep.stream one 
+    #    file at a time rather than keeping the xugrep corpus
+    #  @param[in] cache An optional xutools.cache.ParseCache of parse results
+    #  @param[in] analysis An optional XUPathAnalysis, see XUGrep.create
     #  @return the result corpus
     @staticmethod
-    def create(xupath, file_paths, element_equality_fields, count_unit, container_unit="builtin:file", label_path_delimiter=":" ):
-
-        xugrep = XUGrep.create(xupath, file_paths, element_equality_fields)
+    def create(xupath, file_paths, element_equality_fields, count_unit, container_unit="builtin:file", label_path_delimiter=":",\
+                   lazy_load=False, workers=None, stream=False, cache=None, analysis=None ):
 
         xuwc = XUWc()
         xuwc.container_unit = container_unit
         xuwc.count_unit = count_unit
         xuwc.counts = {}
-        xuwc.xugrep_corpus = xugrep.corpus
         xuwc.label_path_delimiter = label_path_delimiter
+        if stream:
+            elements = XUGrep.stream(xupath, file_paths, element_equality_fields, lazy_load=lazy_load, cache=cache,\
+                                         analysis=analysis)
+        else:
+            xugrep = XUGrep.create(xupath, file_paths, element_equality_fields, lazy_load=lazy_load, workers=workers,\
+                                       cache=cache, analysis=analysis)
+            xuwc.xugrep_corpus = xugrep.corpus
+            elements = xugrep.corpus.list()
 
         """
          0.  Run xugrep
@@ -137,7 +707,7 @@ class XUWc():
                 counts[label] += 1 (unless count unit is a builtin, then we extract appropriately)
              c) output the counts, sorted by label somehow   
         """
-        for element in xuwc.xugrep_corpus.list():
+        for element in elements:
             if container_unit in element.language_name_path:
                 container_idx = element.language_name_path.index(container_unit)
             else:
@@ -154,15 +724,15 @@ class XUWc():
         if BuiltinGrammar.BYTE == self.count_unit:
             if container_idx != len( element.language_name_path ) - 1:
                 raise TypeError( BuiltinGrammar.BYTE + " extraction must be done on last language unit in XUPath")
-            match_counts = len( element.text )
+            match_counts = len( element.get_text() )
         elif BuiltinGrammar.CHARACTER == self.count_unit:
             if container_idx != len( element.language_name_path ) - 1:
                 raise TypeError( BuiltinGrammar.CHARACTER + " extraction must be done on last language unit in XUPath")
-            match_counts = len( element.text )
+            match_counts = len( element.get_text() )
         elif BuiltinGrammar.WORD == self.count_unit:
             if container_idx != len( element.language_name_path ) - 1:
                 raise TypeError( BuiltinGrammar.WORD + " extraction must be done on last language unit in XUPath")
-            match_counts = len( element.text.split() )
+            match_counts = len( element.get_text().split() )
         elif self.count_unit in element.language_name_path:
             count_idx = element.language_name_path.index( self.count_unit )
             if count_idx < container_idx: